@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Check the .bam files in a directory for truncation, in place of running 'samtools quickcheck' on each file
+
+A .bam file passes if it starts with a BGZF block holding the BAM magic string, and ends with the BGZF end-of-file block;
+only the first and last few bytes of each file are read, using a pool of threads to spread the I/O
+
+Results are saved to a cache file keyed on the path, inode, size and mtime of each .bam file,
+so that only new or changed files are checked again, e.g. after a Nextflow '-resume'. The cache file is kept in the
+pipeline dir (the current dir by default) and holds the results for all the dirs that were checked; it is never written
+inside the dir being checked, so that it does not end up in the pipeline output
+
+Prints the number of .bam files that failed the check, or the path to each one with '--verbose'
+
+$ ./bam_check.py output/
+0
+$ ./bam_check.py work/ --verbose
+work/4f/3a2c1e.../Sample1.bam: missing EOF block
+"""
+import os
+import json
+import zlib
+import struct
+import argparse
+from stat import S_ISREG
+from concurrent.futures import ThreadPoolExecutor
+
+# the 28 byte empty BGZF block at the end of every complete .bam file
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+# a BGZF block starts with a gzip header with the FEXTRA flag set, and holds at most 64KB
+BGZF_HEADER = b'\x1f\x8b\x08\x04'
+BGZF_MAX_BLOCK_SIZE = 65536
+
+BAM_MAGIC = b'BAM\x01'
+
+CACHE_FILE = '.bam_check.cache.json'
+
+def find_bams(search_dir):
+    """
+    Find all the .bam files under a directory, without following symlinks, the same as 'find search_dir -type f -name "*.bam"'
+
+    Output
+    ------
+    list:
+        a list of tuples in the format of [ (path, os.stat_result), ... ]
+    """
+    bams = []
+    for root, dirs, files in os.walk(search_dir):
+        for name in files:
+            if not name.endswith('.bam'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.lstat(path)
+            except OSError:
+                continue
+            if S_ISREG(stat.st_mode):
+                bams.append((path, stat))
+    return(bams)
+
+def check_bam(path):
+    """
+    Check a .bam file for truncation
+
+    Output
+    ------
+    str|None:
+        a description of the problem with the file, or None if the file passed
+    """
+    try:
+        with open(path, 'rb') as fin:
+            block = fin.read(BGZF_MAX_BLOCK_SIZE)
+            if len(block) < 28:
+                return('file is too small')
+            fin.seek(-28, os.SEEK_END)
+            eof = fin.read(28)
+    except (OSError, IOError) as e:
+        return('could not be read ({error})'.format(error = e.strerror))
+
+    # the BGZF header holds the size of the block in its 'BC' extra subfield
+    if not block.startswith(BGZF_HEADER) or block[12:14] != b'BC':
+        return('not a BGZF file')
+    block_size = struct.unpack('<H', block[16:18])[0] + 1
+    try:
+        data = zlib.decompressobj(-15).decompress(block[18:block_size - 8])
+    except zlib.error:
+        return('first block could not be decompressed')
+    if not data.startswith(BAM_MAGIC):
+        return('missing BAM header')
+    if eof != BGZF_EOF:
+        return('missing EOF block')
+    return(None)
+
+def load_cache(cache_file):
+    """
+    Load the saved results of previous checks
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { path: { 'inode': int, 'size': int, 'mtime': int, 'error': str|None }, ... }
+    """
+    try:
+        with open(cache_file) as fin:
+            return(json.load(fin))
+    except (OSError, IOError, ValueError):
+        return({})
+
+def save_cache(cache_file, cache):
+    """
+    Save the results of the checks; fails silently if the cache file cannot be written
+    """
+    temp_file = '{path}.{pid}.tmp'.format(path = cache_file, pid = os.getpid())
+    try:
+        with open(temp_file, 'w') as fout:
+            json.dump(cache, fout)
+        os.rename(temp_file, cache_file)
+    except (OSError, IOError):
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+def is_inside(path, directory):
+    """
+    Check whether a path is inside a directory, after resolving symlinks
+    """
+    path = os.path.realpath(path)
+    directory = os.path.realpath(directory)
+    return(os.path.commonpath([ path, directory ]) == directory)
+
+def check_bams(search_dir, cache_file = None, threads = 16):
+    """
+    Check all the .bam files under a directory for truncation, skipping the files with a cached result
+
+    Parameters
+    ----------
+    search_dir: str
+        the directory to search for .bam files
+    cache_file: str|None
+        path to the cache file for the results, or None to not use a cache; it must not be inside search_dir.
+        The results are saved by absolute path, so one cache file can hold the results for several dirs
+    threads: int
+        the number of files to check at the same time
+
+    Output
+    ------
+    list:
+        a list of tuples in the format of [ (path, error), ... ] for the files that failed the check
+
+    Raises
+    ------
+    ValueError
+        if the cache file is inside search_dir
+    """
+    if cache_file != None and is_inside(cache_file, search_dir):
+        raise ValueError("the cache file must not be inside the dir being checked; {cache_file}".format(cache_file = cache_file))
+    bams = find_bams(search_dir)
+    cache = load_cache(cache_file) if cache_file != None else {}
+
+    results = {}
+    unchecked = []
+    for path, stat in bams:
+        identity = { 'inode': stat.st_ino, 'size': stat.st_size, 'mtime': stat.st_mtime_ns }
+        cached = cache.get(os.path.abspath(path))
+        if cached != None and all([ cached.get(key) == value for key, value in identity.items() ]):
+            results[path] = cached
+        else:
+            results[path] = identity
+            unchecked.append(path)
+
+    with ThreadPoolExecutor(max_workers = max(threads, 1)) as executor:
+        for path, error in zip(unchecked, executor.map(check_bam, unchecked)):
+            results[path]['error'] = error
+
+    if cache_file != None:
+        # keep the results for the other dirs, and drop the files of this dir that no longer exist;
+        # files that could not be read are checked again next time
+        search_path = os.path.abspath(search_dir)
+        cache = dict( (path, result) for path, result in cache.items() if not is_inside(path, search_path) )
+        cache.update( (os.path.abspath(path), result) for path, result in results.items() if not (result['error'] or '').startswith('could not be read') )
+        save_cache(cache_file, cache)
+
+    errors = [ (path, results[path]['error']) for path, stat in bams if results[path]['error'] != None ]
+    return(errors)
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = 'Check .bam files for truncation')
+    parser.add_argument('search_dir', help = 'The directory to search for .bam files')
+    parser.add_argument('--cache', default = CACHE_FILE, help = 'The file to cache the results in, outside of the search dir (default: {cache_file} in the current dir)'.format(cache_file = CACHE_FILE))
+    parser.add_argument('--no-cache', dest = 'no_cache', action = 'store_true', help = 'Check every file and do not save the results')
+    parser.add_argument('--threads', type = int, default = 16, help = 'Number of files to check at the same time')
+    parser.add_argument('--verbose', action = 'store_true', help = 'Print each file that failed the check instead of the number of files')
+    args = parser.parse_args()
+
+    cache_file = None
+    if not args.no_cache:
+        cache_file = args.cache
+    if not os.path.isdir(args.search_dir):
+        # 'find' on a missing dir finds no files
+        cache_file = None
+    try:
+        errors = check_bams(args.search_dir, cache_file, args.threads)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.verbose:
+        for path, error in errors:
+            print("{path}: {error}".format(path = path, error = error))
+    else:
+        print(len(errors))
+
+if __name__ == '__main__':
+    main()
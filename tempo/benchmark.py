@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the trace parsing and duration calculations on synthetic trace files of increasing size
+
+For each combination of --rows and --samples, a trace file is generated with synthetic_trace.py, then each benchmark is
+run in its own process so that it does not share memory or caches with the others. Reports the time, the throughput in rows
+per second, and the peak memory allocated by each benchmark, traced with tracemalloc (which includes the numpy arrays)
+in a second run so that the tracing does not slow down the timed run; for the message.py benchmarks it is the peak
+resident memory of the message.py process
+
+$ ./benchmark.py --rows 10000 100000 1000000 --samples 10 100 1000 5000 --output benchmark.tsv
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+import traceback
+import tracemalloc
+import subprocess
+import multiprocessing
+import numpy as np
+import calc_time
+import mem_convert
+import synthetic_trace
+
+def remove_trace_cache(trace_file):
+    """
+    Remove the trace cache file so that the trace file is read from scratch
+    """
+    if os.path.exists(trace_file + '.cache.npz'):
+        os.remove(trace_file + '.cache.npz')
+
+def bench_load_intervals(paths):
+    """
+    Read the intervals from the trace file, without the trace cache
+    """
+    remove_trace_cache(paths['trace'])
+    return(lambda: calc_time.load_intervals(paths['trace']))
+
+def bench_load_intervals_cached(paths):
+    """
+    Read the intervals from the trace cache
+    """
+    calc_time.load_trace(paths['trace'], calc_time.CACHE_COLUMNS)
+    return(lambda: calc_time.load_intervals(paths['trace']))
+
+def bench_calculate_interval_durations(paths):
+    """
+    Merge all the intervals of the trace file at once
+    """
+    interval_sets = calc_time.load_intervals(paths['trace'])
+    intervals = np.concatenate(list(interval_sets.values()))
+    return(lambda: calc_time.calculate_interval_durations(intervals))
+
+def bench_calc_time_samples_durations(paths):
+    """
+    Read the trace file and calculate the durations per sample, without the trace cache
+    """
+    remove_trace_cache(paths['trace'])
+    return(lambda: calc_time.calc_time_samples_durations(paths['trace'], paths['mapping']))
+
+def bench_parse_size(paths):
+    """
+    Parse the 'peak_rss' column one value at a time
+    """
+    values = calc_time.load_trace(paths['trace'], [ 'peak_rss' ])['peak_rss'].tolist()
+    def run():
+        for value in values:
+            try:
+                mem_convert.parse_size(value)
+            except ValueError:
+                pass
+    return(run)
+
+def bench_parse_column(paths):
+    """
+    Parse the 'peak_rss' column with the bulk parser
+    """
+    values = calc_time.load_trace(paths['trace'], [ 'peak_rss' ])['peak_rss'].tolist()
+    return(lambda: mem_convert.parse_column(values, 'size'))
+
+def bench_message(paths, message_type):
+    """
+    Run message.py from the start, including the Python start up and imports
+    """
+    remove_trace_cache(paths['trace'])
+    script = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'message.py')
+    env = dict(os.environ, CONFIG_JSON = paths['config'])
+    for name in [ 'ERROR_MESSAGE', 'TRACE_TIME_FILE', 'SAMPLES_TIME_FILE' ]:
+        env.pop(name, None)
+    def run():
+        process = subprocess.Popen([ sys.executable, script, message_type ], env = env, stdout = subprocess.DEVNULL)
+        pid, status, usage = os.wait4(process.pid, 0)
+        # the process was already waited for
+        process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        if process.returncode != 0:
+            raise RuntimeError("message.py {message_type} exited with code {code}".format(message_type = message_type, code = process.returncode))
+        # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+        return(usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024))
+    return(run)
+
+# the benchmarks, in the format of { name: function }, where each function takes the paths of the synthetic files,
+# does any setup that should not be timed, and returns the function to time
+BENCHMARKS = {
+'load_intervals': bench_load_intervals,
+'load_intervals (cached)': bench_load_intervals_cached,
+'calculate_interval_durations': bench_calculate_interval_durations,
+'calc_time_samples_durations': bench_calc_time_samples_durations,
+'mem_convert.parse_size': bench_parse_size,
+'mem_convert.parse_column': bench_parse_column,
+'message.py started': lambda paths: bench_message(paths, 'started'),
+'message.py success': lambda paths: bench_message(paths, 'success')
+}
+
+def run_benchmark(name, paths, results):
+    """
+    Run a single benchmark and put its results in the queue, or the error if it failed; meant to be run in its own process
+    """
+    try:
+        func = BENCHMARKS[name](paths)
+        start = time.time()
+        child_peak = func()
+        seconds = time.time() - start
+        # the message.py benchmarks run in a child process and return its peak memory
+        if isinstance(child_peak, int):
+            memory = child_peak
+        else:
+            # the setup is run again, since e.g. the first run may have saved the trace cache
+            func = BENCHMARKS[name](paths)
+            tracemalloc.start()
+            try:
+                func()
+                memory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        results.put((seconds, memory, None))
+    except Exception:
+        results.put((None, None, traceback.format_exc()))
+
+def benchmark(name, paths):
+    """
+    Run a benchmark in a new process
+
+    Output
+    ------
+    (seconds, memory)
+
+    seconds: float
+        the time it took to run the benchmark
+    memory: int
+        the peak memory in bytes allocated by the benchmark
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target = run_benchmark, args = (name, paths, results))
+    process.start()
+    result = None
+    while result == None:
+        try:
+            result = results.get(timeout = 1)
+        except queue.Empty:
+            if process.exitcode == None:
+                continue
+            # the process ended; anything it put in the queue has already been written
+            try:
+                result = results.get(timeout = 1)
+            except queue.Empty:
+                raise RuntimeError("benchmark {name} exited with code {code} without a result".format(name = name, code = process.exitcode))
+    process.join()
+    seconds, memory, error = result
+    if error != None:
+        raise RuntimeError("benchmark {name} failed:\n{error}".format(name = name, error = error))
+    return(seconds, memory)
+
+def make_files(data_dir, num_rows, num_samples, resumes, seed):
+    """
+    Generate the synthetic trace, mapping, pairing and config files for a benchmark, or reuse them if they already exist
+    """
+    output_dir = os.path.join(data_dir, 'rows{num_rows}_samples{num_samples}'.format(num_rows = num_rows, num_samples = num_samples))
+    paths = {
+    'trace': os.path.join(output_dir, 'trace.txt'),
+    'mapping': os.path.join(output_dir, 'mapping.tsv'),
+    'pairing': os.path.join(output_dir, 'pairing.tsv'),
+    'config': os.path.join(output_dir, 'config.json')
+    }
+    if not all([ os.path.exists(path) for path in paths.values() ]):
+        trace, sample_ids, pairs = synthetic_trace.make_trace(num_rows, num_samples, resumes = resumes, seed = seed)
+        synthetic_trace.write_files(output_dir, trace, sample_ids, pairs)
+        config = { 'nextflow_trace': paths['trace'], 'mapping_tsv': paths['mapping'], 'pairing_tsv': paths['pairing'], 'pipeline_dir': output_dir }
+        with open(paths['config'], 'w') as fout:
+            json.dump(config, fout, indent = 4)
+    return(paths)
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = 'Benchmark the trace parsing and duration calculations on synthetic trace files')
+    parser.add_argument('--rows', type = int, nargs = '+', default = [ 10000, 100000, 1000000 ], help = 'Numbers of rows in the trace files')
+    parser.add_argument('--samples', type = int, nargs = '+', default = [ 10, 100, 1000, 5000 ], help = 'Numbers of samples in the mapping files')
+    parser.add_argument('--resumes', type = int, default = 1, help = 'Number of times the pipeline was resumed in the trace files')
+    parser.add_argument('--seed', type = int, default = 1, help = 'Seed for the random numbers')
+    parser.add_argument('--benchmarks', nargs = '+', default = list(BENCHMARKS.keys()), choices = list(BENCHMARKS.keys()), metavar = 'BENCHMARK', help = 'Benchmarks to run (default: all)')
+    parser.add_argument('--data-dir', dest = 'data_dir', default = None, help = 'Dir to keep the synthetic files in between runs (default: a temporary dir)')
+    parser.add_argument('--output', default = None, help = 'File to write the results to in TSV format')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir if args.data_dir != None else tempfile.mkdtemp(prefix = 'tempo-benchmark.')
+    lines = [ '\t'.join([ 'benchmark', 'rows', 'samples', 'seconds', 'rows_per_second', 'peak_memory_mb' ]) ]
+    print(lines[0])
+    try:
+        for num_rows in args.rows:
+            for num_samples in args.samples:
+                paths = make_files(data_dir, num_rows, num_samples, args.resumes, args.seed)
+                for name in args.benchmarks:
+                    seconds, memory = benchmark(name, paths)
+                    line = '\t'.join([ name, str(num_rows), str(num_samples), '{:.3f}'.format(seconds),
+                        '{:.0f}'.format(num_rows / seconds) if seconds > 0 else '-', '{:.3f}'.format(memory / 1000000.0) ])
+                    print(line)
+                    sys.stdout.flush()
+                    lines.append(line)
+    finally:
+        if args.data_dir == None:
+            shutil.rmtree(data_dir)
+    if args.output != None:
+        calc_time.write_output(args.output, '\n'.join(lines) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,74 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
 Calculate total execution time from all contiguous tasks in the timeline from Nextflow trace.txt
-requires human readable times
+accepts human readable times, or raw epoch millisecond times from traces written with 'trace.raw = true'
 
 $ ./calc_time.py trace trace.txt
 
-NOTE: trace.txt might not contain the failed tasks from previous runs, causing differences in total time reported
+NOTE: trace.txt might not contain the failed tasks from previous runs, causing differences in total time reported;
+use the 'runs' sub-command to combine the trace.txt files from all the runs in the log dir
+
+$ ./calc_time.py runs logs
 """
+import os
 import sys
+import re
+import time
+import calendar
+import json
+import glob
+import multiprocessing
+import bisect
 import csv
+import operator
+import math
 from datetime import datetime, timedelta
 import argparse
+import numpy as np
+import trace_cache
+import mem_convert
+import profiling
+
+# runs of alphanumeric characters in a task tag; sample IDs are matched against whole runs of these
+TAG_TOKEN_PATTERN = re.compile(r'[A-Za-z0-9]+')
+
+# value used in the int64 timestamp arrays for '-' and other unparseable timestamps
+MISSING_TIMESTAMP = mem_convert.MISSING_TIMESTAMP
+
+# the columns needed from the trace file to calculate durations
+INTERVAL_COLUMNS = ['status', 'submit', 'complete']
+
+# the tag that Nextflow adds to the process name in the 'name' column, e.g. 'DoFacets (Sample1__Sample9)'
+PROCESS_TAG_PATTERN = re.compile(r' \(.*\)$')
+
+# the memory columns from the trace file
+MEMORY_COLUMNS = ['memory', 'peak_rss', 'peak_vmem', 'rss']
+
+# exit codes of tasks killed for using too much memory; LSF TERM_MEMLIMIT, and SIGKILL from the kernel OOM killer
+MEMORY_EXIT_CODES = ['130', '137']
+
+# the columns from the trace file used for the concurrency of tasks over time
+CONCURRENCY_COLUMNS = ['duration', 'realtime', 'cpus', 'memory']
+
+# the columns from the trace file used for the compute cost of the tasks
+COST_COLUMNS = ['cpus', 'realtime', '%cpu', 'peak_rss']
+
+# the kinds of work of a tumor normal pair; see calculate_pair_durations()
+PAIR_WORK = ['pair', 'sample', 'all']
+
+# the columns from the trace file used to compare the tasks of two runs, and the metrics compared; see calculate_trace_diff()
+DIFF_COLUMNS = ['status', 'tag', 'duration', 'realtime', 'peak_rss', '%cpu']
+DIFF_METRICS = ['realtime', 'queue_wait', 'peak_rss', '%cpu']
+
+# the name used for the time between the tasks on a critical path
+CRITICAL_PATH_IDLE = '(idle)'
+
+# the columns saved in the trace cache, so that all the entry points can load from it
+CACHE_COLUMNS = ['status', 'tag', 'submit', 'complete']
+
+# number of bytes of the trace file to read and convert to arrays at a time
+TRACE_BLOCK_SIZE = 16 * 1024 * 1024
 
 def parse_timestamp(timestamp_str):
     """
@@ -19,6 +76,35 @@ def parse_timestamp(timestamp_str):
     """
     return(datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S.%f'))
 
+def parse_timestamps(timestamps):
+    """
+    Convert a sequence of trace file timestamps into an int64 array of epoch microseconds,
+    with MISSING_TIMESTAMP for values that could not be parsed; see mem_convert.parse_timestamps()
+    """
+    return(mem_convert.parse_timestamps(timestamps))
+
+def microseconds_to_timedelta(microseconds):
+    """
+    Convert a number of microseconds into a timedelta object
+    """
+    return(timedelta(microseconds = int(microseconds)))
+
+def microseconds_to_datetime(microseconds):
+    """
+    Convert epoch microseconds from parse_timestamps() back into a datetime object
+
+    The timestamps in the trace file are local times without a time zone, and parse_timestamps() counts them as if they were UTC,
+    so the result is a naive datetime with the same wall clock time as in the trace file
+    """
+    return(datetime(1970, 1, 1) + timedelta(microseconds = int(microseconds)))
+
+def local_timestamp(seconds):
+    """
+    Convert seconds since the epoch, e.g. from time.time(), to the scale of parse_timestamps() divided by one million,
+    that is the local wall clock time counted as if it were UTC, so that the two can be subtracted
+    """
+    return(calendar.timegm(time.localtime(seconds)) + seconds % 1)
+
 def timedelta_to_string(timedelta, seconds = False):
     """
     Convert a timedelta object to string, optionally convert to seconds
@@ -28,6 +114,267 @@ def timedelta_to_string(timedelta, seconds = False):
     if seconds == True:
         return(str(timedelta.total_seconds()))
 
+def factorize(values):
+    """
+    Encode a sequence of values as integer codes, in order of first appearance
+
+    Parameters
+    ----------
+    values: list
+        a list of hashable values
+
+    Output
+    ------
+    (codes, uniques)
+
+    codes: numpy.ndarray
+        an int64 array with the index of each value in 'uniques'
+    uniques: list
+        the unique values, in the order they first appear in 'values'
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'iu':
+        # integer arrays are encoded without a Python loop
+        uniques, first_rows, inverse = np.unique(values, return_index = True, return_inverse = True)
+        order = np.argsort(first_rows, kind = 'stable')
+        ranks = np.empty(len(order), dtype = np.int64)
+        ranks[order] = np.arange(len(order))
+        return(ranks[inverse.reshape(-1)], uniques[order].tolist())
+    lookup = {}
+    codes = np.fromiter(( lookup.setdefault(value, len(lookup)) for value in values ), dtype = np.int64, count = len(values))
+    uniques = [ None ] * len(lookup)
+    for value, code in lookup.items():
+        uniques[code] = value
+    return(codes, uniques)
+
+def trace_rows(trace):
+    """
+    Get the number of rows in the columns of a trace file loaded with load_trace()
+    """
+    for values in trace.values():
+        return(len(values))
+    return(0)
+
+def read_trace_header(trace_file):
+    """
+    Get the column names from the header of a trace file
+    """
+    with open(trace_file, 'rb') as fin:
+        line = fin.readline()
+    # the header is not there yet if the file was only just created
+    if not line.endswith(b'\n'):
+        return([])
+    return(line.decode('utf-8').rstrip('\n').split('\t'))
+
+@profiling.profiled(rows = lambda result: trace_rows(result[0]))
+def read_trace(trace_file, columns, offset = None, stop = None):
+    """
+    Read columns from the rows of a trace file into arrays
+
+    Parameters
+    ----------
+    trace_file: str
+        path to the Nextflow trace.txt file
+    columns: list
+        the names of the columns to load
+    offset: int|None
+        the byte offset to start reading rows from; defaults to the first row after the header
+    stop: int|None
+        the byte offset to stop reading at; defaults to the end of the file
+
+    Output
+    ------
+    (trace, offset)
+
+    trace: dict
+        a dictionary in the format of { column: numpy.ndarray, ... }, where 'submit' and 'complete' are int64 arrays
+        of epoch microseconds (see parse_timestamps) and all other columns are arrays of strings
+    offset: int
+        the byte offset just past the last complete row that was read
+    """
+    header = read_trace_header(trace_file)
+    for column in columns:
+        if column not in header:
+            raise KeyError(column)
+    indexes = [ header.index(column) for column in columns ]
+    num_fields = max(indexes) + 1
+    get_values = operator.itemgetter(*indexes + [ num_fields - 1 ])
+    chunks = dict( (column, []) for column in columns )
+
+    with open(trace_file, 'rb') as fin:
+        if offset == None:
+            fin.readline()
+        else:
+            fin.seek(offset)
+        offset = fin.tell()
+        if stop == None:
+            stop = os.fstat(fin.fileno()).st_size
+
+        # read the rows in blocks so that only one block of strings is held in memory at a time;
+        # a partially written last line is left for the next read
+        remainder = b''
+        while offset < stop:
+            block = fin.read(min(TRACE_BLOCK_SIZE, stop - fin.tell()))
+            if len(block) == 0:
+                break
+            block = remainder + block
+            end = block.rfind(b'\n') + 1
+            remainder = block[end:]
+            offset += end
+            lines = block[:end].decode('utf-8').split('\n')[:-1]
+
+            # Nextflow does not quote the fields, so only split each line as far as the last column needed
+            split_rows = ( line.split('\t', num_fields) for line in lines )
+            rows = [ get_values(row) for row in split_rows if len(row) >= num_fields ]
+            if len(rows) == 0:
+                continue
+            for column, column_values in zip(columns, zip(*rows)):
+                if column in ('submit', 'complete'):
+                    chunks[column].append(parse_timestamps(column_values))
+                else:
+                    # keep one copy of each repeated string value, e.g. status and tag
+                    array = np.empty(len(column_values), dtype = object)
+                    array[:] = list(map(sys.intern, column_values))
+                    chunks[column].append(array)
+
+    trace = {}
+    for column in columns:
+        dtype = np.int64 if column in ('submit', 'complete') else object
+        trace[column] = np.concatenate([ np.zeros(0, dtype = dtype) ] + chunks[column])
+    return(trace, offset)
+
+@profiling.profiled(rows = lambda trace: trace_rows(trace))
+def load_trace(trace_file, columns = None, cache = True):
+    """
+    Loads columns from a trace file into arrays
+
+    By default the columns are loaded from the trace file's sidecar cache (see trace_cache.py) when it is up to date,
+    only the new rows are read when the trace file has grown since the cache was saved,
+    and the cache is saved again whenever the trace file had to be read
+
+    Parameters
+    ----------
+    trace_file: str
+        path to the Nextflow trace.txt file
+    columns: list|None
+        the names of the columns to load; defaults to INTERVAL_COLUMNS
+    cache: bool
+        whether or not to use the cache
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { column: numpy.ndarray, ... }, where 'submit' and 'complete' are int64 arrays
+        of epoch microseconds (see parse_timestamps) and all other columns are arrays of strings
+    """
+    if columns == None:
+        columns = INTERVAL_COLUMNS
+    if cache == False:
+        trace, offset = read_trace(trace_file, columns)
+        return(trace)
+
+    identity = trace_cache.file_identity(trace_file)
+    metadata, cached_trace = trace_cache.load_cache(trace_file)
+    state = trace_cache.check_cache(trace_file, metadata)
+
+    if state != 'stale' and all([ column in cached_trace for column in columns ]):
+        if state == 'current':
+            return(dict( (column, cached_trace[column]) for column in columns ))
+        # add the rows that were appended to the trace file since the cache was saved
+        new_trace, offset = read_trace(trace_file, metadata['columns'], offset = metadata['offset'], stop = identity['size'])
+        trace = dict( (column, np.concatenate([ cached_trace[column], new_trace[column] ])) for column in metadata['columns'] )
+        trace_cache.save_cache(trace_file, trace, metadata['header'], offset, identity)
+        return(dict( (column, trace[column]) for column in columns ))
+
+    # read the whole trace file, along with the columns other entry points need so that they can use the cache as well
+    header = read_trace_header(trace_file)
+    load_columns = list(columns)
+    for column in CACHE_COLUMNS + list(cached_trace.keys()):
+        if column in header and column not in load_columns:
+            load_columns.append(column)
+    trace, offset = read_trace(trace_file, load_columns, stop = identity['size'])
+    trace_cache.save_cache(trace_file, trace, header, offset, identity)
+    return(dict( (column, trace[column]) for column in columns ))
+
+def build_sample_index(sample_ids):
+    """
+    Build a token index of sample IDs to use for matching sample IDs against task tags
+
+    Parameters
+    ----------
+    sample_ids: list
+        a list of sample ID's
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { 'index': set([ sample_id, ... ]), 'max_tokens': int, 'cache': {} }
+        where 'max_tokens' is the largest number of tag tokens spanned by a single sample ID
+    """
+    max_tokens = 1
+    for sample_id in sample_ids:
+        num_tokens = len(TAG_TOKEN_PATTERN.findall(sample_id))
+        if num_tokens > max_tokens:
+            max_tokens = num_tokens
+    sample_index = {
+    'index': set(sample_ids),
+    'max_tokens': max_tokens,
+    'cache': {} # { tag: set([ sample_id, ... ]), ... }
+    }
+    return(sample_index)
+
+def tag_sample_ids(tag, sample_index):
+    """
+    Find all the sample IDs from the index that are present as whole tokens in a task tag,
+    so that 'Sample1' matches 'Sample1__Sample9' but not 'Sample10'
+
+    Parameters
+    ----------
+    tag: str
+        the 'tag' value from a row in the trace file
+    sample_index: dict
+        the index returned by build_sample_index()
+
+    Output
+    ------
+    set:
+        a set of the sample ID's found in the tag
+    """
+    cache = sample_index['cache']
+    if tag in cache:
+        return(cache[tag])
+
+    index = sample_index['index']
+    max_tokens = sample_index['max_tokens']
+    spans = [ match.span() for match in TAG_TOKEN_PATTERN.finditer(tag) ]
+
+    # check every contiguous run of tokens in the tag against the index
+    sample_ids = set()
+    for i in range(len(spans)):
+        start = spans[i][0]
+        for j in range(i, min(i + max_tokens, len(spans))):
+            candidate = tag[start:spans[j][1]]
+            if candidate in index:
+                sample_ids.add(candidate)
+
+    cache[tag] = sample_ids
+    return(sample_ids)
+
+def unique_intervals(submit, complete):
+    """
+    Get the unique (submit, complete) intervals from arrays of submit and complete times
+
+    Output
+    ------
+    numpy.ndarray
+        an int64 array of shape (N, 2), sorted by submit then complete
+    """
+    intervals = np.empty((len(submit), 2), dtype = np.int64)
+    intervals[:, 0] = submit
+    intervals[:, 1] = complete
+    if len(intervals) == 0:
+        return(intervals)
+    return(np.unique(intervals, axis = 0))
+
 def load_intervals(trace_file, sample_ids = None):
     """
     Loads all the intervals from a trace file
@@ -43,98 +390,146 @@ def load_intervals(trace_file, sample_ids = None):
     Output
     ------
     dict:
-        a dictionary in the format of { status: set([ (submit, complete), ... ]), ... }, where 'submit' and 'complete' are datetime() objects
+        a dictionary in the format of { status: numpy.ndarray([ [submit, complete], ... ]), ... }, where the arrays hold the
+        unique intervals and 'submit' and 'complete' are epoch microseconds
     """
     if sample_ids == None:
         sample_ids = []
-    interval_sets = {}
+    columns = INTERVAL_COLUMNS
+    if len(sample_ids) > 0:
+        columns = INTERVAL_COLUMNS + ['tag']
+    trace = load_trace(trace_file, columns)
+    return(get_intervals(trace, sample_ids))
 
-    # load all the unqiue intervals from the trace file
-    with open(trace_file) as fin:
-        reader = csv.DictReader(fin, delimiter = '\t')
-        for row in reader:
-            status = row['status']
-
-            # initialize the status if its not there already
-            if status not in interval_sets:
-                interval_sets[status] = set()
-
-            # if sample_ids are passed, only add intervals that match the sample_id
-            # if not sample_ids are passed, return all intervals
-            if len(sample_ids) == 0:
-                try:
-                    # there might be some '-' values that raise an Exception ValueError
-                    submit = parse_timestamp(row['submit'])
-                    complete = parse_timestamp(row['complete'])
-                    interval_sets[status].add((submit, complete))
-                except ValueError:
-                    pass
-            else:
-                # check that all sample_ids are in the tag
-                tag = row['tag']
-                if all([ sample_id in tag for sample_id in sample_ids ]):
-                    try:
-                        # there might be some '-' values that raise an Exception ValueError
-                        submit = parse_timestamp(row['submit'])
-                        complete = parse_timestamp(row['complete'])
-                        interval_sets[status].add((submit, complete))
-                    except ValueError:
-                        pass
+@profiling.profiled()
+def get_intervals(trace, sample_ids = None):
+    """
+    Get all the intervals per status from the columns of a trace file loaded with load_trace()
+    See load_intervals()
+    """
+    if sample_ids == None:
+        sample_ids = []
 
+    # there might be some '-' values that could not be parsed
+    keep = (trace['submit'] != MISSING_TIMESTAMP) & (trace['complete'] != MISSING_TIMESTAMP)
+
+    # if sample_ids are passed, only add intervals where all the sample_ids are in the tag
+    # if not sample_ids are passed, return all intervals
+    if len(sample_ids) > 0:
+        sample_index = build_sample_index(sample_ids)
+        tag_codes, tags = factorize(trace['tag'])
+        tag_matches = np.array([ all([ sample_id in tag_sample_ids(tag, sample_index) for sample_id in sample_ids ]) for tag in tags ], dtype = bool)
+        keep &= tag_matches[tag_codes]
+
+    # every status in the trace file gets an entry, in the order they first appear
+    status_codes, statuses = factorize(trace['status'])
+    interval_sets = {}
+    for code, status in enumerate(statuses):
+        rows = keep & (status_codes == code)
+        interval_sets[status] = unique_intervals(trace['submit'][rows], trace['complete'][rows])
     return(interval_sets)
 
+def load_sample_intervals(trace_file, sample_ids):
+    """
+    Loads the intervals for each sample from a trace file in a single pass over the file
+    Each unique tag is matched against all sample ID's at once and its intervals are added to every matching sample
+
+    Parameters
+    ----------
+    trace_file: str
+        path to the Nextflow trace.txt file
+    sample_ids: list
+        a list of sample ID's to load intervals for
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { sample_id: { status: numpy.ndarray([ [submit, complete], ... ]), ... }, ... }
+        where every sample has an entry for every status in the trace file
+    """
+    trace = load_trace(trace_file, INTERVAL_COLUMNS + ['tag'])
+    return(get_sample_intervals(trace, sample_ids))
+
+@profiling.profiled()
+def get_sample_intervals(trace, sample_ids):
+    """
+    Get the intervals per status for each sample from the columns of a trace file loaded with load_trace()
+    See load_sample_intervals()
+    """
+    sample_index = build_sample_index(sample_ids)
+    sample_codes = dict( (sample_id, code) for code, sample_id in enumerate(sample_ids) )
+    status_codes, statuses = factorize(trace['status'])
+    tag_codes, tags = factorize(trace['tag'])
+
+    # expand each row into one (row, sample) pair per sample found in its tag
+    tag_samples = [ [ sample_codes[sample_id] for sample_id in tag_sample_ids(tag, sample_index) ] for tag in tags ]
+    tag_num_samples = np.array([ len(codes) for codes in tag_samples ], dtype = np.int64)
+    valid = (trace['submit'] != MISSING_TIMESTAMP) & (trace['complete'] != MISSING_TIMESTAMP)
+    rows = np.flatnonzero(valid & (tag_num_samples[tag_codes] > 0))
+    row_num_samples = tag_num_samples[tag_codes[rows]]
+    row_samples = np.concatenate([ np.zeros(0, dtype = np.int64) ] + [ np.array(tag_samples[code], dtype = np.int64) for code in tag_codes[rows] ])
+    rows = np.repeat(rows, row_num_samples)
+
+    # split the pairs into groups per sample per status
+    num_statuses = max(len(statuses), 1)
+    group_codes = row_samples * num_statuses + status_codes[rows]
+    order = np.argsort(group_codes, kind = 'stable')
+    rows = rows[order]
+    group_codes = group_codes[order]
+    boundaries = np.flatnonzero(np.diff(group_codes)) + 1
+    starts = np.concatenate(([0], boundaries)) if len(rows) > 0 else np.zeros(0, dtype = np.int64)
+    stops = np.concatenate((boundaries, [len(rows)])) if len(rows) > 0 else np.zeros(0, dtype = np.int64)
+
+    empty = np.zeros((0, 2), dtype = np.int64)
+    sample_interval_sets = {}
+    for sample_id in sample_ids:
+        sample_interval_sets[sample_id] = dict( (status, empty) for status in statuses )
+    for start, stop in zip(starts, stops):
+        sample_id = sample_ids[group_codes[start] // num_statuses]
+        status = statuses[group_codes[start] % num_statuses]
+        group_rows = rows[start:stop]
+        sample_interval_sets[sample_id][status] = unique_intervals(trace['submit'][group_rows], trace['complete'][group_rows])
+    return(sample_interval_sets)
+
+@profiling.profiled()
 def calculate_interval_durations(intervals):
     """
     Calculates the duration for all contiguous time intervals
 
     Parameters
     ----------
-    intervals: list
-        a list of tuples/lists in the format of [ [ start, stop ], ... ], where 'start' and 'stop' are datetime() objects
+    intervals: numpy.ndarray|list
+        an array or list of tuples/lists in the format of [ [ start, stop ], ... ], where 'start' and 'stop' are epoch microseconds
 
     Output
     ------
-    list
-        a list of datetime.timedelta() objects
-    """
-    # sort all the intervals by  the first value
-    sorted_intervals = sorted(list(intervals), key=lambda x: x[0])
-
-    # find the overlapping intervals; https://www.geeksforgeeks.org/merging-intervals/
-    merged_intervals = []
-    start_date = datetime(1969, 12, 01, 23, 59, 59, 000000)  # a long time ago
-    current_submit = start_date
-    current_complete = start_date
-
-    # collapse to find the longest contiguous time intervals between all overlapping intervals
-    for i in range(len(sorted_intervals)):
-        interval = sorted_intervals[i]
-        submit = interval[0]
-        complete = interval[1]
-        if submit > current_complete:
-            if i != 0:
-                merged_intervals.append([current_submit, current_complete])
-            current_complete = complete
-            current_submit = submit
-        else:
-            if complete >= current_complete:
-                current_complete = complete
+    numpy.ndarray
+        an int64 array of durations in microseconds
+    """
+    intervals = np.asarray(intervals, dtype = np.int64).reshape(-1, 2)
+    if len(intervals) == 0:
+        return(np.zeros(0, dtype = np.int64))
+
+    # sort all the intervals by the first value
+    order = np.argsort(intervals[:, 0], kind = 'stable')
+    submit = intervals[order, 0]
+    complete = intervals[order, 1]
 
-        # if current_complete != start_date and [current_submit, current_complete] not in merged_intervals:
-        #         merged_intervals.append([current_submit, current_complete])
-        #  NOTE: Why is this included in the original algorithm?? It adds intervals to the list that shouldnt be there...
+    # collapse to find the longest contiguous time intervals between all overlapping intervals;
+    # a new contiguous interval starts wherever a submit comes after the latest complete of all the intervals before it
+    latest_complete = np.maximum.accumulate(complete)
+    starts = np.concatenate(([0], np.flatnonzero(submit[1:] > latest_complete[:-1]) + 1))
+    stops = np.concatenate((starts[1:], [len(submit)])) - 1
 
-    # calucalute the duration of all remaining contiguous intervals
-    durations = []
-    for submit, complete in merged_intervals:
-        duration = complete - submit
-        durations.append(duration)
-    return(durations)
+    # calculate the duration of all the contiguous intervals
+    # NOTE: the last contiguous interval is left out, the same as the original merging loop which only
+    # recorded an interval once the next one was started
+    durations = latest_complete[stops] - submit[starts]
+    return(durations[:-1])
 
 def calculate_trace_duration(trace_file, seconds = False):
     """
     Calculate total execution time from all contiguous tasks in the timeline from Nextflow trace.txt
-    requires human readable times
 
     Parameters
     ----------
@@ -147,64 +542,114 @@ def calculate_trace_duration(trace_file, seconds = False):
     ------
     (total_durations, message)
 
-    total_durations: datetime.timedelta
-        the total duration of the pipeline tasks across all runs
+    total_durations: dict
+        the total datetime.timedelta duration of the pipeline tasks across all runs, per status
     message: str
         pretty printed messages about the duration metrics
     """
     # get all the intervals per status
     interval_sets = load_intervals(trace_file)
+    total_durations, num_intervals, total_walltime = calculate_status_durations(interval_sets)
+    message = format_trace_durations(total_durations, num_intervals, total_walltime, seconds)
+    return(total_durations, message)
 
-    # get all the durations per status
-    duration_sets = {}
-    for status, intervals in interval_sets.items():
-        durations = calculate_interval_durations(intervals)
-        duration_sets[status] = durations
+@profiling.profiled()
+def calculate_status_durations(interval_sets):
+    """
+    Calculate the duration metrics from the intervals per status
+
+    Parameters
+    ----------
+    interval_sets: dict
+        the intervals per status returned by load_intervals()
+
+    Output
+    ------
+    (total_durations, num_intervals, total_walltime)
 
+    total_durations: dict
+        the total datetime.timedelta duration per status
+    num_intervals: dict
+        the number of unique intervals per status
+    total_walltime: datetime.timedelta
+        the time from the start to the end of the non-cached tasks
+    """
     # get the total duration per status
     total_durations = {}
-    for status, durations in duration_sets.items():
-        total_duration = sum(durations, timedelta())
-        total_durations[status] = total_duration
+    for status, intervals in interval_sets.items():
+        durations = calculate_interval_durations(intervals)
+        total_durations[status] = microseconds_to_timedelta(durations.sum())
 
     # get the total duration of all non-cached tasks, start to finish of pipeline
     total_walltime = timedelta()
     all_statuses = [ k for k in  interval_sets.keys() if k != 'CACHED' ]
-    all_intervals = sorted([ interval for status in all_statuses for interval in interval_sets[status] ])
+    all_intervals = np.concatenate([ np.zeros((0, 2), dtype = np.int64) ] + [ interval_sets[status] for status in all_statuses ])
     if len(all_intervals) > 1:
-        start = all_intervals[0][0]
-        end = all_intervals[-1][-1]
-        total_walltime = end - start
+        # the start of the first interval and the end of the last interval, sorted by submit then complete
+        last = np.lexsort((all_intervals[:, 1], all_intervals[:, 0]))[-1]
+        start = all_intervals[:, 0].min()
+        end = all_intervals[last, 1]
+        total_walltime = microseconds_to_timedelta(end - start)
+
+    num_intervals = dict( (status, len(intervals)) for status, intervals in interval_sets.items() )
+    return(total_durations, num_intervals, total_walltime)
 
+@profiling.profiled()
+def format_trace_durations(total_durations, num_intervals, total_walltime, seconds = False):
+    """
+    Create a pretty printed message about the duration metrics of a trace file
+
+    Parameters
+    ----------
+    total_durations: dict
+        the total datetime.timedelta duration per status
+    num_intervals: dict
+        the number of unique intervals per status
+    total_walltime: datetime.timedelta
+        the time from the start to the end of the non-cached tasks
+    seconds: bool
+        whether or not to report output times in seconds
+    """
     # create a message to use for printing
     # list the time for each status type, then the total time
     message = ""
     for status, total_duration in total_durations.items():
         message += """{status}: {total_duration} ({num_intervals} intervals)
-""".format(status = status, total_duration = timedelta_to_string(total_duration, seconds), num_intervals = len(interval_sets[status]))
+""".format(status = status, total_duration = timedelta_to_string(total_duration, seconds), num_intervals = num_intervals[status])
 
     # add the total duration of all contiguous intervals
     total_duration_sum = sum([ total_duration for status, total_duration in total_durations.items() ], timedelta())
     message += "Total (all intervals): {total_duration} ({num_intervals} intervals)\n".format(
     total_duration = timedelta_to_string(total_duration_sum, seconds),
-    num_intervals = len([ interval for status, intervals in interval_sets.items() for interval in intervals ])
+    num_intervals = sum(num_intervals.values())
     )
 
     # add the total for the current pipeline
     message += "Total (current pipeline): {total_walltime}".format(total_walltime = timedelta_to_string(total_walltime, seconds))
+    return(message)
 
-    return(total_durations, message)
+@profiling.profiled(rows = len)
+def load_mapping(mapping_file):
+    """
+    Load all the rows of the Tempo mapping file
+
+    Output
+    ------
+    list
+        a list of dicts in the format of [ { 'SAMPLE': str, 'TARGET': str, 'FASTQ_PE1': str, 'FASTQ_PE2': str }, ... ]
+    """
+    with open(mapping_file) as fin:
+        reader = csv.DictReader(fin, delimiter = '\t')
+        return(list(reader))
 
 def load_samples(mapping_file):
     """
     Load all the sample IDs from the Tempo mapping file
     """
     samples = set()
-    with open(mapping_file) as fin:
-        reader = csv.DictReader(fin, delimiter = '\t')
-        for row in reader:
-            sample = row['SAMPLE']
-            samples.add(sample)
+    for row in load_mapping(mapping_file):
+        sample = row['SAMPLE']
+        samples.add(sample)
     return(list(samples))
 
 def calc_time_trace(**kwargs):
@@ -229,15 +674,32 @@ def calc_time_samples_durations(trace_file, mapping_file, seconds = False):
     # get the sample_ids from the mapping file
     samples = load_samples(mapping_file)
 
-    # initialize dict to hold the per-sample intervals per status
-    # { sample_id: {'CACHED': set([...]), ... }, ...  }
-    sample_interval_sets = {}
-    for sample in samples:
-        # this is very inefficient since we are parsing the entire trace file repeatedly;
-        # TODO: come up with a way to optimize this
-        interval_sets = load_intervals(trace_file = trace_file, sample_ids = [sample])
-        sample_interval_sets[sample] = interval_sets
+    # get the per-sample intervals per status from a single pass over the trace file
+    # { sample_id: {'CACHED': array([...]), ... }, ...  }
+    sample_interval_sets = load_sample_intervals(trace_file = trace_file, sample_ids = samples)
+    total_sample_status_durations, total_sample_durations = calculate_sample_durations(sample_interval_sets)
+    message = format_sample_durations(total_sample_durations, seconds)
+    return(total_sample_durations, message)
+
+@profiling.profiled()
+def calculate_sample_durations(sample_interval_sets):
+    """
+    Calculate the total durations per sample from the intervals per status for each sample
+
+    Parameters
+    ----------
+    sample_interval_sets: dict
+        the intervals per status for each sample returned by load_sample_intervals()
+
+    Output
+    ------
+    (total_sample_status_durations, total_sample_durations)
 
+    total_sample_status_durations: dict
+        the total datetime.timedelta duration per status per sample, in the format of { sample: { status: timedelta, ... }, ... }
+    total_sample_durations: list
+        a list of tuples in the format of [ (sample, datetime.timedelta), ... ] sorted by longest duration first
+    """
     # calculate the duration for each sample
     sample_duration_sets = {}
     for sample, interval_sets in sample_interval_sets.items():
@@ -248,13 +710,12 @@ def calc_time_samples_durations(trace_file, mapping_file, seconds = False):
             sample_duration_sets[sample][status] = durations
 
     # get the total duration per sample per status
-    # total_sample_durations = {}
     total_sample_status_durations = {}
     for sample, duration_sets in sample_duration_sets.items():
         for status, durations in duration_sets.items():
             if sample not in total_sample_status_durations:
                 total_sample_status_durations[sample] = {}
-            total_duration = sum(durations, timedelta())
+            total_duration = microseconds_to_timedelta(durations.sum())
             total_sample_status_durations[sample][status] = total_duration
 
     # get the total duration per sample
@@ -267,15 +728,27 @@ def calc_time_samples_durations(trace_file, mapping_file, seconds = False):
 
     # sort all the durations by length of time
     total_sample_durations = sorted(total_sample_durations, reverse= True, key=lambda x: x[1])
+    return(total_sample_status_durations, total_sample_durations)
+
+@profiling.profiled()
+def format_sample_durations(total_sample_durations, seconds = False):
+    """
+    Create a pretty printed message about the total duration per sample
 
-    # generate a pretty printed message about the results
+    Parameters
+    ----------
+    total_sample_durations: list
+        a list of tuples in the format of [ (sample, datetime.timedelta), ... ]
+    seconds: bool
+        whether or not to report output times in seconds
+    """
     message = ""
     for sample, total_duration in total_sample_durations:
         message += "{sample}: {total_duration}\n".format(
             sample = sample,
             total_duration = timedelta_to_string(total_duration, seconds = seconds)
             )
-    return(total_sample_durations, message)
+    return(message)
 
 def calc_time_samples(**kwargs):
     """
@@ -289,27 +762,1962 @@ def calc_time_samples(**kwargs):
     total_sample_durations, message = calc_time_samples_durations(trace_file, mapping_file, seconds)
     print(message)
 
-def main():
+def write_output(output_file, text):
     """
-    Main control function for the script when run from CLI
+    Write text to an output file, or to stdout if the output file is '-'
     """
-    parser = argparse.ArgumentParser(description = 'Calculate the total duration of contiguous time intervals from Nextflow trace file')
-    subparsers = parser.add_subparsers(help ='Sub-commands available')
+    if output_file == '-':
+        sys.stdout.write(text)
+        return
+    with open(output_file, 'w') as fout:
+        fout.write(text)
 
-    # subparser for trace.txt calculation
-    trace_file = subparsers.add_parser('trace', help = 'Calculate duration of all intervals in a trace.txt file')
-    trace_file.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
-    trace_file.add_argument('--seconds', action = "store_true", help = 'Whether to report output in seconds or not')
-    trace_file.set_defaults(func = calc_time_trace)
+def report_records(trace_file, total_durations, num_intervals, total_walltime, total_sample_status_durations = None, total_sample_durations = None):
+    """
+    Create machine-readable records of the trace and sample duration metrics
 
-    # subparser for per-sample time durations
-    trace_samples = subparsers.add_parser('samples', help = 'Calculate duration of all intervals in a trace.txt file')
-    trace_samples.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
-    trace_samples.add_argument('mapping_file', nargs='?', default="mapping.tsv", help = 'The Tempo mapping file to read sample IDs from')
-    trace_samples.add_argument('--seconds', action = "store_true", help = 'Whether to report output in seconds or not')
-    trace_samples.set_defaults(func = calc_time_samples)
+    Output
+    ------
+    dict:
+        a dictionary with the metrics in seconds, in the format of
+        { 'trace_file': str, 'statuses': { status: { 'duration': float, 'intervals': int }, ... },
+        'total_duration': float, 'total_intervals': int, 'total_walltime': float,
+        'samples': { sample: { 'duration': float, 'statuses': { status: float, ... } }, ... } }
+    """
+    records = {
+    'trace_file': trace_file,
+    'statuses': {},
+    'total_duration': sum([ total_duration for total_duration in total_durations.values() ], timedelta()).total_seconds(),
+    'total_intervals': sum(num_intervals.values()),
+    'total_walltime': total_walltime.total_seconds(),
+    'samples': {}
+    }
+    for status, total_duration in total_durations.items():
+        records['statuses'][status] = { 'duration': total_duration.total_seconds(), 'intervals': num_intervals[status] }
+    if total_sample_durations != None:
+        for sample, total_duration in total_sample_durations:
+            records['samples'][sample] = {
+            'duration': total_duration.total_seconds(),
+            'statuses': dict( (status, duration.total_seconds()) for status, duration in total_sample_status_durations.get(sample, {}).items() )
+            }
+    return(records)
+
+def format_report_tsv(records):
+    """
+    Create a long-format TSV table from the report records, with one row per status, per total, and per sample per status
+    """
+    lines = [ '\t'.join(['group', 'id', 'status', 'duration_seconds', 'intervals']) ]
+    for status, values in records['statuses'].items():
+        lines.append('\t'.join(['status', status, status, str(values['duration']), str(values['intervals'])]))
+    lines.append('\t'.join(['total', 'all_intervals', '', str(records['total_duration']), str(records['total_intervals'])]))
+    lines.append('\t'.join(['total', 'current_pipeline', '', str(records['total_walltime']), '']))
+    for sample, values in records['samples'].items():
+        lines.append('\t'.join(['sample', sample, '', str(values['duration']), '']))
+        for status, duration in values['statuses'].items():
+            lines.append('\t'.join(['sample', sample, status, str(duration), '']))
+    return('\n'.join(lines) + '\n')
+
+def calc_time_report(**kwargs):
+    """
+    Calculate the trace and per-sample durations once and write all the requested reports
+
+    $ ./calc_time.py report logs/2020-04-21_12-43-46/trace.txt mapping.tsv --trace-output duration.trace.txt --trace-raw-output duration.trace.raw.txt --samples-output duration.samples.txt --samples-raw-output duration.samples.raw.txt --json-output duration.json
+    """
+    trace_file = kwargs.pop('trace_file')
+    mapping_file = kwargs.pop('mapping_file')
+    trace_output = kwargs.pop('trace_output')
+    trace_raw_output = kwargs.pop('trace_raw_output')
+    samples_output = kwargs.pop('samples_output')
+    samples_raw_output = kwargs.pop('samples_raw_output')
+    json_output = kwargs.pop('json_output')
+    tsv_output = kwargs.pop('tsv_output')
+
+    # only load the tag column and the samples if the per-sample durations are needed
+    samples = None
+    if mapping_file != None and not os.path.exists(mapping_file):
+        sys.stderr.write("WARNING: mapping file does not exist, skipping the per-sample durations; {mapping_file}\n".format(mapping_file = mapping_file))
+        mapping_file = None
+    if mapping_file != None and any([ output != None for output in [ samples_output, samples_raw_output, json_output, tsv_output ] ]):
+        samples = load_samples(mapping_file)
+    columns = INTERVAL_COLUMNS if samples == None else INTERVAL_COLUMNS + ['tag']
+    trace = load_trace(trace_file, columns)
+
+    interval_sets = get_intervals(trace)
+    total_durations, num_intervals, total_walltime = calculate_status_durations(interval_sets)
+    total_sample_status_durations = None
+    total_sample_durations = None
+    if samples != None:
+        sample_interval_sets = get_sample_intervals(trace, samples)
+        total_sample_status_durations, total_sample_durations = calculate_sample_durations(sample_interval_sets)
+
+    if trace_output != None:
+        write_output(trace_output, format_trace_durations(total_durations, num_intervals, total_walltime, seconds = False) + '\n')
+    if trace_raw_output != None:
+        write_output(trace_raw_output, format_trace_durations(total_durations, num_intervals, total_walltime, seconds = True) + '\n')
+    if samples_output != None and samples != None:
+        write_output(samples_output, format_sample_durations(total_sample_durations, seconds = False) + '\n')
+    if samples_raw_output != None and samples != None:
+        write_output(samples_raw_output, format_sample_durations(total_sample_durations, seconds = True) + '\n')
+    if json_output != None or tsv_output != None:
+        records = report_records(trace_file, total_durations, num_intervals, total_walltime, total_sample_status_durations, total_sample_durations)
+        if json_output != None:
+            write_output(json_output, json.dumps(records, indent = 4) + '\n')
+        if tsv_output != None:
+            write_output(tsv_output, format_report_tsv(records))
+
+def find_run_traces(log_dir):
+    """
+    Find the trace files from all the runs of a deployment, in the 'logs/<TIMESTAMP>/trace.txt' layout
+
+    Output
+    ------
+    list
+        the paths to the trace files, oldest run first
+    """
+    trace_files = glob.glob(os.path.join(log_dir, '*', 'trace.txt'))
+    # the run dir names are timestamps, which sort in order of time
+    return(sorted(trace_files))
+
+def _load_run_trace(args):
+    """
+    Load the columns of a trace file for load_runs_trace(); the 'hash' column is only loaded if the trace file has it
+    """
+    trace_file, columns = args
+    header = read_trace_header(trace_file)
+    if 'hash' in header:
+        columns = columns + [ 'hash' ]
+    return(load_trace(trace_file, columns))
+
+@profiling.profiled(rows = lambda trace: trace_rows(trace))
+def load_runs_trace(trace_files, columns = None, processes = None):
+    """
+    Loads the columns from the trace files of several runs in parallel and combines them,
+    keeping a single row for each task that appears in more than one run
+
+    Tasks are matched across runs by their 'hash'. When a task appears more than once, the row from the run that actually
+    executed it is kept over 'CACHED' rows, and rows from later runs are kept over rows from earlier runs
+
+    Parameters
+    ----------
+    trace_files: list
+        paths to the Nextflow trace.txt files, oldest run first
+    columns: list|None
+        the names of the columns to load; defaults to INTERVAL_COLUMNS
+    processes: int|None
+        number of processes to load the trace files with; defaults to one per trace file, up to the number of CPUs
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { column: numpy.ndarray, ... } as returned by load_trace(),
+        with an additional 'run' column holding the index of the trace file each row came from
+    """
+    if columns == None:
+        columns = INTERVAL_COLUMNS
+    columns = [ column for column in columns if column != 'hash' ]
+    if len(trace_files) == 0:
+        return(dict( [ (column, np.zeros(0, dtype = np.int64 if column in ('submit', 'complete') else object)) for column in columns ] + [ ('run', np.zeros(0, dtype = np.int64)) ] ))
+    if processes == None:
+        processes = min(len(trace_files), multiprocessing.cpu_count())
+
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            traces = pool.map(_load_run_trace, [ (trace_file, columns) for trace_file in trace_files ])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        traces = [ _load_run_trace((trace_file, columns)) for trace_file in trace_files ]
+
+    # rows without a hash are never treated as duplicates
+    hashes = []
+    for run, trace in enumerate(traces):
+        num_rows = len(trace['status'])
+        if 'hash' in trace:
+            hashes.extend([ value if value != '-' else (run, i) for i, value in enumerate(trace['hash']) ])
+        else:
+            hashes.extend([ (run, i) for i in range(num_rows) ])
+    combined = {}
+    for column in columns:
+        combined[column] = np.concatenate([ trace[column] for trace in traces ])
+    combined['run'] = np.concatenate([ np.full(len(trace['status']), run, dtype = np.int64) for run, trace in enumerate(traces) ])
+
+    # keep the first row per hash after sorting the rows by hash, then non-cached first, then latest run first
+    hash_codes, unique_hashes = factorize(hashes)
+    is_cached = combined['status'] == 'CACHED'
+    order = np.lexsort((-combined['run'], is_cached, hash_codes))
+    first = np.ones(len(order), dtype = bool)
+    first[1:] = hash_codes[order][1:] != hash_codes[order][:-1]
+    keep = np.sort(order[first])
+    return(dict( (column, values[keep]) for column, values in combined.items() ))
+
+def calc_time_runs(**kwargs):
+    """
+    Print out the cumulative durations across all the runs of a deployment, from the trace files in each run's log dir
+
+    $ ./calc_time.py runs logs mapping.tsv
+    """
+    log_dir = kwargs.pop('log_dir')
+    mapping_file = kwargs.pop('mapping_file')
+    seconds = kwargs.pop('seconds')
+    processes = kwargs.pop('processes')
+
+    trace_files = find_run_traces(log_dir)
+    columns = INTERVAL_COLUMNS if mapping_file == None else INTERVAL_COLUMNS + ['tag']
+    trace = load_runs_trace(trace_files, columns, processes)
+
+    print("Runs: {num_runs} ({num_rows} unique tasks)".format(num_runs = len(trace_files), num_rows = len(trace['status'])))
+    interval_sets = get_intervals(trace)
+    total_durations, num_intervals, total_walltime = calculate_status_durations(interval_sets)
+    print(format_trace_durations(total_durations, num_intervals, total_walltime, seconds))
+    if mapping_file != None:
+        samples = load_samples(mapping_file)
+        total_sample_status_durations, total_sample_durations = calculate_sample_durations(get_sample_intervals(trace, samples))
+        print("")
+        print(format_sample_durations(total_sample_durations, seconds))
+
+def get_process_names(trace_file, trace = None):
+    """
+    Get the name of the process for each row of a trace file, from the 'process' column if the trace file has it,
+    otherwise from the 'name' column with the tag removed, e.g. 'DoFacets (Sample1__Sample9)' -> 'DoFacets'
+
+    Parameters
+    ----------
+    trace_file: str|None
+        path to the Nextflow trace.txt file, or None to only use the columns in 'trace'
+    trace: dict|None
+        the columns already loaded with load_trace(); the 'process' or 'name' column is used from here if it was loaded
+
+    Output
+    ------
+    numpy.ndarray
+        an array of process names
+    """
+    if trace == None:
+        trace = {}
+    if 'process' in trace:
+        return(trace['process'])
+    if trace_file != None and 'process' in read_trace_header(trace_file):
+        return(load_trace(trace_file, ['process'])['process'])
+    names = trace['name'] if 'name' in trace else load_trace(trace_file, ['name'])['name']
+    name_codes, unique_names = factorize(names)
+    processes = np.empty(len(unique_names), dtype = object)
+    processes[:] = [ sys.intern(PROCESS_TAG_PATTERN.sub('', name)) for name in unique_names ]
+    return(processes[name_codes] if len(names) > 0 else np.zeros(0, dtype = object))
+
+def calculate_memory_usage(trace_file, percentile = 99.0, headroom = 1.2):
+    """
+    Calculate the memory requested and used per process from a trace file, along with a suggested memory request
+
+    Parameters
+    ----------
+    trace_file: str
+        path to the Nextflow trace.txt file
+    percentile: float
+        the percentile of the peak RSS of the successful tasks of a process to base the suggested memory on
+    headroom: float
+        the factor to multiply the peak RSS percentile by for the suggested memory
+
+    Output
+    ------
+    list
+        a list of dicts with the memory metrics per process in bytes, sorted by process name
+    """
+    header = read_trace_header(trace_file)
+    columns = [ column for column in MEMORY_COLUMNS if column in header ]
+    trace = load_trace(trace_file, [ 'status', 'exit' ] + columns)
+    processes = get_process_names(trace_file)
+    sizes = dict( (column, mem_convert.parse_sizes(trace[column]).astype(np.float64).filled(np.nan)) for column in columns )
+    for column in MEMORY_COLUMNS:
+        if column not in sizes:
+            sizes[column] = np.full(len(processes), np.nan)
+
+    succeeded = np.isin(trace['status'], [ 'COMPLETED', 'CACHED' ])
+    memory_failures = np.isin(trace['exit'], MEMORY_EXIT_CODES)
+    process_codes, unique_processes = factorize(processes)
+
+    def stat(function, values, *args):
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return(None)
+        return(float(function(values, *args)))
+
+    usage = []
+    for code, process in enumerate(unique_processes):
+        rows = process_codes == code
+        ok_rows = rows & succeeded
+        peak_rss = sizes['peak_rss'][ok_rows]
+        record = {
+        'process': process,
+        'tasks': int(rows.sum()),
+        'succeeded': int(ok_rows.sum()),
+        'memory_failures': int((rows & memory_failures).sum()),
+        'memory_requested': stat(np.max, sizes['memory'][rows]),
+        'peak_rss_p50': stat(np.percentile, peak_rss, 50),
+        'peak_rss_p95': stat(np.percentile, peak_rss, 95),
+        'peak_rss_percentile': stat(np.percentile, peak_rss, percentile),
+        'peak_rss_max': stat(np.max, peak_rss),
+        'peak_vmem_max': stat(np.max, sizes['peak_vmem'][ok_rows]),
+        'rss_max': stat(np.max, sizes['rss'][ok_rows]),
+        'failed_peak_rss_max': stat(np.max, sizes['peak_rss'][rows & memory_failures]),
+        'memory_suggested': None
+        }
+        # ask for enough memory for the given percentile of successful tasks with some headroom, but never less than
+        # what the tasks that ran out of memory were using when they were killed
+        if record['peak_rss_percentile'] != None:
+            suggested = record['peak_rss_percentile'] * headroom
+            if record['failed_peak_rss_max'] != None:
+                suggested = max(suggested, record['failed_peak_rss_max'] * headroom)
+            gigabytes = max(1, int(np.ceil(suggested / mem_convert.units['GB'])))
+            record['memory_suggested'] = gigabytes * mem_convert.units['GB']
+        usage.append(record)
+    return(sorted(usage, key = lambda record: record['process']))
+
+def format_memory_config(usage):
+    """
+    Create a Nextflow config block with the suggested memory for each process, in the style of tempo-1.3.config
+    """
+    lines = [ 'process {' ]
+    for record in usage:
+        if record['memory_suggested'] == None:
+            continue
+        lines.append("    withName: {process} {{".format(process = record['process']))
+        lines.append("        memory = {{ {gigabytes}.GB * task.attempt }}".format(gigabytes = int(record['memory_suggested'] // mem_convert.units['GB'])))
+        lines.append("    }")
+    lines.append('}')
+    return('\n'.join(lines) + '\n')
+
+def format_memory_usage(usage):
+    """
+    Create a TSV table of the memory metrics per process, with sizes in GB
+    """
+    columns = [ 'process', 'tasks', 'succeeded', 'memory_failures', 'memory_requested', 'memory_suggested', 'peak_rss_p50', 'peak_rss_p95', 'peak_rss_percentile', 'peak_rss_max', 'failed_peak_rss_max', 'peak_vmem_max', 'rss_max' ]
+    lines = [ '\t'.join(columns) ]
+    for record in usage:
+        values = []
+        for column in columns:
+            value = record[column]
+            if value == None:
+                value = '-'
+            elif column.startswith(('memory_requested', 'memory_suggested', 'peak_', 'failed_', 'rss_')):
+                value = '{0:.2f}'.format(value / mem_convert.units['GB'])
+            values.append(str(value))
+        lines.append('\t'.join(values))
+    return('\n'.join(lines) + '\n')
+
+def calc_time_memory(**kwargs):
+    """
+    Print out the memory usage per process from a trace file, and a config block with suggested memory requests
+
+    $ ./calc_time.py memory logs/2020-04-21_12-43-46/trace.txt --config-output memory.config
+    """
+    trace_file = kwargs.pop('trace_file')
+    percentile = kwargs.pop('percentile')
+    headroom = kwargs.pop('headroom')
+    config_output = kwargs.pop('config_output')
+
+    usage = calculate_memory_usage(trace_file, percentile, headroom)
+    print(format_memory_usage(usage))
+    config = format_memory_config(usage)
+    if config_output != None:
+        write_output(config_output, config)
+    else:
+        print(config)
+
+def load_pairs(pairing_file):
+    """
+    Load all the tumor normal pairs from the Tempo pairing file
+
+    Output
+    ------
+    list
+        a list of tuples in the format of [ (tumor_id, normal_id), ... ]
+    """
+    pairs = []
+    with open(pairing_file) as fin:
+        reader = csv.DictReader(fin, delimiter = '\t')
+        for row in reader:
+            pair = (row['TUMOR_ID'], row['NORMAL_ID'])
+            if pair not in pairs:
+                pairs.append(pair)
+    return(pairs)
+
+def find_critical_path(submit, complete):
+    """
+    Find the chain of tasks that determined the end-to-end latency of a set of tasks
+
+    Starting from the task that completed last, each task's predecessor is taken to be the task that completed last
+    before it was submitted, i.e. the task it was most likely waiting on
+
+    Parameters
+    ----------
+    submit: numpy.ndarray
+        the submit times of the tasks
+    complete: numpy.ndarray
+        the complete times of the tasks
+
+    Output
+    ------
+    numpy.ndarray
+        the indexes of the tasks on the critical path, in order of time
+    """
+    if len(submit) == 0:
+        return(np.zeros(0, dtype = np.int64))
+    order = np.argsort(complete, kind = 'stable')
+    sorted_complete = complete[order]
+    path = []
+    # position of the current task in the tasks sorted by complete
+    position = len(order) - 1
+    while position >= 0:
+        task = order[position]
+        path.append(task)
+        # the last task that completed at or before this task was submitted; always earlier in the sorted order
+        position = min(np.searchsorted(sorted_complete, submit[task], side = 'right'), position) - 1
+    return(np.array(path[::-1], dtype = np.int64))
+
+def summarize_critical_path(path, submit, complete, processes):
+    """
+    Get the time each process contributed to a critical path
+
+    Output
+    ------
+    (latency, contributions)
+
+    latency: int
+        the time from the submit of the first task to the complete of the last task on the path, in microseconds
+    contributions: dict
+        a dictionary in the format of { process: [ microseconds, number of tasks ], ... }, where the time between a task
+        completing and the next task on the path being submitted is counted under CRITICAL_PATH_IDLE
+    """
+    contributions = {}
+    if len(path) == 0:
+        return(0, contributions)
+    for i, task in enumerate(path):
+        process = processes[task]
+        if process not in contributions:
+            contributions[process] = [ 0, 0 ]
+        contributions[process][0] += int(complete[task] - submit[task])
+        contributions[process][1] += 1
+        if i > 0:
+            gap = int(submit[task] - complete[path[i - 1]])
+            if gap > 0:
+                if CRITICAL_PATH_IDLE not in contributions:
+                    contributions[CRITICAL_PATH_IDLE] = [ 0, 0 ]
+                contributions[CRITICAL_PATH_IDLE][0] += gap
+    latency = int(complete[path[-1]] - submit[path[0]])
+    return(latency, contributions)
+
+def calculate_critical_paths(trace_file, groups = None):
+    """
+    Calculate the critical path of the whole run, and of each group of samples, from a trace file
+    Cached tasks are left out since they did not run as part of the current pipeline
+
+    Parameters
+    ----------
+    trace_file: str
+        path to the Nextflow trace.txt file
+    groups: dict|None
+        a dictionary in the format of { group_id: [ sample_id, ... ], ... }, where the tasks of a group are all the tasks
+        that have any of the group's sample ID's in their tag, e.g. { 'Sample1': ['Sample1'], 'Sample9__Sample1': ['Sample9', 'Sample1'] }
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { group_id: (latency, contributions, num_tasks), ... } as returned by
+        summarize_critical_path(), with the whole run under the group_id None
+    """
+    if groups == None:
+        groups = {}
+    columns = INTERVAL_COLUMNS + [ 'tag' ] if len(groups) > 0 else INTERVAL_COLUMNS
+    trace = load_trace(trace_file, columns)
+    processes = get_process_names(trace_file)
+    keep = (trace['submit'] != MISSING_TIMESTAMP) & (trace['complete'] != MISSING_TIMESTAMP) & (trace['status'] != 'CACHED')
+    rows = np.flatnonzero(keep)
+    submit = trace['submit'][rows]
+    complete = trace['complete'][rows]
+    processes = processes[rows]
+
+    critical_paths = {}
+    path = find_critical_path(submit, complete)
+    latency, contributions = summarize_critical_path(path, submit, complete, processes)
+    critical_paths[None] = (latency, contributions, len(path))
+    if len(groups) == 0:
+        return(critical_paths)
+
+    # find the rows for each group from a single pass over the unique tags
+    group_ids = list(groups.keys())
+    sample_groups = {}
+    for code, group_id in enumerate(group_ids):
+        for sample_id in groups[group_id]:
+            sample_groups.setdefault(sample_id, []).append(code)
+    sample_index = build_sample_index(list(sample_groups.keys()))
+    tag_codes, tags = factorize(trace['tag'][rows])
+    tag_groups = [ sorted(set([ code for sample_id in tag_sample_ids(tag, sample_index) for code in sample_groups[sample_id] ])) for tag in tags ]
+
+    # expand the rows into one (row, group) pair for each group of the row's tag, then sort the pairs by group once
+    # and split them, so that the rows of every group are found in a single pass
+    tag_num_groups = np.array([ len(codes) for codes in tag_groups ], dtype = np.int64)
+    tag_offsets = np.cumsum(tag_num_groups) - tag_num_groups
+    flat_tag_groups = np.array([ code for codes in tag_groups for code in codes ], dtype = np.int64)
+    row_num_groups = tag_num_groups[tag_codes] if len(rows) > 0 else np.zeros(0, dtype = np.int64)
+    pair_rows = np.repeat(np.arange(len(rows)), row_num_groups)
+    pair_positions = np.arange(len(pair_rows)) - np.repeat(np.cumsum(row_num_groups) - row_num_groups, row_num_groups)
+    pair_groups = flat_tag_groups[tag_offsets[tag_codes[pair_rows]] + pair_positions] if len(pair_rows) > 0 else np.zeros(0, dtype = np.int64)
+    order = np.argsort(pair_groups, kind = 'stable')
+    group_rows = np.split(pair_rows[order], np.cumsum(np.bincount(pair_groups, minlength = len(group_ids)))[:-1])
+    for code, group_id in enumerate(group_ids):
+        tasks = group_rows[code]
+        path = tasks[find_critical_path(submit[tasks], complete[tasks])]
+        latency, contributions = summarize_critical_path(path, submit, complete, processes)
+        critical_paths[group_id] = (latency, contributions, len(path))
+    return(critical_paths)
+
+def format_critical_paths(critical_paths, top = 10, seconds = False, group_label = 'samples'):
+    """
+    Create a pretty printed message about the critical paths, with the top processes by time on the critical paths
+    """
+    def duration(microseconds):
+        return(timedelta_to_string(microseconds_to_timedelta(microseconds), seconds))
+
+    latency, contributions, num_tasks = critical_paths[None]
+    message = "Critical path (whole run): {latency} ({num_tasks} tasks)\n".format(latency = duration(latency), num_tasks = num_tasks)
+    for process, (time_on_path, num_process_tasks) in sorted(contributions.items(), key = lambda x: x[1][0], reverse = True)[:top]:
+        message += "{process}: {time} ({num_tasks} tasks)\n".format(process = process, time = duration(time_on_path), num_tasks = num_process_tasks)
+
+    group_ids = [ group_id for group_id in critical_paths if group_id != None ]
+    if len(group_ids) == 0:
+        return(message)
+
+    # total the contributions of each process across the critical paths of all the groups
+    totals = {}
+    for group_id in group_ids:
+        for process, (time_on_path, num_process_tasks) in critical_paths[group_id][1].items():
+            if process not in totals:
+                totals[process] = [ 0, 0, 0 ]
+            totals[process][0] += time_on_path
+            totals[process][1] += num_process_tasks
+            totals[process][2] += 1
+    message += "\nTop processes on the critical paths of {num_groups} {group_label}:\n".format(num_groups = len(group_ids), group_label = group_label)
+    for process, (time_on_path, num_process_tasks, num_groups) in sorted(totals.items(), key = lambda x: x[1][0], reverse = True)[:top]:
+        message += "{process}: {time} ({num_tasks} tasks, {num_groups} {group_label})\n".format(process = process, time = duration(time_on_path), num_tasks = num_process_tasks, num_groups = num_groups, group_label = group_label)
+
+    message += "\nLongest critical paths:\n"
+    longest = sorted(group_ids, key = lambda group_id: critical_paths[group_id][0], reverse = True)[:top]
+    for group_id in longest:
+        latency, contributions, num_tasks = critical_paths[group_id]
+        bottleneck = max([ (time_on_path, process) for process, (time_on_path, num_process_tasks) in contributions.items() if process != CRITICAL_PATH_IDLE ] or [ (0, '-') ])[1]
+        message += "{group_id}: {latency} ({num_tasks} tasks, longest process: {bottleneck})\n".format(group_id = group_id, latency = duration(latency), num_tasks = num_tasks, bottleneck = bottleneck)
+    return(message)
+
+def calc_time_critical_path(**kwargs):
+    """
+    Print out the processes that bounded the wall time of the pipeline, for the whole run and per sample or tumor normal pair
+
+    $ ./calc_time.py critical-path logs/2020-04-21_12-43-46/trace.txt mapping.tsv pairing.tsv
+    """
+    trace_file = kwargs.pop('trace_file')
+    mapping_file = kwargs.pop('mapping_file')
+    pairing_file = kwargs.pop('pairing_file')
+    seconds = kwargs.pop('seconds')
+    top = kwargs.pop('top')
+
+    groups = {}
+    group_label = 'samples'
+    if pairing_file != None:
+        group_label = 'pairs'
+        for tumor_id, normal_id in load_pairs(pairing_file):
+            groups[tumor_id + '__' + normal_id] = [ tumor_id, normal_id ]
+    elif mapping_file != None:
+        for sample_id in load_samples(mapping_file):
+            groups[sample_id] = [ sample_id ]
+    critical_paths = calculate_critical_paths(trace_file, groups)
+    print(format_critical_paths(critical_paths, top, seconds, group_label))
+
+def binned_levels(starts, stops, weights, edges):
+    """
+    Sweep over the start and stop events of a set of intervals to get the time-weighted mean of the total weight of the
+    intervals that are open within each bin, e.g. the mean number of running tasks when all weights are 1
+
+    Parameters
+    ----------
+    starts: numpy.ndarray
+        the start times of the intervals
+    stops: numpy.ndarray
+        the stop times of the intervals
+    weights: numpy.ndarray
+        the weight of each interval
+    edges: numpy.ndarray
+        the times of the bin edges, in order
+
+    Output
+    ------
+    numpy.ndarray
+        a float64 array with the mean level in each of the len(edges) - 1 bins
+    """
+    if len(edges) < 2:
+        return(np.zeros(0))
+    times = np.concatenate([ starts, stops ])
+    deltas = np.concatenate([ weights, -weights ]).astype(np.float64)
+    order = np.argsort(times, kind = 'stable')
+    times = times[order]
+    # the level just after each event, and the integral of the level up to each event
+    levels = np.cumsum(deltas[order])
+    integrals = np.concatenate([ [ 0.0 ], np.cumsum(levels[:-1] * np.diff(times)) ])
+
+    # integral of the level up to each bin edge, from the last event at or before the edge
+    last_event = np.searchsorted(times, edges, side = 'right') - 1
+    edge_integrals = np.where(last_event >= 0, integrals[np.maximum(last_event, 0)] + levels[np.maximum(last_event, 0)] * (edges - times[np.maximum(last_event, 0)]), 0.0)
+    return(np.diff(edge_integrals) / np.diff(edges))
+
+def calculate_concurrency(trace_file, bin_seconds = 300):
+    """
+    Calculate the concurrency of the tasks over time and the time each task waited in the queue, from a trace file
+    Cached tasks are left out since they did not run as part of the current pipeline
+
+    A task's queue wait is 'duration - realtime', and it is taken to be running from 'complete - realtime' to 'complete'
+
+    Parameters
+    ----------
+    trace_file: str
+        path to the Nextflow trace.txt file
+    bin_seconds: float
+        the width of the time bins in seconds
+
+    Output
+    ------
+    (series, queue_waits)
+
+    series: list
+        a list of dicts, one per time bin, with the mean number of running and queued tasks, allocated CPUs and requested memory
+    queue_waits: list
+        a list of dicts with the total and mean queue wait per process, in seconds, with the longest total wait first
+    """
+    header = read_trace_header(trace_file)
+    columns = INTERVAL_COLUMNS + [ column for column in CONCURRENCY_COLUMNS if column in header ]
+    trace = load_trace(trace_file, columns)
+    processes = get_process_names(trace_file)
+    keep = (trace['submit'] != MISSING_TIMESTAMP) & (trace['complete'] != MISSING_TIMESTAMP) & (trace['status'] != 'CACHED')
+    rows = np.flatnonzero(keep)
+    submit = trace['submit'][rows]
+    complete = trace['complete'][rows]
+    processes = processes[rows]
+
+    def column_values(column, value_type, default):
+        if column not in trace:
+            return(np.full(len(rows), default, dtype = np.float64))
+        return(mem_convert.parse_column(trace[column][rows], value_type).astype(np.float64).filled(default))
+
+    # durations are in milliseconds
+    duration = column_values('duration', 'duration', np.nan)
+    realtime = column_values('realtime', 'duration', np.nan)
+    cpus = column_values('cpus', 'percent', 1.0)
+    memory = column_values('memory', 'size', 0.0)
+
+    # tasks without a realtime are treated as running from submit to complete
+    realtime_us = np.where(np.isnan(realtime), complete - submit, realtime * 1000).astype(np.int64)
+    start = np.maximum(submit, complete - realtime_us)
+    # queue wait in seconds, from the start of the task when the trace is missing its duration or realtime
+    queue_wait = np.where(np.isnan(duration) | np.isnan(realtime), (start - submit) / 1000.0, duration - realtime)
+    queue_wait = np.maximum(queue_wait, 0) / 1000.0
+
+    series = []
+    if len(rows) > 0:
+        bin_width = int(bin_seconds * 1000000)
+        first = submit.min()
+        edges = np.arange(first, complete.max() + bin_width, bin_width)
+        if len(edges) < 2:
+            edges = np.array([ first, first + bin_width ])
+        ones = np.ones(len(rows))
+        running = binned_levels(start, complete, ones, edges)
+        queued = binned_levels(submit, start, ones, edges)
+        running_cpus = binned_levels(start, complete, cpus, edges)
+        running_memory = binned_levels(start, complete, memory, edges)
+        for i in range(len(edges) - 1):
+            series.append({
+            'time': microseconds_to_datetime(edges[i]).strftime('%Y-%m-%d %H:%M:%S'),
+            'running_tasks': round(running[i], 3),
+            'queued_tasks': round(queued[i], 3),
+            'cpus': round(running_cpus[i], 3),
+            'memory_gb': round(running_memory[i] / mem_convert.units['GB'], 3)
+            })
+
+    queue_waits = []
+    process_codes, unique_processes = factorize(processes)
+    total_waits = np.bincount(process_codes, weights = queue_wait, minlength = len(unique_processes))
+    total_realtimes = np.bincount(process_codes, weights = (complete - start) / 1000000.0, minlength = len(unique_processes))
+    num_tasks = np.bincount(process_codes, minlength = len(unique_processes))
+    for code, process in enumerate(unique_processes):
+        waits = queue_wait[process_codes == code]
+        queue_waits.append({
+        'process': process,
+        'tasks': int(num_tasks[code]),
+        'queue_wait_total': round(float(total_waits[code]), 3),
+        'queue_wait_mean': round(float(total_waits[code] / num_tasks[code]), 3),
+        'queue_wait_p95': round(float(np.percentile(waits, 95)), 3),
+        'realtime_total': round(float(total_realtimes[code]), 3)
+        })
+    queue_waits = sorted(queue_waits, key = lambda record: record['queue_wait_total'], reverse = True)
+    return(series, queue_waits)
+
+def format_records_tsv(records, columns):
+    """
+    Create a TSV table from a list of dicts
+    """
+    lines = [ '\t'.join(columns) ]
+    for record in records:
+        lines.append('\t'.join([ str(record[column]) if record[column] != None else '-' for column in columns ]))
+    return('\n'.join(lines) + '\n')
+
+def calc_time_concurrency(**kwargs):
+    """
+    Print out the number of running and queued tasks, allocated CPUs and requested memory over time,
+    along with the time spent waiting in the queue per process
+
+    $ ./calc_time.py concurrency logs/2020-04-21_12-43-46/trace.txt --bin 600 --output concurrency.tsv --queue-output queue.tsv
+    """
+    trace_file = kwargs.pop('trace_file')
+    bin_seconds = kwargs.pop('bin_seconds')
+    output_format = kwargs.pop('output_format')
+    output = kwargs.pop('output')
+    queue_output = kwargs.pop('queue_output')
+
+    series, queue_waits = calculate_concurrency(trace_file, bin_seconds)
+    if output_format == 'json':
+        write_output(output, json.dumps({ 'series': series, 'queue_waits': queue_waits }, indent = 4) + '\n')
+        return
+    series_text = format_records_tsv(series, [ 'time', 'running_tasks', 'queued_tasks', 'cpus', 'memory_gb' ])
+    queue_text = format_records_tsv(queue_waits, [ 'process', 'tasks', 'queue_wait_total', 'queue_wait_mean', 'queue_wait_p95', 'realtime_total' ])
+    if queue_output == None and output == '-':
+        write_output('-', series_text + '\n' + queue_text)
+        return
+    write_output(output, series_text)
+    write_output(queue_output if queue_output != None else '-', queue_text)
+
+def load_sample_targets(mapping_file):
+    """
+    Load the TARGET of each sample from the Tempo mapping file
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { sample_id: target, ... }
+    """
+    targets = {}
+    with open(mapping_file) as fin:
+        reader = csv.DictReader(fin, delimiter = '\t')
+        for row in reader:
+            targets[row['SAMPLE']] = row['TARGET']
+    return(targets)
+
+def column_key(column):
+    """
+    Make a group key function that groups the rows of a trace file by the values in one of its columns
+
+    A group key function takes the columns of a trace file loaded with load_trace() and returns a tuple (rows, values),
+    where 'rows' are the row numbers and 'values' are the key values of those rows; a row can be listed more than once
+    to put it in several groups, e.g. a task with two samples in its tag, or not at all to leave it out of every group
+    """
+    def key(trace):
+        values = trace[column]
+        return(np.arange(len(values)), values)
+    return(key)
+
+def process_key(trace):
+    """
+    Group key function for the name of the process of each row, see column_key() and get_process_names()
+    """
+    processes = get_process_names(None, trace)
+    return(np.arange(len(processes)), processes)
+
+def tag_key(tag_values):
+    """
+    Make a group key function that maps each tag to any number of key values, such as the samples found in the tag
+
+    Parameters
+    ----------
+    tag_values: function
+        a function that takes a tag and returns a list of key values for it
+    """
+    def key(trace):
+        tag_codes, tags = factorize(trace['tag'])
+        values_per_tag = [ sorted(tag_values(tag)) for tag in tags ]
+        num_values = np.array([ len(values) for values in values_per_tag ], dtype = np.int64)
+        rows = np.repeat(np.arange(len(tag_codes)), num_values[tag_codes])
+        values = np.empty(len(rows), dtype = object)
+        values[:] = [ value for code in tag_codes for value in values_per_tag[code] ]
+        return(rows, values)
+    return(key)
+
+def make_group_keys(names, mapping_file = None):
+    """
+    Get the group key functions, and the trace file columns they need, for a list of key names
+    The names can be any trace file column, 'process', or 'sample' and 'target' to use the SAMPLE and TARGET of the
+    samples from the mapping file that are found in the tag of each task
+
+    Output
+    ------
+    (keys, columns)
+
+    keys: list
+        a list of group key functions, see column_key()
+    columns: list
+        the columns of the trace file used by the key functions
+    """
+    keys = []
+    columns = []
+    for name in names:
+        if name in [ 'sample', 'target' ]:
+            if mapping_file == None:
+                raise ValueError("a mapping file is needed to group by '{name}'".format(name = name))
+            sample_targets = load_sample_targets(mapping_file)
+            sample_index = build_sample_index(list(sample_targets.keys()))
+            if name == 'sample':
+                keys.append(tag_key(lambda tag: tag_sample_ids(tag, sample_index)))
+            else:
+                keys.append(tag_key(lambda tag: set([ sample_targets[sample_id] for sample_id in tag_sample_ids(tag, sample_index) ])))
+            columns.append('tag')
+        elif name == 'process':
+            keys.append(process_key)
+            columns.append('process')
+        else:
+            keys.append(column_key(name))
+            columns.append(name)
+    return(keys, columns)
+
+def join_group_keys(rows, codes, key_rows, key_codes, num_rows):
+    """
+    Combine the (rows, codes) of a grouping with the (key_rows, key_codes) of one more key into one (row, code, key code)
+    entry for every combination of a code and a key code for the same row
+    """
+    order = np.argsort(key_rows, kind = 'stable')
+    key_rows = key_rows[order]
+    key_codes = key_codes[order]
+    key_counts = np.bincount(key_rows, minlength = num_rows)
+    key_starts = np.cumsum(key_counts) - key_counts
+    repeats = key_counts[rows]
+    offsets = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    key_entries = np.repeat(key_starts[rows], repeats) + offsets
+    return(np.repeat(rows, repeats), np.repeat(codes, repeats), key_codes[key_entries])
+
+def calculate_grouped_durations(group_codes, submit, complete, num_groups):
+    """
+    Calculate the total duration of the contiguous time intervals of every group at once,
+    with the same result as calculate_interval_durations() on the unique intervals of each group
+
+    Parameters
+    ----------
+    group_codes: numpy.ndarray
+        the group of each interval, from 0 to 'num_groups' - 1
+    submit: numpy.ndarray
+        the start of each interval in epoch microseconds
+    complete: numpy.ndarray
+        the end of each interval in epoch microseconds
+    num_groups: int
+        the number of groups
+
+    Output
+    ------
+    (durations, num_intervals)
+
+    durations: numpy.ndarray
+        an int64 array of the total duration of each group in microseconds
+    num_intervals: numpy.ndarray
+        an int64 array of the number of unique intervals in each group
+    """
+    durations = np.zeros(num_groups, dtype = np.int64)
+    if len(group_codes) == 0:
+        return(durations, np.zeros(num_groups, dtype = np.int64))
+    # the unique intervals of each group, sorted by group, then submit, then complete
+    order = np.lexsort((complete, submit, group_codes))
+    group_codes, submit, complete = group_codes[order], submit[order], complete[order]
+    unique = np.concatenate(([ True ], (group_codes[1:] != group_codes[:-1]) | (submit[1:] != submit[:-1]) | (complete[1:] != complete[:-1])))
+    group_codes, submit, complete = group_codes[unique], submit[unique], complete[unique]
+    num_intervals = np.bincount(group_codes, minlength = num_groups)
+
+    # running max of complete within each group, by offsetting the rank of each complete by its group
+    # so that the max never carries over from one group into the next
+    sorted_complete = np.unique(complete)
+    ranks = np.searchsorted(sorted_complete, complete)
+    num_ranks = len(sorted_complete)
+    latest_complete = sorted_complete[np.maximum.accumulate(group_codes * num_ranks + ranks) - group_codes * num_ranks]
+
+    # a new contiguous interval starts at the start of each group, and wherever a submit comes after the latest complete
+    # of all the intervals before it in the same group
+    new_group = np.concatenate(([ True ], group_codes[1:] != group_codes[:-1]))
+    starts = np.flatnonzero(new_group | np.concatenate(([ True ], submit[1:] > latest_complete[:-1])))
+    stops = np.concatenate((starts[1:], [ len(submit) ])) - 1
+
+    # NOTE: the last contiguous interval of each group is left out, the same as calculate_interval_durations()
+    last_of_group = np.concatenate((group_codes[starts[1:]] != group_codes[starts[:-1]], [ True ]))
+    keep = ~last_of_group
+    np.add.at(durations, group_codes[starts[keep]], latest_complete[stops[keep]] - submit[starts[keep]])
+    return(durations, num_intervals)
+
+@profiling.profiled()
+def calculate_group_durations(trace, groupings):
+    """
+    Calculate the total duration of the contiguous time intervals per group for several groupings of the rows of a trace
+    file at once, from the columns of a trace file loaded with load_trace()
+
+    Parameters
+    ----------
+    trace: dict
+        the columns of the trace file, including the INTERVAL_COLUMNS and the columns used by the group key functions
+    groupings: dict
+        a dictionary in the format of { grouping: [ key, ... ], ... } where each key is a group key function, see column_key();
+        the rows are grouped by the combination of the values of all the keys of a grouping
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { grouping: [ (values, duration, num_intervals), ... ], ... }, where 'values' is a tuple
+        of the key values of a group and 'duration' is in microseconds; every combination of key values found in the trace
+        file is listed, in the order they first appear
+    """
+    num_rows = len(trace['submit'])
+    valid = (trace['submit'] != MISSING_TIMESTAMP) & (trace['complete'] != MISSING_TIMESTAMP)
+
+    # each key function is only run once, even if it is used by several groupings
+    key_entries = {}
+    for keys in groupings.values():
+        for key in keys:
+            if key not in key_entries:
+                key_rows, key_values = key(trace)
+                key_codes, unique_values = factorize(key_values)
+                key_entries[key] = (np.asarray(key_rows, dtype = np.int64), key_codes, unique_values)
+
+    group_durations = {}
+    for grouping, keys in groupings.items():
+        rows = np.arange(num_rows)
+        group_codes = np.zeros(num_rows, dtype = np.int64)
+        group_values = [ () ]
+        for key in keys:
+            key_rows, key_codes, unique_values = key_entries[key]
+            rows, group_codes, new_codes = join_group_keys(rows, group_codes, key_rows, key_codes, num_rows)
+            # renumber the combined codes so that the groups are in the order they first appear
+            group_codes, combined_codes = factorize(group_codes * len(unique_values) + new_codes)
+            group_values = [ group_values[code // len(unique_values)] + (unique_values[code % len(unique_values)], ) for code in combined_codes ]
+        rows_valid = valid[rows]
+        rows = rows[rows_valid]
+        durations, num_intervals = calculate_grouped_durations(group_codes[rows_valid], trace['submit'][rows], trace['complete'][rows], len(group_values))
+        group_durations[grouping] = [ (values, int(durations[code]), int(num_intervals[code])) for code, values in enumerate(group_values) ]
+    return(group_durations)
+
+def format_group_durations(group_durations, seconds = False):
+    """
+    Create a pretty printed message about the total duration per group
+    """
+    message = ""
+    for grouping, groups in group_durations.items():
+        message += "{grouping}:\n".format(grouping = grouping)
+        for values, duration, num_intervals in groups:
+            message += "{values}: {duration} ({num_intervals} intervals)\n".format(
+                values = ' / '.join(values),
+                duration = timedelta_to_string(microseconds_to_timedelta(duration), seconds),
+                num_intervals = num_intervals
+                )
+        message += "\n"
+    return(message)
+
+def calc_time_group(**kwargs):
+    """
+    Print out the total duration of the contiguous time intervals per group, for every --group-by from a single read of the trace file
+
+    $ ./calc_time.py group logs/2020-04-21_12-43-46/trace.txt --group-by status --group-by process,status --group-by target --mapping-file mapping.tsv
+    process,status:
+    AlignReads / CACHED: 1 day, 2:03:11.120000 (320 intervals)
+    ...
+    """
+    trace_file = kwargs.pop('trace_file')
+    group_by = kwargs.pop('group_by')
+    mapping_file = kwargs.pop('mapping_file')
+    seconds = kwargs.pop('seconds')
+    output_format = kwargs.pop('output_format')
+    output = kwargs.pop('output')
+
+    if group_by == None:
+        group_by = [ 'status' ]
+    key_functions = {}
+    groupings = {}
+    columns = list(INTERVAL_COLUMNS)
+    for grouping in group_by:
+        names = [ name.strip() for name in grouping.split(',') if name.strip() != '' ]
+        for name in names:
+            if name not in key_functions:
+                keys, key_columns = make_group_keys([ name ], mapping_file)
+                key_functions[name] = keys[0]
+                columns += [ column for column in key_columns if column not in columns ]
+        groupings[','.join(names)] = [ key_functions[name] for name in names ]
+
+    # derive the process from the 'name' column for trace files without a 'process' column
+    if 'process' in columns and 'process' not in read_trace_header(trace_file):
+        columns = [ column if column != 'process' else 'name' for column in columns ]
+    trace = load_trace(trace_file, columns)
+    group_durations = calculate_group_durations(trace, groupings)
+
+    if output_format == 'json':
+        records = dict( (grouping, [ { 'group': list(values), 'duration': duration / 1000000.0, 'intervals': num_intervals } for values, duration, num_intervals in groups ]) for grouping, groups in group_durations.items() )
+        write_output(output, json.dumps(records, indent = 4) + '\n')
+    elif output_format == 'tsv':
+        lines = [ '\t'.join(['grouping', 'group', 'duration_seconds', 'intervals']) ]
+        for grouping, groups in group_durations.items():
+            for values, duration, num_intervals in groups:
+                lines.append('\t'.join([ grouping, ','.join(values), str(duration / 1000000.0), str(num_intervals) ]))
+        write_output(output, '\n'.join(lines) + '\n')
+    else:
+        write_output(output, format_group_durations(group_durations, seconds))
+
+def split_tag_costs(tag_codes, tag_keys, num_keys, task_costs):
+    """
+    Split the costs of the tasks evenly between the keys (e.g. samples) found in each task's tag, in one pass over the tasks
+
+    Parameters
+    ----------
+    tag_codes: numpy.ndarray
+        the code of the tag of each task, from factorize()
+    tag_keys: list
+        the codes of the keys found in each unique tag, in the format of [ [ key_code, ... ], ... ]
+    num_keys: int
+        the number of keys
+    task_costs: dict
+        a dictionary in the format of { name: numpy.ndarray, ... } with a cost for each task
+
+    Output
+    ------
+    (key_costs, key_tasks, unassigned_costs, unassigned_tasks)
+
+    key_costs: dict
+        a dictionary in the format of { name: numpy.ndarray, ... } with the total cost for each key
+    key_tasks: numpy.ndarray
+        the number of tasks with each key in their tag
+    unassigned_costs: dict
+        a dictionary in the format of { name: float, ... } with the total cost of the tasks without any key in their tag
+    unassigned_tasks: int
+        the number of tasks without any key in their tag
+    """
+    num_tags = len(tag_keys)
+    # a flat list of (tag, key) links, with each tag's share going to each of its keys
+    keys_per_tag = np.array([ len(keys) for keys in tag_keys ], dtype = np.int64)
+    link_tags = np.repeat(np.arange(num_tags), keys_per_tag)
+    link_keys = np.array([ key for keys in tag_keys for key in keys ], dtype = np.int64)
+    link_shares = 1.0 / keys_per_tag[link_tags] if len(link_tags) > 0 else np.zeros(0)
+    tag_tasks = np.bincount(tag_codes, minlength = num_tags)
+    key_tasks = np.bincount(link_keys, weights = tag_tasks[link_tags], minlength = num_keys).astype(np.int64)
+
+    key_costs = {}
+    unassigned_costs = {}
+    for name, costs in task_costs.items():
+        tag_costs = np.bincount(tag_codes, weights = costs, minlength = num_tags)
+        key_costs[name] = np.bincount(link_keys, weights = tag_costs[link_tags] * link_shares, minlength = num_keys)
+        unassigned_costs[name] = float(tag_costs[keys_per_tag == 0].sum())
+    unassigned_tasks = int(tag_tasks[keys_per_tag == 0].sum())
+    return(key_costs, key_tasks, unassigned_costs, unassigned_tasks)
+
+@profiling.profiled()
+def calculate_costs(trace_file, sample_ids, pairs = None, include_cached = False):
+    """
+    Calculate the compute resources used by each sample, and by each tumor normal pair, from a trace file
+
+    For each task:
+    - 'cpu_hours' is the CPUs allocated times the realtime
+    - 'used_cpu_hours' is the CPU usage ('%cpu' / 100) times the realtime
+    - 'gb_hours' is the peak RSS in GB times the realtime
+    A task with more than one sample in its tag is split evenly between the samples. Pairs are charged for the tasks that have
+    both of their samples in the tag, split evenly between the pairs of the tag, along with the per-sample tasks of their
+    samples, which are split evenly between all the pairs a sample is in
+
+    Parameters
+    ----------
+    trace_file: str
+        path to the Nextflow trace.txt file
+    sample_ids: list
+        a list of sample ID's
+    pairs: list|None
+        a list of tuples in the format of [ (tumor_id, normal_id), ... ]
+    include_cached: bool
+        whether or not to include the 'CACHED' tasks, which ran in earlier runs of the pipeline
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { 'samples': [ record, ... ], 'pairs': [ record, ... ], 'unassigned': record, 'total': record },
+        where each record is a dict with the 'tasks', 'cpu_hours', 'used_cpu_hours', 'cpu_efficiency' and 'gb_hours'
+    """
+    if pairs == None:
+        pairs = []
+    header = read_trace_header(trace_file)
+    columns = [ 'status', 'tag' ] + [ column for column in COST_COLUMNS if column in header ]
+    trace = load_trace(trace_file, columns)
+    rows = np.arange(trace_rows(trace)) if include_cached else np.flatnonzero(trace['status'] != 'CACHED')
+
+    def column_values(column, value_type, default):
+        if column not in trace:
+            return(np.full(len(rows), default, dtype = np.float64))
+        return(mem_convert.parse_column(trace[column][rows], value_type).astype(np.float64).filled(default))
+
+    # realtime is in milliseconds and peak_rss in bytes
+    realtime_hours = column_values('realtime', 'duration', 0.0) / 3600000.0
+    task_costs = {
+    'cpu_hours': column_values('cpus', 'percent', 1.0) * realtime_hours,
+    'used_cpu_hours': column_values('%cpu', 'percent', 0.0) / 100.0 * realtime_hours,
+    'gb_hours': column_values('peak_rss', 'size', 0.0) / mem_convert.units['GB'] * realtime_hours
+    }
+
+    # match the samples and pairs once per unique tag
+    sample_codes = dict( (sample_id, code) for code, sample_id in enumerate(sample_ids) )
+    sample_index = build_sample_index(sample_ids)
+    tag_codes, tags = factorize(trace['tag'][rows])
+    tag_samples = [ sorted([ sample_codes[sample_id] for sample_id in tag_sample_ids(tag, sample_index) ]) for tag in tags ]
+    sample_costs, sample_tasks, unassigned_costs, unassigned_tasks = split_tag_costs(tag_codes, tag_samples, len(sample_ids), task_costs)
+
+    def make_record(tasks, costs):
+        record = { 'tasks': int(tasks) }
+        for name in [ 'cpu_hours', 'used_cpu_hours', 'gb_hours' ]:
+            record[name] = round(float(costs[name]), 3)
+        record['cpu_efficiency'] = round(float(costs['used_cpu_hours'] / costs['cpu_hours']), 3) if costs['cpu_hours'] > 0 else None
+        return(record)
+
+    costs = { 'samples': [], 'pairs': [] }
+    for code, sample_id in enumerate(sample_ids):
+        record = make_record(sample_tasks[code], dict( (name, values[code]) for name, values in sample_costs.items() ))
+        record['sample'] = sample_id
+        costs['samples'].append(record)
+    costs['unassigned'] = make_record(unassigned_tasks, unassigned_costs)
+    costs['total'] = make_record(len(rows), dict( (name, values.sum()) for name, values in task_costs.items() ))
+
+    if len(pairs) > 0:
+        pair_codes = dict( (pair, code) for code, pair in enumerate(pairs) )
+        links = [ (sample_codes[sample_id], code) for code, pair in enumerate(pairs) for sample_id in pair if sample_id in sample_codes ]
+        link_samples = np.array([ link[0] for link in links ], dtype = np.int64)
+        link_pairs = np.array([ link[1] for link in links ], dtype = np.int64)
+        sample_pairs = [ [] for sample_id in sample_ids ]
+        for sample_code, code in links:
+            sample_pairs[sample_code].append(code)
+        # the pair tasks have both samples of a pair in the tag
+        tag_pairs = []
+        for samples in tag_samples:
+            found = set([ sample_ids[code] for code in samples ])
+            candidates = sorted(set([ code for sample_code in samples for code in sample_pairs[sample_code] ])) if len(samples) > 1 else []
+            tag_pairs.append([ code for code in candidates if pairs[code][0] in found and pairs[code][1] in found ])
+        pair_costs, pair_tasks, unpaired_costs, unpaired_tasks = split_tag_costs(tag_codes, tag_pairs, len(pairs), task_costs)
+        # the per-sample tasks are split between all the pairs of the sample
+        sample_only_tags = [ samples if len(tag_pairs[code]) == 0 else [] for code, samples in enumerate(tag_samples) ]
+        single_costs, single_tasks, unused_costs, unused_tasks = split_tag_costs(tag_codes, sample_only_tags, len(sample_ids), task_costs)
+        pairs_per_sample = np.bincount(link_samples, minlength = len(sample_ids))
+        for name in pair_costs:
+            pair_costs[name] = pair_costs[name] + np.bincount(link_pairs, weights = single_costs[name][link_samples] / pairs_per_sample[link_samples], minlength = len(pairs))
+        pair_tasks = pair_tasks + np.bincount(link_pairs, weights = single_tasks[link_samples], minlength = len(pairs)).astype(np.int64)
+        for code, (tumor_id, normal_id) in enumerate(pairs):
+            record = make_record(pair_tasks[code], dict( (name, values[code]) for name, values in pair_costs.items() ))
+            record['pair'] = tumor_id + '__' + normal_id
+            costs['pairs'].append(record)
+    return(costs)
+
+def calc_time_cost(**kwargs):
+    """
+    Print out the CPU hours, used CPU hours and memory GB hours per sample, and per tumor normal pair
+
+    $ ./calc_time.py cost logs/2020-04-21_12-43-46/trace.txt mapping.tsv pairing.tsv --pairs-output cost.pairs.tsv
+    """
+    trace_file = kwargs.pop('trace_file')
+    mapping_file = kwargs.pop('mapping_file')
+    pairing_file = kwargs.pop('pairing_file')
+    include_cached = kwargs.pop('include_cached')
+    output_format = kwargs.pop('output_format')
+    output = kwargs.pop('output')
+    pairs_output = kwargs.pop('pairs_output')
+
+    samples = load_samples(mapping_file)
+    pairs = load_pairs(pairing_file) if pairing_file != None else []
+    costs = calculate_costs(trace_file, samples, pairs, include_cached)
+    if output_format == 'json':
+        write_output(output, json.dumps(costs, indent = 4) + '\n')
+        return
+    cost_columns = [ 'tasks', 'cpu_hours', 'used_cpu_hours', 'cpu_efficiency', 'gb_hours' ]
+    summary = [ dict(costs[key], sample = '(' + key + ')') for key in [ 'unassigned', 'total' ] ]
+    samples_text = format_records_tsv(costs['samples'] + summary, [ 'sample' ] + cost_columns)
+    if len(pairs) == 0:
+        write_output(output, samples_text)
+        return
+    pairs_text = format_records_tsv(costs['pairs'], [ 'pair' ] + cost_columns)
+    if pairs_output == None and output == '-':
+        write_output('-', samples_text + '\n' + pairs_text)
+        return
+    write_output(output, samples_text)
+    write_output(pairs_output if pairs_output != None else '-', pairs_text)
+
+@profiling.profiled()
+def calculate_pair_durations(trace, pairs):
+    """
+    Calculate the total duration per status of the contiguous time intervals for each tumor normal pair, from the columns
+    of a trace file loaded with load_trace(), in a single pass over the rows
+
+    The tasks of a pair are split into:
+    - 'pair': the pair-level tasks, that have both the tumor and the normal ID of the pair in their tag, e.g. 'DoFacets (Sample1__Sample9)'
+    - 'sample': the per-sample tasks of the tumor or the normal of the pair that are not pair-level tasks of any pair,
+      e.g. 'AlignReads (Sample1@RG1)'; a normal shared by several tumors counts for each of its pairs
+    - 'all': both of the above
+
+    Parameters
+    ----------
+    trace: dict
+        the INTERVAL_COLUMNS and the 'tag' column of the trace file
+    pairs: list
+        a list of tuples in the format of [ (tumor_id, normal_id), ... ]
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { pair_id: { work: { status: (duration, num_intervals), ... }, ... }, ... } where 'pair_id'
+        is 'tumor_id__normal_id', 'work' is one of PAIR_WORK and 'duration' is in microseconds
+    """
+    # the pairs of each sample, to find the pairs of a tag from its samples
+    sample_pairs = {}
+    for code, (tumor_id, normal_id) in enumerate(pairs):
+        for sample_id in set([ tumor_id, normal_id ]):
+            sample_pairs.setdefault(sample_id, []).append(code)
+    sample_index = build_sample_index(list(sample_pairs.keys()))
+    work_codes = dict( (work, code) for code, work in enumerate(PAIR_WORK) )
+
+    # find the (pair, work) groups of each unique tag
+    tag_codes, tags = factorize(trace['tag'])
+    tag_groups = []
+    for tag in tags:
+        found = tag_sample_ids(tag, sample_index)
+        candidates = sorted(set([ code for sample_id in found for code in sample_pairs[sample_id] ]))
+        pair_level = [ code for code in candidates if pairs[code][0] in found and pairs[code][1] in found ]
+        work = 'pair' if len(pair_level) > 0 else 'sample'
+        codes = pair_level if len(pair_level) > 0 else candidates
+        tag_groups.append([ code * len(PAIR_WORK) + work_codes[work] for code in codes ] + [ code * len(PAIR_WORK) + work_codes['all'] for code in codes ])
+
+    # expand each row into one entry per group of its tag, then split the groups by status
+    num_tag_groups = np.array([ len(groups) for groups in tag_groups ], dtype = np.int64)
+    valid = (trace['submit'] != MISSING_TIMESTAMP) & (trace['complete'] != MISSING_TIMESTAMP)
+    rows = np.flatnonzero(valid & (num_tag_groups[tag_codes] > 0)) if len(tags) > 0 else np.zeros(0, dtype = np.int64)
+    row_groups = np.array([ group for code in tag_codes[rows] for group in tag_groups[code] ], dtype = np.int64)
+    rows = np.repeat(rows, num_tag_groups[tag_codes[rows]])
+    status_codes, statuses = factorize(trace['status'])
+    num_statuses = max(len(statuses), 1)
+    num_groups = len(pairs) * len(PAIR_WORK) * num_statuses
+    durations, num_intervals = calculate_grouped_durations(row_groups * num_statuses + status_codes[rows], trace['submit'][rows], trace['complete'][rows], num_groups)
+
+    pair_durations = {}
+    for code, (tumor_id, normal_id) in enumerate(pairs):
+        pair_durations[tumor_id + '__' + normal_id] = dict(
+            (work, dict(
+                (status, (int(durations[group]), int(num_intervals[group])))
+                for status, group in [ (status, (code * len(PAIR_WORK) + work_code) * num_statuses + status_code) for status_code, status in enumerate(statuses) ]))
+            for work_code, work in enumerate(PAIR_WORK))
+    return(pair_durations)
+
+def format_pair_durations(pair_durations, output_format = 'text', seconds = False):
+    """
+    Create a message about the durations of each tumor normal pair, with the longest total duration first
+
+    Parameters
+    ----------
+    pair_durations: dict
+        the durations returned by calculate_pair_durations()
+    output_format: str
+        'text' for the total durations of each pair, 'tsv' or 'json' for the durations per status in seconds
+    seconds: bool
+        whether or not to report the 'text' output times in seconds
+    """
+    totals = dict( (pair_id, dict( (work, sum([ duration for duration, num_intervals in status_durations.values() ])) for work, status_durations in works.items() )) for pair_id, works in pair_durations.items() )
+    pair_ids = sorted(pair_durations.keys(), key = lambda pair_id: totals[pair_id]['all'], reverse = True)
+    if output_format == 'json':
+        records = dict( (pair_id, dict( (work, dict( (status, { 'duration': duration / 1000000.0, 'intervals': num_intervals }) for status, (duration, num_intervals) in status_durations.items() )) for work, status_durations in pair_durations[pair_id].items() )) for pair_id in pair_ids )
+        return(json.dumps(records, indent = 4) + '\n')
+    if output_format == 'tsv':
+        lines = [ '\t'.join([ 'pair', 'work', 'status', 'duration', 'intervals' ]) ]
+        for pair_id in pair_ids:
+            for work in PAIR_WORK:
+                for status, (duration, num_intervals) in pair_durations[pair_id][work].items():
+                    lines.append('\t'.join([ pair_id, work, status, str(duration / 1000000.0), str(num_intervals) ]))
+        return('\n'.join(lines) + '\n')
+    message = ""
+    for pair_id in pair_ids:
+        message += "{pair_id}: {total} (pair: {pair}, per-sample: {sample})\n".format(
+            pair_id = pair_id,
+            total = timedelta_to_string(microseconds_to_timedelta(totals[pair_id]['all']), seconds = seconds),
+            pair = timedelta_to_string(microseconds_to_timedelta(totals[pair_id]['pair']), seconds = seconds),
+            sample = timedelta_to_string(microseconds_to_timedelta(totals[pair_id]['sample']), seconds = seconds)
+            )
+    return(message)
+
+def calc_time_pairs(**kwargs):
+    """
+    Print out the total duration per tumor normal pair, split into the pair-level and the per-sample tasks
+
+    $ ./calc_time.py pairs logs/2020-04-21_12-43-46/trace.txt pairing.tsv --format tsv --output duration.pairs.tsv
+    """
+    trace_file = kwargs.pop('trace_file')
+    pairing_file = kwargs.pop('pairing_file')
+    seconds = kwargs.pop('seconds')
+    output_format = kwargs.pop('output_format')
+    output = kwargs.pop('output')
+
+    pairs = load_pairs(pairing_file)
+    trace = load_trace(trace_file, INTERVAL_COLUMNS + ['tag'])
+    pair_durations = calculate_pair_durations(trace, pairs)
+    write_output(output, format_pair_durations(pair_durations, output_format, seconds))
+
+def load_diff_trace(path):
+    """
+    Load the columns used by the 'diff' sub-command from a trace file, a run dir with a trace.txt file, or a log dir
+    with the trace files of several runs, which are combined with load_runs_trace()
+
+    Output
+    ------
+    (trace, processes)
+
+    trace: dict
+        a dictionary in the format of { column: numpy.ndarray, ... } as returned by load_trace()
+    processes: numpy.ndarray
+        the name of the process of each row
+    """
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, 'trace.txt')):
+        path = os.path.join(path, 'trace.txt')
+    trace_files = find_run_traces(path) if os.path.isdir(path) else [ path ]
+    if len(trace_files) == 0:
+        raise ValueError("no trace files found in {path}".format(path = path))
+    header = read_trace_header(trace_files[0])
+    columns = [ column for column in DIFF_COLUMNS if column in header ] + [ 'process' if 'process' in header else 'name' ]
+    if len(trace_files) == 1:
+        trace = load_trace(trace_files[0], columns)
+    else:
+        trace = load_runs_trace(trace_files, columns)
+    return(trace, get_process_names(None, trace))
+
+def task_metrics(trace):
+    """
+    Get the DIFF_METRICS of each row of a trace file loaded with load_diff_trace(), in seconds, GB and percent,
+    with NaN for the values that are missing from the trace file
+
+    The queue wait is 'duration - realtime', the same as calculate_concurrency()
+    """
+    num_rows = trace_rows(trace)
+    def column_values(column, value_type):
+        if column not in trace:
+            return(np.full(num_rows, np.nan))
+        return(mem_convert.parse_column(trace[column], value_type).astype(np.float64).filled(np.nan))
+
+    # durations are in milliseconds
+    duration = column_values('duration', 'duration')
+    realtime = column_values('realtime', 'duration')
+    return({
+    'realtime': realtime / 1000.0,
+    'queue_wait': np.maximum(duration - realtime, 0) / 1000.0,
+    'peak_rss': column_values('peak_rss', 'size') / mem_convert.units['GB'],
+    '%cpu': column_values('%cpu', 'percent')
+    })
+
+def grouped_medians(group_codes, values, num_groups):
+    """
+    Get the median of the values in each group, with NaN for the groups without values
+    """
+    order = np.lexsort((values, group_codes))
+    sorted_values = values[order]
+    counts = np.bincount(group_codes, minlength = num_groups)
+    starts = np.cumsum(counts) - counts
+    medians = np.full(num_groups, np.nan)
+    has_values = counts > 0
+    lower = starts[has_values] + (counts[has_values] - 1) // 2
+    upper = starts[has_values] + counts[has_values] // 2
+    medians[has_values] = (sorted_values[lower] + sorted_values[upper]) / 2.0
+    return(medians)
+
+def grouped_mann_whitney(group_codes, values, second, num_groups):
+    """
+    Run a two-sided Mann-Whitney U test between the values of two samples within each group at once,
+    using the normal approximation with the correction for ties and for continuity
+
+    Parameters
+    ----------
+    group_codes: numpy.ndarray
+        an int64 array with the group of each value
+    values: numpy.ndarray
+        a float64 array of values, without NaN
+    second: numpy.ndarray
+        a bool array with whether each value is from the second sample
+    num_groups: int
+        the number of groups
+
+    Output
+    ------
+    (n1, n2, u, z, p_values)
+
+    n1, n2: numpy.ndarray
+        the number of values from the first and the second sample in each group
+    u: numpy.ndarray
+        the U statistic of the second sample in each group
+    z: numpy.ndarray
+        the z score of each group; above 0 when the values of the second sample tend to be larger
+    p_values: numpy.ndarray
+        the two-sided p-value of each group, 1 for groups where one of the samples has no values
+    """
+    order = np.lexsort((values, group_codes))
+    groups = group_codes[order]
+    sorted_values = values[order]
+    sorted_second = second[order]
+    counts = np.bincount(groups, minlength = num_groups)
+    starts = np.cumsum(counts) - counts
+
+    # rank within the group, with the tied values of a group given the mean of their ranks
+    positions = np.arange(len(order)) - starts[groups] + 1
+    new_run = np.ones(len(order), dtype = bool)
+    new_run[1:] = (groups[1:] != groups[:-1]) | (sorted_values[1:] != sorted_values[:-1])
+    run_ids = np.cumsum(new_run) - 1
+    run_sizes = np.bincount(run_ids).astype(np.float64)
+    ranks = (np.bincount(run_ids, weights = positions) / run_sizes)[run_ids]
+    ties = np.bincount(groups[new_run], weights = run_sizes ** 3 - run_sizes, minlength = num_groups)
+
+    n = counts.astype(np.float64)
+    n2 = np.bincount(groups, weights = sorted_second, minlength = num_groups)
+    n1 = n - n2
+    u = np.bincount(groups, weights = ranks * sorted_second, minlength = num_groups) - n2 * (n2 + 1) / 2.0
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        variance = n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1)))
+        shift = u - n1 * n2 / 2.0
+        z = np.where(variance > 0, (shift - 0.5 * np.sign(shift)) / np.sqrt(variance), 0.0)
+    p_values = np.array([ math.erfc(abs(value) / math.sqrt(2)) for value in z ])
+    return(n1.astype(np.int64), n2.astype(np.int64), u, z, p_values)
+
+def select_diff_rows(status, keys):
+    """
+    Get the rows of the tasks that ran and completed, keeping only the last row of the tasks that ran more than once
+
+    Cached tasks did not run as part of the run and their metrics are from an earlier run, so they are left out
+    """
+    rows = np.flatnonzero(status == 'COMPLETED')
+    unique_keys, last = np.unique(keys[rows][::-1], return_index = True)
+    return(np.sort(rows[len(rows) - 1 - last]))
+
+@profiling.profiled()
+def calculate_trace_diff(paths, align = True, alpha = 0.05, min_change = 0.1, min_tasks = 5):
+    """
+    Compare the per-process distributions of the DIFF_METRICS between the tasks of a baseline run and one or more other runs,
+    e.g. before and after changing the pipeline version or the Nextflow config, and flag the significant regressions
+
+    Tasks are aligned across the runs by their process name and tag, which holds the sample or pair IDs, so that only the
+    tasks that ran in both runs are compared and a different set of samples does not show up as a change.
+    Each process and metric is tested with a Mann-Whitney U test, with the p-values adjusted for the number of tests
+    with the Bonferroni correction. A regression is a significant increase of the median by at least 'min_change'
+
+    Parameters
+    ----------
+    paths: list
+        the trace files, run dirs or log dirs to compare; the first one is the baseline, see load_diff_trace()
+    align: bool
+        whether or not to only compare the tasks found in both runs
+    alpha: float
+        the significance level for the adjusted p-values
+    min_change: float
+        the smallest relative increase of the median to flag as a regression, e.g. 0.1 for 10%
+    min_tasks: int
+        the smallest number of tasks of a process in each run to compare it
+
+    Output
+    ------
+    list
+        a list of dicts, one per run after the baseline, with the 'trace', the number of 'tasks' compared and the 'records'
+        with the metrics per process, with the regressions first and then the largest increases
+    """
+    loaded = [ load_diff_trace(path) for path in paths ]
+    # factorize the processes and tags of all the runs together, so that the keys match across the runs
+    sizes = [ trace_rows(trace) for trace, processes in loaded ]
+    process_codes, unique_processes = factorize(np.concatenate([ processes for trace, processes in loaded ]))
+    tag_codes, unique_tags = factorize(np.concatenate([ trace['tag'] for trace, processes in loaded ]))
+    all_keys = process_codes * max(len(unique_tags), 1) + tag_codes
+    offsets = np.cumsum([ 0 ] + sizes)
+
+    runs = []
+    for i, (trace, processes) in enumerate(loaded):
+        keys = all_keys[offsets[i]:offsets[i + 1]]
+        rows = select_diff_rows(trace['status'], keys)
+        metrics = task_metrics(dict( (column, values[rows]) for column, values in trace.items() ))
+        runs.append((keys[rows], process_codes[offsets[i]:offsets[i + 1]][rows], metrics))
+
+    num_processes = len(unique_processes)
+    base_keys, base_processes, base_metrics = runs[0]
+    comparisons = []
+    for path, (keys, processes, metrics) in zip(paths[1:], runs[1:]):
+        base_rows = np.ones(len(base_keys), dtype = bool)
+        rows = np.ones(len(keys), dtype = bool)
+        if align:
+            base_rows = np.isin(base_keys, keys)
+            rows = np.isin(keys, base_keys)
+        records = []
+        for metric in DIFF_METRICS:
+            values = np.concatenate([ base_metrics[metric][base_rows], metrics[metric][rows] ])
+            group_codes = np.concatenate([ base_processes[base_rows], processes[rows] ])
+            second = np.concatenate([ np.zeros(base_rows.sum(), dtype = bool), np.ones(rows.sum(), dtype = bool) ])
+            valid = ~np.isnan(values)
+            values, group_codes, second = values[valid], group_codes[valid], second[valid]
+            n1, n2, u, z, p_values = grouped_mann_whitney(group_codes, values, second, num_processes)
+            base_medians = grouped_medians(group_codes[~second], values[~second], num_processes)
+            medians = grouped_medians(group_codes[second], values[second], num_processes)
+            for code, process in enumerate(unique_processes):
+                if n1[code] < min_tasks or n2[code] < min_tasks:
+                    continue
+                records.append({
+                'process': process,
+                'metric': metric,
+                'baseline_tasks': int(n1[code]),
+                'tasks': int(n2[code]),
+                'baseline_median': float(base_medians[code]),
+                'median': float(medians[code]),
+                'change': float(medians[code] / base_medians[code] - 1) if base_medians[code] > 0 else None,
+                'auc': float(u[code] / (n1[code] * n2[code])),
+                'z': float(z[code]),
+                'p_value': float(p_values[code])
+                })
+        for record in records:
+            record['p_value'] = min(1.0, record['p_value'] * len(records))
+            increased = record['median'] > 0 if record['change'] == None else record['change'] >= min_change
+            record['regression'] = record['p_value'] < alpha and record['z'] > 0 and increased
+        records.sort(key = lambda record: (not record['regression'], -record['z']))
+        comparisons.append({ 'trace': path, 'tasks': int(rows.sum()), 'records': records })
+    return(comparisons)
+
+def format_diff_value(metric, value, seconds = False):
+    """
+    Convert a value of one of the DIFF_METRICS to a string, with its unit
+    """
+    if metric in ('realtime', 'queue_wait'):
+        return(timedelta_to_string(microseconds_to_timedelta(value * 1000000), seconds = seconds))
+    if metric == 'peak_rss':
+        return('{0:.2f} GB'.format(value))
+    return('{0:.1f}%'.format(value))
+
+def format_trace_diff(baseline, comparisons, seconds = False):
+    """
+    Create a message with the regressions found in each run compared to the baseline
+    """
+    message = ""
+    for comparison in comparisons:
+        regressions = [ record for record in comparison['records'] if record['regression'] ]
+        message += "{trace} vs {baseline}: {num_regressions} regressions in {num_tests} comparisons of {tasks} tasks\n".format(
+            trace = comparison['trace'],
+            baseline = baseline,
+            num_regressions = len(regressions),
+            num_tests = len(comparison['records']),
+            tasks = comparison['tasks'])
+        for record in regressions:
+            message += "{process}\t{metric}\tmedian {baseline_median} -> {median} ({change}), p = {p_value:.2g}\n".format(
+                process = record['process'],
+                metric = record['metric'],
+                baseline_median = format_diff_value(record['metric'], record['baseline_median'], seconds),
+                median = format_diff_value(record['metric'], record['median'], seconds),
+                change = '{0:+.1f}%'.format(record['change'] * 100) if record['change'] != None else 'new',
+                p_value = record['p_value'])
+    return(message)
+
+def calc_time_diff(**kwargs):
+    """
+    Print out the processes that got slower or used more resources in one or more runs compared to a baseline run
+
+    $ ./calc_time.py diff logs/2020-04-21_12-43-46/trace.txt logs/2020-05-02_09-12-01/trace.txt
+    $ ./calc_time.py diff /juno/work/tempo/old_version/logs logs --format tsv --output diff.tsv
+    """
+    trace_files = kwargs.pop('trace_files')
+    align = kwargs.pop('align')
+    alpha = kwargs.pop('alpha')
+    min_change = kwargs.pop('min_change')
+    min_tasks = kwargs.pop('min_tasks')
+    seconds = kwargs.pop('seconds')
+    output_format = kwargs.pop('output_format')
+    output = kwargs.pop('output')
+
+    comparisons = calculate_trace_diff(trace_files, align, alpha, min_change, min_tasks)
+    if output_format == 'json':
+        write_output(output, json.dumps({ 'baseline': trace_files[0], 'comparisons': comparisons }, indent = 4) + '\n')
+    elif output_format == 'tsv':
+        records = [ dict(record, trace = comparison['trace']) for comparison in comparisons for record in comparison['records'] ]
+        write_output(output, format_records_tsv(records, [ 'trace', 'process', 'metric', 'baseline_tasks', 'tasks', 'baseline_median', 'median', 'change', 'auc', 'z', 'p_value', 'regression' ]))
+    else:
+        write_output(output, format_trace_diff(trace_files[0], comparisons, seconds))
+
+class IntervalSet(object):
+    """
+    The unique intervals of a group along with their merged contiguous intervals,
+    kept up to date as intervals are added or removed so that new trace rows do not require re-merging all the intervals
+
+    The durations match calculate_interval_durations() for the same intervals
+    """
+    def __init__(self):
+        self.counts = {} # { (submit, complete): number of rows, ... }
+        self.starts = [] # sorted starts of the contiguous intervals
+        self.stops = [] # sorted stops of the contiguous intervals
+        self.total = 0 # sum of the contiguous interval durations
+        self.dirty = False # an interval was removed and the contiguous intervals need to be rebuilt
+        self.last = None # the last interval sorted by submit then complete
+
+    def __len__(self):
+        return(len(self.counts))
+
+    def add(self, submit, complete):
+        interval = (submit, complete)
+        if interval in self.counts:
+            self.counts[interval] += 1
+            return
+        self.counts[interval] = 1
+        if self.last != None and interval > self.last:
+            self.last = interval
+        if not self.dirty:
+            self._merge(submit, complete)
+
+    def remove(self, submit, complete):
+        interval = (submit, complete)
+        self.counts[interval] -= 1
+        if self.counts[interval] == 0:
+            del self.counts[interval]
+            self.dirty = True
+
+    def _merge(self, submit, complete):
+        # the contiguous intervals that overlap the new interval, at indexes [first, last)
+        first = bisect.bisect_left(self.stops, submit)
+        last = bisect.bisect_right(self.starts, complete)
+        if first < last:
+            self.total -= sum([ stop - start for start, stop in zip(self.starts[first:last], self.stops[first:last]) ])
+            submit = min(submit, self.starts[first])
+            complete = max(complete, self.stops[last - 1])
+        self.starts[first:last] = [submit]
+        self.stops[first:last] = [complete]
+        self.total += complete - submit
+
+    def _rebuild(self):
+        self.starts = []
+        self.stops = []
+        self.total = 0
+        self.dirty = False
+        for submit, complete in sorted(self.counts):
+            self._merge(submit, complete)
+
+    def duration(self):
+        """
+        Total duration of the contiguous intervals, in microseconds
+
+        NOTE: leaves out the last contiguous interval, the same as calculate_interval_durations()
+        """
+        if self.dirty:
+            self._rebuild()
+        if len(self.starts) == 0:
+            return(0)
+        return(self.total - (self.stops[-1] - self.starts[-1]))
+
+    def first_last(self):
+        """
+        The first submit and the last interval sorted by submit then complete, or None if there are no intervals
+        """
+        if len(self.counts) == 0:
+            return(None)
+        if self.last == None or self.last not in self.counts:
+            self.last = max(self.counts)
+        if self.dirty:
+            self._rebuild()
+        return(self.starts[0], self.last)
+
+class TraceFollower(object):
+    """
+    Accumulates the durations from a trace file that is still being written to,
+    reading only the rows that were appended since the last update
+
+    When a task's row is written again (e.g. running then completed) the previous row for the task,
+    matched by 'task_id' or 'hash', is replaced
+    """
+    def __init__(self, trace_file, sample_ids = None):
+        self.trace_file = trace_file
+        self.sample_ids = sample_ids
+        self.reset()
+
+    def reset(self):
+        self.offset = 0 # byte offset of the next unread row
+        self.inode = None
+        self.header = None
+        self.num_rows = 0
+        self.status_rows = {} # { status: number of rows, ... } in order of first appearance
+        self.status_intervals = {} # { status: IntervalSet, ... }
+        self.sample_intervals = {} # { sample_id: { status: IntervalSet, ... }, ... }
+        self.tasks = {} # { task_key: (status, tag_samples, interval), ... }
+        self.sample_index = None
+        if self.sample_ids != None:
+            self.sample_index = build_sample_index(self.sample_ids)
+            for sample_id in self.sample_ids:
+                self.sample_intervals[sample_id] = {}
+
+    def update(self):
+        """
+        Read and merge all the complete rows that were appended to the trace file since the last update
+
+        Output
+        ------
+        int
+            the number of new rows
+        """
+        try:
+            stat = os.stat(self.trace_file)
+        except OSError:
+            return(0)
+        # start over if the file was replaced or truncated
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.reset()
+            self.inode = stat.st_ino
+        if stat.st_size == self.offset:
+            return(0)
+
+        with open(self.trace_file, 'rb') as fin:
+            fin.seek(self.offset)
+            data = fin.read(stat.st_size - self.offset)
+        # only use complete lines; a partially written line is read again on the next update
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+        lines = data[:end].decode('utf-8').splitlines()
+        if self.header == None and len(lines) > 0:
+            self.header = lines.pop(0).split('\t')
+        rows = [ line.split('\t') for line in lines ]
+        rows = [ row for row in rows if len(row) == len(self.header) ]
+        if len(rows) > 0:
+            self._add_rows(rows)
+        return(len(rows))
+
+    def _add_rows(self, rows):
+        columns = dict( (column, index) for index, column in enumerate(self.header) )
+        key_column = 'task_id' if 'task_id' in columns else 'hash' if 'hash' in columns else None
+        submits = parse_timestamps([ row[columns['submit']] for row in rows ])
+        completes = parse_timestamps([ row[columns['complete']] for row in rows ])
+        for i, row in enumerate(rows):
+            status = row[columns['status']]
+            interval = None
+            if submits[i] != MISSING_TIMESTAMP and completes[i] != MISSING_TIMESTAMP:
+                interval = (int(submits[i]), int(completes[i]))
+            tag_samples = set()
+            if self.sample_index != None:
+                tag_samples = tag_sample_ids(row[columns['tag']], self.sample_index)
+
+            # replace the previous row for the same task
+            if key_column != None:
+                key = row[columns[key_column]]
+                if key in self.tasks:
+                    self._remove_row(*self.tasks[key])
+                self.tasks[key] = (status, tag_samples, interval)
+            self._add_row(status, tag_samples, interval)
+
+    def _add_row(self, status, tag_samples, interval):
+        self.num_rows += 1
+        if status not in self.status_rows:
+            self.status_rows[status] = 0
+            self.status_intervals[status] = IntervalSet()
+            for interval_sets in self.sample_intervals.values():
+                interval_sets[status] = IntervalSet()
+        self.status_rows[status] += 1
+        if interval != None:
+            self.status_intervals[status].add(*interval)
+            for sample_id in tag_samples:
+                self.sample_intervals[sample_id][status].add(*interval)
+
+    def _remove_row(self, status, tag_samples, interval):
+        self.num_rows -= 1
+        self.status_rows[status] -= 1
+        if interval != None:
+            self.status_intervals[status].remove(*interval)
+            for sample_id in tag_samples:
+                self.sample_intervals[sample_id][status].remove(*interval)
+
+    def trace_durations(self, seconds = False):
+        """
+        Get the total durations per status and a message in the same format as calculate_trace_duration()
+        """
+        statuses = [ status for status, num_rows in self.status_rows.items() if num_rows > 0 ]
+        total_durations = {}
+        num_intervals = {}
+        for status in statuses:
+            total_durations[status] = microseconds_to_timedelta(self.status_intervals[status].duration())
+            num_intervals[status] = len(self.status_intervals[status])
+
+        # get the total duration of all non-cached tasks, start to finish of pipeline
+        total_walltime = timedelta()
+        first_lasts = [ self.status_intervals[status].first_last() for status in statuses if status != 'CACHED' ]
+        first_lasts = [ first_last for first_last in first_lasts if first_last != None ]
+        if sum([ len(self.status_intervals[status]) for status in statuses if status != 'CACHED' ]) > 1:
+            start = min([ first for first, last in first_lasts ])
+            end = max([ last for first, last in first_lasts ])[1]
+            total_walltime = microseconds_to_timedelta(end - start)
+
+        message = format_trace_durations(total_durations, num_intervals, total_walltime, seconds)
+        return(total_durations, message)
+
+    def sample_durations(self, seconds = False):
+        """
+        Get the total durations per sample and a message in the same format as calc_time_samples_durations()
+        """
+        total_sample_durations = []
+        for sample_id, interval_sets in self.sample_intervals.items():
+            total_duration = sum([ intervals.duration() for intervals in interval_sets.values() ])
+            total_sample_durations.append((sample_id, microseconds_to_timedelta(total_duration)))
+        total_sample_durations = sorted(total_sample_durations, reverse= True, key=lambda x: x[1])
+        message = format_sample_durations(total_sample_durations, seconds)
+        return(total_sample_durations, message)
+
+def calc_time_follow(**kwargs):
+    """
+    Print out the accumulated durations of a trace file that is still being written, updating every few seconds
+
+    $ ./calc_time.py follow logs/2020-04-21_12-43-46/trace.txt mapping.tsv --interval 10
+    """
+    trace_file = kwargs.pop('trace_file')
+    mapping_file = kwargs.pop('mapping_file')
+    seconds = kwargs.pop('seconds')
+    interval = kwargs.pop('interval')
+    count = kwargs.pop('count')
+
+    sample_ids = None
+    if mapping_file != None:
+        sample_ids = load_samples(mapping_file)
+    follower = TraceFollower(trace_file, sample_ids)
+
+    num_updates = 0
+    while True:
+        num_new_rows = follower.update()
+        if num_updates == 0 or num_new_rows > 0:
+            total_durations, message = follower.trace_durations(seconds)
+            print(">>> {timestamp}: {num_rows} rows".format(timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S'), num_rows = follower.num_rows))
+            print(message)
+            if sample_ids != None:
+                total_sample_durations, samples_message = follower.sample_durations(seconds)
+                print(samples_message)
+            sys.stdout.flush()
+        num_updates += 1
+        if count > 0 and num_updates >= count:
+            break
+        time.sleep(interval)
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = 'Calculate the total duration of contiguous time intervals from Nextflow trace file')
+    parser.add_argument('--profile', action = 'store_true', help = 'Save the time and memory of each phase to LOG_DIR')
+    parser.add_argument('--cprofile', action = 'store_true', help = 'Save cProfile stats to LOG_DIR along with the --profile output')
+    subparsers = parser.add_subparsers(help ='Sub-commands available')
+
+    # subparser for trace.txt calculation
+    trace_file = subparsers.add_parser('trace', help = 'Calculate duration of all intervals in a trace.txt file')
+    trace_file.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
+    trace_file.add_argument('--seconds', action = "store_true", help = 'Whether to report output in seconds or not')
+    trace_file.set_defaults(func = calc_time_trace)
+
+    # subparser for per-sample time durations
+    trace_samples = subparsers.add_parser('samples', help = 'Calculate duration of all intervals in a trace.txt file')
+    trace_samples.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
+    trace_samples.add_argument('mapping_file', nargs='?', default="mapping.tsv", help = 'The Tempo mapping file to read sample IDs from')
+    trace_samples.add_argument('--seconds', action = "store_true", help = 'Whether to report output in seconds or not')
+    trace_samples.set_defaults(func = calc_time_samples)
+
+    # subparser for writing several reports from one calculation
+    trace_report = subparsers.add_parser('report', help = 'Calculate the trace and per-sample durations once and write several reports')
+    trace_report.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
+    trace_report.add_argument('mapping_file', nargs='?', default=None, help = 'The Tempo mapping file to read sample IDs from')
+    trace_report.add_argument('--trace-output', dest = 'trace_output', default = None, help = 'File to write the durations per status to')
+    trace_report.add_argument('--trace-raw-output', dest = 'trace_raw_output', default = None, help = 'File to write the durations per status in seconds to')
+    trace_report.add_argument('--samples-output', dest = 'samples_output', default = None, help = 'File to write the durations per sample to')
+    trace_report.add_argument('--samples-raw-output', dest = 'samples_raw_output', default = None, help = 'File to write the durations per sample in seconds to')
+    trace_report.add_argument('--json-output', dest = 'json_output', default = None, help = 'File to write all the durations in seconds to, in JSON format')
+    trace_report.add_argument('--tsv-output', dest = 'tsv_output', default = None, help = 'File to write all the durations in seconds to, in TSV format')
+    trace_report.set_defaults(func = calc_time_report)
+
+    # subparser for cumulative durations across all the runs of a deployment
+    trace_runs = subparsers.add_parser('runs', help = 'Calculate cumulative durations across the trace.txt files of all runs in a log dir')
+    trace_runs.add_argument('log_dir', help = 'The log dir holding one sub-dir with a trace.txt file per run')
+    trace_runs.add_argument('mapping_file', nargs='?', default=None, help = 'The Tempo mapping file to read sample IDs from, to also report durations per sample')
+    trace_runs.add_argument('--seconds', action = "store_true", help = 'Whether to report output in seconds or not')
+    trace_runs.add_argument('--processes', type = int, default = None, help = 'Number of processes to load the trace files with')
+    trace_runs.set_defaults(func = calc_time_runs)
+
+    # subparser for memory usage per process
+    trace_memory = subparsers.add_parser('memory', help = 'Report the memory usage per process in a trace.txt file and suggest memory requests for the Nextflow config')
+    trace_memory.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
+    trace_memory.add_argument('--percentile', type = float, default = 99.0, help = 'Percentile of the peak RSS of successful tasks to base the suggested memory on')
+    trace_memory.add_argument('--headroom', type = float, default = 1.2, help = 'Factor to multiply the peak RSS by for the suggested memory')
+    trace_memory.add_argument('--config-output', dest = 'config_output', default = None, help = 'File to write the suggested Nextflow config block to, instead of printing it')
+    trace_memory.set_defaults(func = calc_time_memory)
+
+    # subparser for the critical path analysis
+    trace_critical_path = subparsers.add_parser('critical-path', help = 'Find the chains of tasks that bounded the wall time of the pipeline and the processes that contributed most to them')
+    trace_critical_path.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
+    trace_critical_path.add_argument('mapping_file', nargs='?', default=None, help = 'The Tempo mapping file to read sample IDs from, to also find the critical path per sample')
+    trace_critical_path.add_argument('pairing_file', nargs='?', default=None, help = 'The Tempo pairing file, to find the critical path per tumor normal pair instead of per sample')
+    trace_critical_path.add_argument('--top', type = int, default = 10, help = 'Number of processes and samples to list')
+    trace_critical_path.add_argument('--seconds', action = "store_true", help = 'Whether to report output in seconds or not')
+    trace_critical_path.set_defaults(func = calc_time_critical_path)
+
+    # subparser for task concurrency and queue wait
+    trace_concurrency = subparsers.add_parser('concurrency', help = 'Calculate the running and queued tasks, CPUs and memory over time, and the queue wait per process')
+    trace_concurrency.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
+    trace_concurrency.add_argument('--bin', dest = 'bin_seconds', type = float, default = 300, help = 'Width of the time bins in seconds')
+    trace_concurrency.add_argument('--format', dest = 'output_format', default = 'tsv', choices = [ 'tsv', 'json' ], help = 'Output format')
+    trace_concurrency.add_argument('--output', default = '-', help = 'File to write the time series to, or all output in JSON format')
+    trace_concurrency.add_argument('--queue-output', dest = 'queue_output', default = None, help = 'File to write the queue wait per process to in TSV format')
+    trace_concurrency.set_defaults(func = calc_time_concurrency)
+
+    # subparser for the durations of any grouping of the tasks
+    trace_group = subparsers.add_parser('group', help = 'Calculate the contiguous time intervals per group of tasks, for several groupings from one read of the trace file')
+    trace_group.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
+    trace_group.add_argument('--group-by', dest = 'group_by', action = 'append', default = None, help = "Comma separated trace file columns, 'process', 'sample' or 'target' to group the tasks by, e.g. 'process,status'; can be given several times")
+    trace_group.add_argument('--mapping-file', dest = 'mapping_file', default = None, help = "The Tempo mapping file, needed to group by 'sample' or 'target'")
+    trace_group.add_argument('--seconds', action = 'store_true', help = 'Report durations in seconds')
+    trace_group.add_argument('--format', dest = 'output_format', default = 'text', choices = [ 'text', 'tsv', 'json' ], help = 'Output format')
+    trace_group.add_argument('--output', default = '-', help = 'File to write the output to')
+    trace_group.set_defaults(func = calc_time_group)
+
+    # subparser for the compute cost per sample and pair
+    trace_cost = subparsers.add_parser('cost', help = 'Calculate the CPU hours, used CPU hours and memory GB hours per sample, and per tumor normal pair')
+    trace_cost.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
+    trace_cost.add_argument('mapping_file', nargs='?', default="mapping.tsv", help = 'The Tempo mapping file to read sample IDs from')
+    trace_cost.add_argument('pairing_file', nargs='?', default=None, help = 'The Tempo pairing file, to also report the cost per tumor normal pair')
+    trace_cost.add_argument('--include-cached', dest = 'include_cached', action = 'store_true', help = "Include the 'CACHED' tasks, which ran in earlier runs of the pipeline")
+    trace_cost.add_argument('--format', dest = 'output_format', default = 'tsv', choices = [ 'tsv', 'json' ], help = 'Output format')
+    trace_cost.add_argument('--output', default = '-', help = 'File to write the cost per sample to, or all output in JSON format')
+    trace_cost.add_argument('--pairs-output', dest = 'pairs_output', default = None, help = 'File to write the cost per pair to in TSV format')
+    trace_cost.set_defaults(func = calc_time_cost)
+
+    # subparser for the durations per tumor normal pair
+    trace_pairs = subparsers.add_parser('pairs', help = 'Calculate the duration per tumor normal pair, split into the pair-level and the per-sample tasks')
+    trace_pairs.add_argument('trace_file', help = 'The Nextflow trace file to calculate')
+    trace_pairs.add_argument('pairing_file', nargs='?', default="pairing.tsv", help = 'The Tempo pairing file to read the tumor normal pairs from')
+    trace_pairs.add_argument('--seconds', action = 'store_true', help = 'Report durations in seconds')
+    trace_pairs.add_argument('--format', dest = 'output_format', default = 'text', choices = [ 'text', 'tsv', 'json' ], help = 'Output format')
+    trace_pairs.add_argument('--output', default = '-', help = 'File to write the output to')
+    trace_pairs.set_defaults(func = calc_time_pairs)
+
+    # subparser for comparing the tasks of several runs
+    trace_diff = subparsers.add_parser('diff', help = 'Compare the realtime, queue wait, peak RSS and CPU usage per process between runs and flag the regressions')
+    trace_diff.add_argument('trace_files', nargs = '+', help = 'The Nextflow trace files, run dirs or log dirs to compare; the first one is the baseline')
+    trace_diff.add_argument('--no-align', dest = 'align', action = 'store_false', help = 'Compare all the tasks instead of only the tasks with the same process and tag in both runs')
+    trace_diff.add_argument('--alpha', type = float, default = 0.05, help = 'Significance level for the p-values after the Bonferroni correction')
+    trace_diff.add_argument('--min-change', dest = 'min_change', type = float, default = 0.1, help = 'Smallest relative increase of the median to flag as a regression')
+    trace_diff.add_argument('--min-tasks', dest = 'min_tasks', type = int, default = 5, help = 'Smallest number of tasks of a process in each run to compare it')
+    trace_diff.add_argument('--seconds', action = 'store_true', help = 'Report durations in seconds')
+    trace_diff.add_argument('--format', dest = 'output_format', default = 'text', choices = [ 'text', 'tsv', 'json' ], help = 'Output format')
+    trace_diff.add_argument('--output', default = '-', help = 'File to write the output to')
+    trace_diff.set_defaults(func = calc_time_diff)
+
+    # subparser for following a trace file that is still being written
+    trace_follow = subparsers.add_parser('follow', help = 'Calculate durations from a trace.txt file as it is being written, reading only the new rows on each update')
+    trace_follow.add_argument('trace_file', help = 'The Nextflow trace file to follow')
+    trace_follow.add_argument('mapping_file', nargs='?', default=None, help = 'The Tempo mapping file to read sample IDs from, to also report durations per sample')
+    trace_follow.add_argument('--seconds', action = "store_true", help = 'Whether to report output in seconds or not')
+    trace_follow.add_argument('--interval', type = float, default = 5.0, help = 'Number of seconds to wait between updates')
+    trace_follow.add_argument('--count', type = int, default = 0, help = 'Number of updates to run before exiting; 0 runs until interrupted')
+    trace_follow.set_defaults(func = calc_time_follow)
 
     args = parser.parse_args()
+    if args.profile or args.cprofile:
+        profiling.enable('calc_time', 'cprofile' if args.cprofile else '1')
+    else:
+        profiling.enable_from_env('calc_time')
+    del args.profile, args.cprofile
     args.func(**vars(args))
 
 if __name__ == '__main__':
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Check the Tempo pipeline output and logs for errors
+By reading from values saved in the config.json
+Meant to be run from inside the Makefile, with the output saved to the ERROR_MESSAGE file
+
+Each log file is scanned a single time through a memory map, and the trace file is read once for the task breakdown
+
+$ ./check_errors.py config.json --json-output logs/2020-04-21_12-43-46/errors.json
+.bam files with potential errors in output dir:
+0
+...
+"""
+import os
+import re
+import sys
+import json
+import mmap
+import argparse
+import numpy as np
+import calc_time
+import bam_check
+
+# the messages Nextflow prints for a task that failed and was retried or ignored, e.g.
+# [4f/3a2c1e] NOTE: Process `DoFacets (Sample1__Sample9)` terminated with an error exit status (137) -- Execution is retried (1)
+RETRIED_MESSAGE = b'Execution is retried'
+IGNORED_MESSAGE = b'Error is ignored'
+TASK_ERROR_PATTERN = re.compile(r'\[(?P<hash>[0-9a-f]{2}/[0-9a-f]+)\].*?Process `(?P<process>[^`]*)` terminated with an error exit status \((?P<exit>[^)]*)\)')
+
+# the message in the nextflow.log for the task that stopped the pipeline, followed by its exit status and work dir
+FAILED_MESSAGE = b"Error executing process > '"
+FAILED_EXIT_PATTERN = re.compile(rb'Command exit status:\s+(\S+)')
+FAILED_WORKDIR_PATTERN = re.compile(rb'Work dir:\s+(\S+)')
+
+# number of bytes after a FAILED_MESSAGE to search for its exit status and work dir
+FAILED_CONTEXT_SIZE = 65536
+
+# most ignored tasks to list in the text output
+MAX_LISTED_TASKS = 50
+
+def map_file(path):
+    """
+    Open a file as a read-only memory map
+
+    Output
+    ------
+    mmap.mmap|bytes
+        the contents of the file, or empty bytes if the file is missing or empty
+    """
+    if path == None or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return(b'')
+    with open(path, 'rb') as fin:
+        return(mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ))
+
+def find_lines(data, messages):
+    """
+    Find every line in the data that contains any of the messages, in a single pass over the data
+
+    Parameters
+    ----------
+    data: mmap.mmap|bytes
+        the contents of the file
+    messages: list
+        the messages to look for, as bytes
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { message: [ line, ... ], ... } with the lines as bytes, in the order they appear;
+        a line with more than one of the messages is listed under each of them
+    """
+    lines = dict( (message, []) for message in messages )
+    pattern = re.compile(b'|'.join([ re.escape(message) for message in messages ]))
+    match = pattern.search(data)
+    while match != None:
+        start = data.rfind(b'\n', 0, match.start()) + 1
+        stop = data.find(b'\n', match.start())
+        if stop == -1:
+            stop = len(data)
+        line = data[start:stop].rstrip(b'\r')
+        for message in messages:
+            if message in line:
+                lines[message].append(line)
+        match = pattern.search(data, stop)
+    return(lines)
+
+def task_error_events(lines, event, workdirs):
+    """
+    Parse the task error messages from the log into a list of events
+
+    Parameters
+    ----------
+    lines: list
+        the unique lines with the task error messages
+    event: str
+        the type of event, 'retried' or 'ignored'
+    workdirs: dict
+        the work dir of each task from the trace file, in the format of { hash: workdir, ... }
+    """
+    events = []
+    for line in lines:
+        match = TASK_ERROR_PATTERN.search(line.decode('utf-8', 'replace'))
+        if match == None:
+            continue
+        events.append({
+        'event': event,
+        'process': match.group('process'),
+        'exit': match.group('exit'),
+        'hash': match.group('hash'),
+        'workdir': workdirs.get(match.group('hash'))
+        })
+    return(events)
+
+def scan_lsf_log(lsf_log, workdirs = None):
+    """
+    Scan the LSF log, which holds the console output of Nextflow, for the tasks that were retried or ignored after an error
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { 'retried': int, 'ignored': int, 'events': [ { 'event': str, 'process': str, ... }, ... ] }
+        where the counts are the number of unique log lines with 'error' and the message, the same as
+        grep error lsf.log | grep 'Execution is retried' | sort -u | wc -l
+    """
+    if workdirs == None:
+        workdirs = {}
+    data = map_file(lsf_log)
+    try:
+        lines = find_lines(data, [ RETRIED_MESSAGE, IGNORED_MESSAGE ])
+        # the lines are only unique within each message type
+        retried = sorted(set([ line for line in lines[RETRIED_MESSAGE] if b'error' in line ]))
+        ignored = sorted(set([ line for line in lines[IGNORED_MESSAGE] if b'error' in line ]))
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+    results = {
+    'retried': len(retried),
+    'ignored': len(ignored),
+    'events': task_error_events(retried, 'retried', workdirs) + task_error_events(ignored, 'ignored', workdirs)
+    }
+    return(results)
+
+def scan_nextflow_log(nextflow_log):
+    """
+    Scan the nextflow.log for the tasks that stopped the pipeline with an error
+
+    Output
+    ------
+    list:
+        a list of dicts in the format of [ { 'event': 'failed', 'process': str, 'exit': str|None, 'workdir': str|None }, ... ]
+    """
+    data = map_file(nextflow_log)
+    events = []
+    try:
+        position = data.find(FAILED_MESSAGE)
+        while position != -1:
+            start = position + len(FAILED_MESSAGE)
+            # the process name ends at the closing quote; a line cut off without one ends at the end of the line
+            line_stop = data.find(b'\n', start)
+            if line_stop == -1:
+                line_stop = len(data)
+            stop = data.find(b"'", start, line_stop)
+            if stop == -1:
+                stop = line_stop
+            process = data[start:stop].decode('utf-8', 'replace')
+            # the details of this error end where the next one starts
+            next_position = data.find(FAILED_MESSAGE, stop)
+            context_stop = min(stop + FAILED_CONTEXT_SIZE, next_position if next_position != -1 else len(data))
+            context = data[stop:context_stop]
+            exit_match = FAILED_EXIT_PATTERN.search(context)
+            workdir_match = FAILED_WORKDIR_PATTERN.search(context)
+            events.append({
+            'event': 'failed',
+            'process': process,
+            'exit': exit_match.group(1).decode('utf-8', 'replace') if exit_match else None,
+            'workdir': workdir_match.group(1).decode('utf-8', 'replace') if workdir_match else None
+            })
+            position = next_position
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+    return(events)
+
+def scan_trace(trace_file):
+    """
+    Get the number of tasks per status, and the work dir of each task, from a single read of the trace file
+
+    Output
+    ------
+    (status_counts, workdirs)
+
+    status_counts: list
+        a list of tuples in the format of [ (status, int), ... ] sorted by status
+    workdirs: dict
+        a dictionary in the format of { hash: workdir, ... }
+    """
+    if trace_file == None or not os.path.exists(trace_file):
+        return([], {})
+    header = calc_time.read_trace_header(trace_file)
+    columns = [ column for column in [ 'status', 'hash', 'workdir' ] if column in header ]
+    trace = calc_time.load_trace(trace_file, columns)
+    status_codes, statuses = calc_time.factorize(trace.get('status', []))
+    counts = np.bincount(status_codes, minlength = len(statuses)).tolist()
+    status_counts = sorted(zip(statuses, counts))
+    workdirs = {}
+    if 'hash' in trace and 'workdir' in trace:
+        workdirs = dict(zip(trace['hash'], trace['workdir']))
+    return(status_counts, workdirs)
+
+def check_errors(config, work_dir = None):
+    """
+    Run all the checks for errors in the pipeline output and logs
+
+    Parameters
+    ----------
+    config: dict
+        the pipeline config.json
+    work_dir: str|None
+        the Nextflow work dir; defaults to 'work' in the pipeline dir
+
+    Output
+    ------
+    dict:
+        the results of all the checks
+    """
+    pipeline_dir = config.get('pipeline_dir') or os.path.realpath('.')
+    if work_dir == None:
+        work_dir = os.path.join(pipeline_dir, 'work')
+
+    # one cache file in the pipeline dir for both dirs, so that nothing is written into the output or the work dir
+    search_dirs = [ search_dir for search_dir in [ config.get('output_dir'), work_dir ] if search_dir != None and os.path.isdir(search_dir) ]
+    cache_file = os.path.join(pipeline_dir, bam_check.CACHE_FILE)
+    if any([ bam_check.is_inside(cache_file, search_dir) for search_dir in search_dirs ]):
+        cache_file = None
+
+    def truncated_bams(search_dir):
+        if search_dir not in search_dirs:
+            return([])
+        return(bam_check.check_bams(search_dir, cache_file))
+
+    status_counts, workdirs = scan_trace(config.get('nextflow_trace'))
+    lsf_results = scan_lsf_log(config.get('lsf_log'), workdirs)
+    results = {
+    'output_bams': [ { 'path': path, 'error': error } for path, error in truncated_bams(config.get('output_dir')) ],
+    'work_bams': [ { 'path': path, 'error': error } for path, error in truncated_bams(work_dir) ],
+    'statuses': dict(status_counts),
+    'retried': lsf_results['retried'],
+    'ignored': lsf_results['ignored'],
+    'events': scan_nextflow_log(config.get('nextflow_log')) + lsf_results['events']
+    }
+    return(results)
+
+def format_errors(results):
+    """
+    Create the error message text from the results of check_errors()
+    """
+    message = ".bam files with potential errors in output dir:\n{num_bams}\n\n".format(num_bams = len(results['output_bams']))
+    message += ".bam files with potential errors in work dir:\n{num_bams}\n\n".format(num_bams = len(results['work_bams']))
+    message += "Pipeline Task Breakdown:\n"
+    for status, count in sorted(results['statuses'].items()):
+        message += "{count} {status}\n".format(count = count, status = status)
+    message += "\n"
+    message += "{num_tasks} Total Retried Tasks\n".format(num_tasks = results['retried'])
+    message += "{num_tasks} Total Ignored Tasks\n".format(num_tasks = results['ignored'])
+
+    failed = [ event for event in results['events'] if event['event'] == 'failed' ]
+    if len(failed) > 0:
+        message += "\nFailed Tasks:\n"
+        for event in failed:
+            message += "{process}: exit status {exit} (work dir: {workdir})\n".format(process = event['process'], exit = event['exit'] or '-', workdir = event['workdir'] or '-')
+
+    ignored = [ event for event in results['events'] if event['event'] == 'ignored' ]
+    if len(ignored) > 0:
+        message += "\nIgnored Tasks:\n"
+        for event in ignored[:MAX_LISTED_TASKS]:
+            message += "{process}: exit status {exit} (work dir: {workdir})\n".format(process = event['process'], exit = event['exit'] or '-', workdir = event['workdir'] or '-')
+        if len(ignored) > MAX_LISTED_TASKS:
+            message += "... and {num_tasks} more\n".format(num_tasks = len(ignored) - MAX_LISTED_TASKS)
+    return(message)
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = 'Check the pipeline output and logs for errors')
+    parser.add_argument('config_json', nargs = '?', default = 'config.json', help = 'The pipeline config.json')
+    parser.add_argument('--work-dir', dest = 'work_dir', default = None, help = "The Nextflow work dir (default: 'work' in the pipeline dir)")
+    parser.add_argument('--json-output', dest = 'json_output', default = None, help = 'File to write the results to in JSON format')
+    args = parser.parse_args()
+
+    with open(args.config_json) as fin:
+        config = json.load(fin)
+    results = check_errors(config, args.work_dir)
+    if args.json_output:
+        with open(args.json_output, 'w') as fout:
+            json.dump(results, fout, indent = 4)
+    sys.stdout.write(format_errors(results))
+
+if __name__ == '__main__':
+    main()
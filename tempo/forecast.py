@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Estimate the time left until a running pipeline finishes, per sample and for the whole run
+
+Combines the tasks already finished in the trace file of the running pipeline with the durations of each process from the
+trace files of the earlier runs in the logs dir:
+- the history gives the median realtime of each process, the number of tasks of each process per sample,
+  and how many of a sample's tasks run at the same time (the parallelism)
+- the tasks still to run for each sample are the tasks expected from the history minus the tasks already finished
+- the time left for a sample is the realtime of its remaining tasks divided by the parallelism; the time left for the run
+  is the time left for the slowest sample, plus the remaining tasks that are not for any sample (e.g. the cohort aggregation)
+
+The history is saved to a cache file in the logs dir and the live trace file is read with the trace cache (see trace_cache.py),
+so that updating the estimate only reads the rows added since the last update
+
+$ ./forecast.py logs/2020-04-21_12-43-46/trace.txt mapping.tsv
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+import calc_time
+import mem_convert
+
+HISTORY_CACHE_FILE = '.forecast.history.json'
+
+# the statuses of the tasks that do not need to run again
+DONE_STATUSES = [ 'COMPLETED', 'CACHED' ]
+
+def expand_tag_samples(tags, sample_ids):
+    """
+    Expand the rows into one (row, sample) pair for each sample found in the row's tag
+
+    Output
+    ------
+    (rows, sample_codes, num_samples)
+
+    rows: numpy.ndarray
+        the row of each pair
+    sample_codes: numpy.ndarray
+        the index in sample_ids of the sample of each pair
+    num_samples: numpy.ndarray
+        the number of samples found in the tag of each row
+    """
+    sample_index = calc_time.build_sample_index(sample_ids)
+    sample_codes = dict( (sample_id, code) for code, sample_id in enumerate(sample_ids) )
+    tag_codes, unique_tags = calc_time.factorize(tags)
+    tag_samples = [ sorted([ sample_codes[sample_id] for sample_id in calc_time.tag_sample_ids(tag, sample_index) ]) for tag in unique_tags ]
+    tag_num_samples = np.array([ len(codes) for codes in tag_samples ], dtype = np.int64)
+    num_samples = tag_num_samples[tag_codes] if len(tags) > 0 else np.zeros(0, dtype = np.int64)
+    rows = np.repeat(np.arange(len(tags)), num_samples)
+    codes = np.array([ code for tag_code in tag_codes for code in tag_samples[tag_code] ], dtype = np.int64)
+    return(rows, codes, num_samples)
+
+def union_length(starts, stops):
+    """
+    Get the total length of the union of a set of intervals
+    """
+    if len(starts) == 0:
+        return(0)
+    order = np.argsort(starts, kind = 'stable')
+    starts = starts[order]
+    stops = np.maximum.accumulate(stops[order])
+    # the part of each interval that is past the end of all the intervals before it
+    previous_stops = np.concatenate(([ starts[0] ], stops[:-1]))
+    return(int(np.sum(np.maximum(stops - np.maximum(starts, previous_stops), 0))))
+
+def task_realtimes(trace):
+    """
+    Get the realtime of each task in seconds, from the 'realtime' column, or from 'submit' to 'complete' when it is missing
+    """
+    realtime = mem_convert.parse_column(trace['realtime'], 'duration').astype(np.float64).filled(np.nan) / 1000.0 if 'realtime' in trace else np.full(calc_time.trace_rows(trace), np.nan)
+    valid = (trace['submit'] != calc_time.MISSING_TIMESTAMP) & (trace['complete'] != calc_time.MISSING_TIMESTAMP)
+    elapsed = np.where(valid, (trace['complete'] - trace['submit']) / 1000000.0, np.nan)
+    return(np.where(np.isnan(realtime), elapsed, realtime))
+
+def trace_columns(trace_files):
+    """
+    Get the columns to load from all the trace files; the process name comes from the 'name' column if any trace file lacks 'process'
+    """
+    headers = [ calc_time.read_trace_header(trace_file) for trace_file in trace_files ]
+    columns = calc_time.INTERVAL_COLUMNS + [ 'tag' ]
+    columns.append('process' if all([ 'process' in header for header in headers ]) else 'name')
+    if all([ 'realtime' in header for header in headers ]):
+        columns.append('realtime')
+    return(columns)
+
+def calculate_history(trace_files, sample_ids):
+    """
+    Calculate the duration of each process and the number of tasks per sample from the trace files of earlier runs
+
+    Parameters
+    ----------
+    trace_files: list
+        paths to the Nextflow trace.txt files of the earlier runs, oldest run first
+    sample_ids: list
+        a list of sample ID's
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of
+        { 'processes': { process: { 'median_seconds': float, 'p90_seconds': float, 'tasks_per_sample': float, 'run_tasks': int }, ... },
+        'parallelism': float, 'runs': int, 'tasks': int }
+    """
+    history = { 'processes': {}, 'parallelism': 1.0, 'runs': len(trace_files), 'tasks': 0 }
+    if len(trace_files) == 0:
+        return(history)
+    trace = calc_time.load_runs_trace(trace_files, trace_columns(trace_files))
+    done = np.flatnonzero(np.isin(trace['status'], DONE_STATUSES))
+    trace = dict( (column, values[done]) for column, values in trace.items() )
+    history['tasks'] = len(done)
+    if len(done) == 0:
+        return(history)
+
+    processes = calc_time.get_process_names(None, trace)
+    realtimes = task_realtimes(trace)
+    process_codes, unique_processes = calc_time.factorize(processes)
+    rows, sample_codes, num_samples = expand_tag_samples(trace['tag'], sample_ids)
+    # the samples that show up in the history, to get the number of tasks per sample
+    num_history_samples = max(len(np.unique(sample_codes)), 1)
+    sample_tasks = np.bincount(process_codes[rows], minlength = len(unique_processes))
+    run_tasks = np.bincount(process_codes[num_samples == 0], minlength = len(unique_processes))
+    for code, process in enumerate(unique_processes):
+        values = realtimes[process_codes == code]
+        values = values[~np.isnan(values)]
+        history['processes'][process] = {
+        'median_seconds': float(np.median(values)) if len(values) > 0 else 0.0,
+        'p90_seconds': float(np.percentile(values, 90)) if len(values) > 0 else 0.0,
+        'tasks_per_sample': float(sample_tasks[code]) / num_history_samples,
+        'run_tasks': int(run_tasks[code])
+        }
+
+    # the parallelism of each sample is the realtime of all its tasks over the time that any of its tasks were running
+    ratios = []
+    complete = trace['complete'][rows]
+    realtime_us = np.nan_to_num(realtimes[rows]) * 1000000
+    valid = complete != calc_time.MISSING_TIMESTAMP
+    order = np.argsort(sample_codes, kind = 'stable')
+    boundaries = np.flatnonzero(np.diff(sample_codes[order])) + 1
+    for group in np.split(order, boundaries) if len(order) > 0 else []:
+        group = group[valid[group]]
+        wall = union_length((complete[group] - realtime_us[group]).astype(np.int64), complete[group])
+        if wall > 0:
+            ratios.append(realtime_us[group].sum() / wall)
+    if len(ratios) > 0:
+        history['parallelism'] = max(float(np.median(ratios)), 1.0)
+    return(history)
+
+def load_history(trace_files, sample_ids, cache_file = None):
+    """
+    Get the history from the cache file if none of the trace files or samples changed since it was saved,
+    otherwise calculate it and save it to the cache file, see calculate_history()
+    """
+    identity = {
+    'trace_files': [ [ os.path.realpath(trace_file), os.stat(trace_file).st_size, os.stat(trace_file).st_mtime_ns ] for trace_file in trace_files ],
+    'samples': sorted(sample_ids)
+    }
+    if cache_file != None and os.path.exists(cache_file):
+        try:
+            with open(cache_file) as fin:
+                cached = json.load(fin)
+            if cached.get('identity') == identity:
+                return(cached['history'])
+        except (OSError, IOError, ValueError, KeyError):
+            pass
+    history = calculate_history(trace_files, sample_ids)
+    if cache_file != None:
+        temp_file = '{path}.{pid}.tmp'.format(path = cache_file, pid = os.getpid())
+        try:
+            with open(temp_file, 'w') as fout:
+                json.dump({ 'identity': identity, 'history': history }, fout)
+            os.rename(temp_file, cache_file)
+        except (OSError, IOError):
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+    return(history)
+
+def find_history_traces(trace_file, log_dir = None):
+    """
+    Find the trace files of the earlier runs in the logs dir, which is the parent dir of the run's log dir by default
+    """
+    if log_dir == None:
+        log_dir = os.path.dirname(os.path.dirname(os.path.realpath(trace_file)))
+    live = os.path.realpath(trace_file)
+    return([ path for path in calc_time.find_run_traces(log_dir) if os.path.realpath(path) != live ])
+
+def forecast(trace_file, sample_ids, history, now = None):
+    """
+    Estimate the time left for each sample and for the whole run
+
+    Parameters
+    ----------
+    trace_file: str|None
+        path to the trace.txt file of the running pipeline; None or a missing file is the same as a run that has not started
+    sample_ids: list
+        a list of sample ID's
+    history: dict
+        the history returned by load_history()
+    now: float|None
+        the current time as seconds since the epoch; defaults to the current time
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of
+        { 'remaining_seconds': float, 'eta': str, 'done_tasks': int, 'failed_tasks': int, 'elapsed_seconds': float|None,
+        'samples': [ { 'sample': str, 'done_tasks': int, 'remaining_tasks': float, 'remaining_seconds': float }, ... ] }
+        with the samples with the most time left first
+    """
+    if now == None:
+        now = time.time()
+    process_names = list(history['processes'].keys())
+    process_lookup = dict( (process, code) for code, process in enumerate(process_names) )
+    num_processes = len(process_names)
+    num_samples = len(sample_ids)
+    median_seconds = np.array([ history['processes'][process]['median_seconds'] for process in process_names ], dtype = np.float64)
+    tasks_per_sample = np.array([ history['processes'][process]['tasks_per_sample'] for process in process_names ], dtype = np.float64)
+    run_tasks = np.array([ history['processes'][process]['run_tasks'] for process in process_names ], dtype = np.float64)
+
+    # the finished tasks per process per sample, and per process for the tasks without samples
+    done_sample_tasks = np.zeros((num_processes, num_samples))
+    done_run_tasks = np.zeros(num_processes)
+    done_tasks = 0
+    failed_tasks = 0
+    elapsed_seconds = None
+    if trace_file != None and os.path.exists(trace_file):
+        header = calc_time.read_trace_header(trace_file)
+        trace = calc_time.load_trace(trace_file, calc_time.INTERVAL_COLUMNS + [ 'tag', 'process' if 'process' in header else 'name' ])
+        failed_tasks = int(np.sum(trace['status'] == 'FAILED'))
+        submit = trace['submit'][trace['submit'] != calc_time.MISSING_TIMESTAMP]
+        if len(submit) > 0:
+            # the trace timestamps are local times counted as UTC, so the current time has to be on the same scale
+            elapsed_seconds = max(calc_time.local_timestamp(now) - submit.min() / 1000000.0, 0.0)
+        done = np.flatnonzero(np.isin(trace['status'], DONE_STATUSES))
+        done_tasks = len(done)
+        processes = calc_time.get_process_names(None, trace)[done]
+        process_codes, unique_processes = calc_time.factorize(processes)
+        # processes that are not in the history are left out, since there is nothing to expect for them
+        history_codes = np.array([ process_lookup.get(process, -1) for process in unique_processes ], dtype = np.int64)[process_codes] if len(done) > 0 else np.zeros(0, dtype = np.int64)
+        rows, sample_codes, num_tag_samples = expand_tag_samples(trace['tag'][done], sample_ids)
+        known = history_codes[rows] >= 0
+        np.add.at(done_sample_tasks, (history_codes[rows][known], sample_codes[known]), 1)
+        run_rows = (num_tag_samples == 0) & (history_codes >= 0)
+        done_run_tasks = np.bincount(history_codes[run_rows], minlength = num_processes).astype(np.float64)
+
+    remaining_sample_tasks = np.maximum(tasks_per_sample[:, None] - done_sample_tasks, 0)
+    remaining_sample_seconds = (remaining_sample_tasks * median_seconds[:, None]).sum(axis = 0) / history['parallelism']
+    remaining_run_seconds = (np.maximum(run_tasks - done_run_tasks, 0) * median_seconds).sum() / history['parallelism']
+    remaining_seconds = float((remaining_sample_seconds.max() if num_samples > 0 else 0.0) + remaining_run_seconds)
+
+    samples = []
+    for code, sample_id in enumerate(sample_ids):
+        samples.append({
+        'sample': sample_id,
+        'done_tasks': int(done_sample_tasks[:, code].sum()),
+        'remaining_tasks': round(float(remaining_sample_tasks[:, code].sum()), 1),
+        'remaining_seconds': round(float(remaining_sample_seconds[code]), 1)
+        })
+    samples = sorted(samples, key = lambda record: record['remaining_seconds'], reverse = True)
+    result = {
+    'remaining_seconds': round(remaining_seconds, 1),
+    'eta': datetime.fromtimestamp(now + remaining_seconds).strftime('%Y-%m-%d %H:%M:%S'),
+    'done_tasks': done_tasks,
+    'failed_tasks': failed_tasks,
+    'elapsed_seconds': round(elapsed_seconds, 1) if elapsed_seconds != None else None,
+    'history_runs': history['runs'],
+    'samples': samples
+    }
+    return(result)
+
+def forecast_run(trace_file, mapping_file, log_dir = None, history_files = None, now = None):
+    """
+    Load the samples and the history, then estimate the time left; see forecast()
+
+    Parameters
+    ----------
+    trace_file: str
+        path to the trace.txt file of the running pipeline
+    mapping_file: str
+        path to the Tempo mapping file
+    log_dir: str|None
+        the logs dir with the earlier runs, which is also where the history cache is saved; defaults to the parent dir of the run's log dir
+    history_files: list|None
+        the trace files to use as the history instead of the earlier runs in the logs dir
+    """
+    if log_dir == None:
+        log_dir = os.path.dirname(os.path.dirname(os.path.realpath(trace_file)))
+    sample_ids = calc_time.load_samples(mapping_file)
+    if history_files == None:
+        history_files = find_history_traces(trace_file, log_dir)
+    cache_file = os.path.join(log_dir, HISTORY_CACHE_FILE) if os.path.isdir(log_dir) else None
+    history = load_history(history_files, sample_ids, cache_file)
+    return(forecast(trace_file, sample_ids, history, now))
+
+def format_forecast(result, top = 10):
+    """
+    Create a pretty printed message about the time left for the run and the samples with the most time left
+    """
+    def duration(seconds):
+        return(str(timedelta(seconds = int(round(seconds)))))
+
+    if result['history_runs'] == 0:
+        return("No earlier runs to estimate the time left from\n")
+    message = "Estimated time left: {remaining} (finishing around {eta})\n".format(remaining = duration(result['remaining_seconds']), eta = result['eta'])
+    message += "Finished tasks: {done_tasks} ({failed_tasks} failed)".format(done_tasks = result['done_tasks'], failed_tasks = result['failed_tasks'])
+    if result['elapsed_seconds'] != None:
+        message += ", running for {elapsed}".format(elapsed = duration(result['elapsed_seconds']))
+    message += "\n"
+    samples = [ record for record in result['samples'] if record['remaining_seconds'] > 0 ][:top]
+    if len(samples) > 0:
+        message += "\nSamples with the most time left:\n"
+        for record in samples:
+            message += "{sample}: {remaining} ({remaining_tasks} tasks left)\n".format(sample = record['sample'], remaining = duration(record['remaining_seconds']), remaining_tasks = record['remaining_tasks'])
+    return(message)
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = 'Estimate the time left until a running pipeline finishes, per sample and for the whole run')
+    parser.add_argument('trace_file', help = 'The Nextflow trace file of the running pipeline')
+    parser.add_argument('mapping_file', nargs = '?', default = 'mapping.tsv', help = 'The Tempo mapping file to read sample IDs from')
+    parser.add_argument('--log-dir', dest = 'log_dir', default = None, help = 'The logs dir with the earlier runs (default: the parent dir of the run log dir)')
+    parser.add_argument('--history', dest = 'history_files', nargs = '+', default = None, help = 'Trace files to use as the history instead of the earlier runs in the logs dir')
+    parser.add_argument('--top', type = int, default = 10, help = 'Number of samples to list')
+    parser.add_argument('--format', dest = 'output_format', default = 'text', choices = [ 'text', 'json' ], help = 'Output format')
+    parser.add_argument('--interval', type = float, default = 60.0, help = 'Number of seconds to wait between updates with --count')
+    parser.add_argument('--count', type = int, default = 1, help = 'Number of updates to run before exiting; 0 runs until interrupted')
+    args = parser.parse_args()
+
+    num_updates = 0
+    while True:
+        result = forecast_run(args.trace_file, args.mapping_file, args.log_dir, args.history_files)
+        if args.output_format == 'json':
+            print(json.dumps(result, indent = 4))
+        else:
+            if args.count != 1:
+                print(">>> {timestamp}".format(timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            sys.stdout.write(format_forecast(result, args.top))
+        sys.stdout.flush()
+        num_updates += 1
+        if args.count > 0 and num_updates >= args.count:
+            break
+        time.sleep(args.interval)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Post the pipeline status messages and upload files to the project's Jira issue
+
+Replaces the chain of 'make jira-comment' and 'make jira-upload' calls, which each start a new shell, read jira.json again,
+and open a new connection with curl; here the comment and the file uploads are sent at the same time over connections
+that are kept open between requests, and requests that fail because of the network or a busy server are retried
+with increasing waits. This matters most when the pipeline is being killed, since LSF only gives the job a short time
+to shut down before it is killed for good
+
+A request is only sent again when the server cannot have acted on it, so that a comment is never posted twice;
+see JiraClient.request() for the rule
+
+The message bodies are made by message.py, so the CONFIG_JSON environment variable must be set the same as for message.py
+
+$ ./jira_client.py started --upload mapping.tsv --upload pairing.tsv
+$ ./jira_client.py exit-state --upload logs/2020-04-21_12-43-46/nextflow.html
+"""
+import os
+import sys
+import json
+import time
+import base64
+import uuid
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+JIRA_URL = 'http://plvpipetrack1.mskcc.org:8090'
+JIRA_CREDENTIALS_FILE = '/juno/work/ci/roslin-internal-services/Connect.txt'
+
+# HTTP status codes for requests that the server turned away without acting on them, which are safe to send again
+RETRY_STATUSES = [ 429, 503 ]
+
+# errors from a kept-alive connection that the server closed while it was idle, before it read the request
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+MESSAGE_TYPES = [ 'started', 'success', 'failed', 'killed' ]
+
+class JiraError(Exception):
+    """
+    A request to Jira failed and was not retried, or failed on every retry
+    """
+    def __init__(self, message, status = None):
+        super(JiraError, self).__init__(message)
+        self.status = status
+
+class JiraClient(object):
+    """
+    Send requests to the Jira REST API over connections that are kept open between requests
+
+    http.client connections can only be used by one thread at a time, so each thread gets its own connection,
+    which it keeps for all of its requests
+    """
+    def __init__(self, url, username, password, timeout = 60, retries = 4, backoff = 1.0):
+        """
+        Parameters
+        ----------
+        url: str
+            the base URL of the Jira server, e.g. 'http://plvpipetrack1.mskcc.org:8090'
+        username: str
+        password: str
+        timeout: float
+            seconds to wait for the server on each request
+        retries: int
+            the number of times to try a failed request again
+        backoff: float
+            seconds to wait before the first retry; the wait doubles with each retry
+        """
+        parts = urlsplit(url)
+        self.scheme = parts.scheme or 'http'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        credentials = '{username}:{password}'.format(username = username, password = password)
+        self.auth_header = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def connection(self):
+        """
+        Get the open connection of the current thread, or open a new one
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection == None:
+            connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(self.host, self.port, timeout = self.timeout)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return(connection)
+
+    def reset_connection(self):
+        """
+        Close the connection of the current thread after an error, so that the next request opens a new one
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection != None:
+            connection.close()
+            self.local.connection = None
+
+    def close(self):
+        """
+        Close all the connections
+        """
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *args):
+        self.close()
+        return(False)
+
+    def retry_wait(self, attempt, retry_after = None):
+        """
+        Get the seconds to wait before the next try; the server's 'Retry-After' is used if it sent one
+        """
+        if retry_after != None and retry_after.isdigit():
+            return(float(retry_after))
+        # jitter keeps the concurrent requests from all retrying at the same moment
+        return(self.backoff * (2 ** attempt) * (0.5 + random.random() / 2))
+
+    def request(self, method, path, body = None, headers = None):
+        """
+        Send a request and get the decoded JSON response, trying again when the request did not reach the server
+
+        The requests are not idempotent (a comment that is sent twice is posted twice), so a request is only sent again if:
+        - the connection to the server could not be opened, so nothing was sent
+        - a kept-alive connection turned out to have been closed by the server while it was idle (STALE_CONNECTION_ERRORS),
+          so the server never read the request
+        - the server answered with one of RETRY_STATUSES (429 Too Many Requests, 503 Service Unavailable), which it sends
+          without acting on the request
+        Any other error after the request was sent, such as a timeout waiting for the response or a 500, is raised right away,
+        since the server may already have acted on it
+
+        Parameters
+        ----------
+        method: str
+            the HTTP method, e.g. 'POST'
+        path: str
+            the path of the REST API endpoint, e.g. '/rest/api/2/issue/CT-123/comment'
+        body: bytes|None
+            the request body
+        headers: dict|None
+            more request headers
+
+        Output
+        ------
+        dict|list|None:
+            the JSON response, or None if the response was empty
+        """
+        request_headers = { 'Authorization': self.auth_header, 'Accept': 'application/json' }
+        request_headers.update(headers or {})
+        error = None
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            try:
+                connection = self.connection()
+                reused = connection.sock != None
+                if not reused:
+                    connection.connect()
+            except (OSError, http.client.HTTPException) as e:
+                self.reset_connection()
+                error = JiraError("{method} {path} could not connect: {error}".format(method = method, path = path, error = e))
+            else:
+                try:
+                    connection.request(method, self.base_path + path, body = body, headers = request_headers)
+                    response = connection.getresponse()
+                    data = response.read()
+                except (OSError, http.client.HTTPException) as e:
+                    self.reset_connection()
+                    error = JiraError("{method} {path} failed: {error}".format(method = method, path = path, error = e))
+                    if not (reused and isinstance(e, STALE_CONNECTION_ERRORS)):
+                        raise error
+                else:
+                    if response.getheader('Connection', '').lower() == 'close':
+                        self.reset_connection()
+                    if response.status < 300:
+                        return(json.loads(data.decode('utf-8')) if len(data) > 0 else None)
+                    error = JiraError("{method} {path} failed with HTTP {status}: {data}".format(
+                        method = method, path = path, status = response.status, data = data.decode('utf-8', 'replace')[:500]), response.status)
+                    if response.status not in RETRY_STATUSES:
+                        raise error
+                    retry_after = response.getheader('Retry-After')
+            if attempt < self.retries:
+                time.sleep(self.retry_wait(attempt, retry_after))
+        raise error
+
+    def create_issue(self, project_key, summary, description = 'Description goes here'):
+        """
+        Create a new 'Task' issue on a board and get its key, e.g. 'CT-123'
+        """
+        data = { 'fields': { 'project': { 'key': project_key }, 'summary': summary, 'issuetype': { 'name': 'Task' }, 'description': description } }
+        return(self.request('POST', '/rest/api/2/issue/', json.dumps(data).encode('utf-8'), { 'Content-Type': 'application/json' }))
+
+    def comment(self, issue, data):
+        """
+        Add a comment to an issue
+
+        Parameters
+        ----------
+        issue: str
+            the key of the issue, e.g. 'CT-123'
+        data: dict
+            the comment in the format of { 'body': str }, see message.make_body()
+        """
+        path = '/rest/api/2/issue/{issue}/comment'.format(issue = issue)
+        return(self.request('POST', path, json.dumps(data).encode('utf-8'), { 'Content-Type': 'application/json' }))
+
+    def upload(self, issue, file_path):
+        """
+        Attach a file to an issue
+        """
+        with open(file_path, 'rb') as fin:
+            contents = fin.read()
+        boundary = uuid.uuid4().hex
+        body = b''.join([
+            '--{boundary}\r\n'.format(boundary = boundary).encode('utf-8'),
+            'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'.format(name = os.path.basename(file_path).replace('"', '')).encode('utf-8'),
+            b'Content-Type: application/octet-stream\r\n\r\n',
+            contents,
+            '\r\n--{boundary}--\r\n'.format(boundary = boundary).encode('utf-8')
+            ])
+        headers = { 'Content-Type': 'multipart/form-data; boundary={boundary}'.format(boundary = boundary), 'X-Atlassian-Token': 'nocheck' }
+        path = '/rest/api/2/issue/{issue}/attachments'.format(issue = issue)
+        return(self.request('POST', path, body, headers))
+
+def load_credentials(credentials_file):
+    """
+    Get the Jira username and password from the first two lines of the credentials file
+    """
+    with open(credentials_file) as fin:
+        lines = fin.read().splitlines()
+    return(lines[0].strip(), lines[1].strip())
+
+def load_issue(jira_config):
+    """
+    Get the key of the project's Jira issue from the jira.json saved by 'make jira-create'
+    """
+    with open(jira_config) as fin:
+        return(json.load(fin)['key'])
+
+def exit_state_message_type(exitcode_file):
+    """
+    Get the message type for the exit code of the pipeline, the same as 'make jira-check-exit-state'
+    """
+    with open(exitcode_file) as fin:
+        code = fin.readline().strip()
+    return('success' if code == '0' else 'failed')
+
+def send_messages(client, issue, data = None, upload_files = None, threads = 4):
+    """
+    Post a comment and upload files to an issue, all at the same time
+
+    Parameters
+    ----------
+    client: JiraClient
+    issue: str
+        the key of the issue
+    data: dict|None
+        the comment, or None to only upload the files
+    upload_files: list|None
+        the files to attach; files that do not exist are skipped
+    threads: int
+        the number of requests to send at the same time
+
+    Output
+    ------
+    list:
+        the errors for the requests that failed, in the format of [ (description, error), ... ]
+    """
+    tasks = []
+    if data != None:
+        tasks.append(('comment', lambda: client.comment(issue, data)))
+    for upload_file in upload_files or []:
+        if not os.path.exists(upload_file):
+            sys.stderr.write("ERROR: File does not exist; {path}\n".format(path = upload_file))
+            continue
+        tasks.append(('upload ' + upload_file, lambda upload_file = upload_file: client.upload(issue, upload_file)))
+
+    def run(task):
+        description, func = task
+        try:
+            func()
+            return(None)
+        except (JiraError, OSError) as e:
+            return((description, e))
+
+    if len(tasks) == 0:
+        return([])
+    with ThreadPoolExecutor(max_workers = max(min(threads, len(tasks)), 1)) as executor:
+        errors = [ error for error in executor.map(run, tasks) if error != None ]
+    return(errors)
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = "Post a pipeline status message and upload files to the project's Jira issue")
+    parser.add_argument('message_type', choices = MESSAGE_TYPES + [ 'exit-state', 'none' ], help = "The message to post; 'exit-state' picks 'success' or 'failed' from the pipeline exit code, 'none' only uploads files")
+    parser.add_argument('--upload', dest = 'upload_files', action = 'append', default = [], help = 'A file to attach to the issue; can be given several times')
+    parser.add_argument('--message-output', dest = 'message_output', default = None, help = 'File to save the message body to in JSON format')
+    parser.add_argument('--jira-config', dest = 'jira_config', default = 'jira.json', help = 'The jira.json file with the key of the issue')
+    parser.add_argument('--issue', default = None, help = 'The key of the issue (default: read from --jira-config)')
+    parser.add_argument('--exitcode-file', dest = 'exitcode_file', default = os.environ.get('PIPELINE_EXITCODE_FILE', '.exitcode'), help = "The pipeline exit code file for 'exit-state'")
+    parser.add_argument('--url', default = os.environ.get('JIRA_URL', JIRA_URL), help = 'The Jira server URL')
+    parser.add_argument('--credentials-file', dest = 'credentials_file', default = os.environ.get('JIRA_CREDENTIALS_FILE', JIRA_CREDENTIALS_FILE), help = 'File with the Jira username and password on the first two lines')
+    parser.add_argument('--retries', type = int, default = 4, help = 'Number of times to try a failed request again')
+    parser.add_argument('--timeout', type = float, default = 60, help = 'Seconds to wait for the server on each request')
+    args = parser.parse_args()
+
+    message_type = args.message_type
+    if message_type == 'exit-state':
+        message_type = exit_state_message_type(args.exitcode_file)
+    data = None
+    if message_type != 'none':
+        # message.py reads the config.json when it is imported
+        import message
+        data = message.make_body(getattr(message, message_type))
+        if args.message_output != None:
+            with open(args.message_output, 'w') as fout:
+                fout.write(json.dumps(data, indent = 4) + '\n')
+
+    issue = args.issue if args.issue != None else load_issue(args.jira_config)
+    username, password = load_credentials(args.credentials_file)
+    with JiraClient(args.url, username, password, timeout = args.timeout, retries = args.retries) as client:
+        errors = send_messages(client, issue, data, args.upload_files)
+    for description, error in errors:
+        sys.stderr.write("ERROR: {description}: {error}\n".format(description = description, error = error))
+    if len(errors) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
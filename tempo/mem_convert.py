@@ -1,24 +1,84 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
 Script for converting KB, MB, GB values to Bytes
 https://stackoverflow.com/questions/42865724/python-parse-human-readable-filesizes-into-bytes
 
+Also converts the other value formats from the Nextflow trace.txt file; durations such as '1h 2m 3s' to milliseconds,
+percentages such as '85.3%' to numbers, and timestamps to epoch microseconds.
+Whole trace columns can be converted at once with parse_column(), which parses each unique value only once
+
 $ cut -f14 logs/2020-04-24_21-22-31/trace.txt | tail -n +2 | ./mem_convert.py
 
-$ ./mem_convert.py '4 GB' '8 GB' "1MB" "4GB" "10.5 KB"
+$ cut -f20 logs/2020-04-24_21-22-31/trace.txt | tail -n +2 | ./mem_convert.py --type duration
+
+$ ./mem_convert.py '4 GB' '8 GB' "1MB" "4GB" "10.5 KB" "2 GiB"
 """
 import sys
 import re
+import argparse
+import itertools
+import numpy as np
+import profiling
 
 units = {
     "B": 1,
     "KB": 10**3,
     "MB": 10**6,
     "GB": 10**9,
-    "TB": 10**12
+    "TB": 10**12,
+    "PB": 10**15,
+    "KIB": 2**10,
+    "MIB": 2**20,
+    "GIB": 2**30,
+    "TIB": 2**40,
+    "PIB": 2**50
+}
+
+# milliseconds per unit of the durations in the trace file
+duration_units = {
+    "ms": 1,
+    "s": 1000,
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000
+}
+
+SIZE_PATTERN = re.compile(r'^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*([KMGTP]?I?B)?\s*$', re.IGNORECASE)
+DURATION_PATTERN = re.compile(r'([0-9]*\.?[0-9]+)\s*(ms|d|h|m|s)')
+DURATION_FORMAT_PATTERN = re.compile(r'^\s*(?:[0-9]*\.?[0-9]+\s*(?:ms|d|h|m|s)\s*)+$')
+
+# value used in the int64 timestamp arrays for '-' and other unparseable timestamps
+MISSING_TIMESTAMP = np.iinfo(np.int64).min
+
+# the type of value held in each column of the trace file
+COLUMN_TYPES = {
+    'memory': 'size',
+    'disk': 'size',
+    'rss': 'size',
+    'vmem': 'size',
+    'peak_rss': 'size',
+    'peak_vmem': 'size',
+    'rchar': 'size',
+    'wchar': 'size',
+    'read_bytes': 'size',
+    'write_bytes': 'size',
+    'time': 'duration',
+    'duration': 'duration',
+    'realtime': 'duration',
+    '%cpu': 'percent',
+    '%mem': 'percent',
+    'submit': 'timestamp',
+    'start': 'timestamp',
+    'complete': 'timestamp'
 }
 
+# number of lines to read from stdin at a time
+STREAM_CHUNK_SIZE = 65536
+
+# most unique values to remember while reading from stdin, to keep memory use constant
+STREAM_CACHE_SIZE = 1000000
+
 def parse_size(size):
     """
     Convert human readable bytes sizes into interger number of bytes
@@ -26,13 +86,18 @@ def parse_size(size):
     Parameters
     ----------
     size: str
-        a string denoting the size
+        a string denoting the size; a number without a unit is taken as bytes, as in traces written with 'trace.raw = true'
 
     Output
     ------
     int
         the integer size in bytes
 
+    Raises
+    ------
+    ValueError
+        if the size could not be parsed, such as the '-' placeholders in the trace file
+
     Examples
     --------
 
@@ -44,29 +109,355 @@ def parse_size(size):
 
     >>> parse_size('10.5 KB')
     10500
+
+    >>> parse_size('2 GiB')
+    2147483648
+    """
+    match = SIZE_PATTERN.match(size)
+    if not match:
+        raise ValueError("could not parse size: {0!r}".format(size))
+    number, unit = match.groups()
+    return int(float(number)*units[(unit or 'B').upper()])
+
+def parse_duration(duration):
+    """
+    Convert a Nextflow duration into an integer number of milliseconds
+
+    Parameters
+    ----------
+    duration: str
+        a string denoting the duration; a number without a unit is taken as milliseconds, as in traces written with 'trace.raw = true'
+
+    Output
+    ------
+    int
+        the duration in milliseconds
+
+    Raises
+    ------
+    ValueError
+        if the duration could not be parsed
+
+    Examples
+    --------
+
+    >>> parse_duration('1h 2m 3s')
+    3723000
+
+    >>> parse_duration('250ms')
+    250
+
+    >>> parse_duration('1.5s')
+    1500
     """
-    size = size.upper()
-    if not re.match(r' ', size):
-        # try to split the unit apart from the number
-        size = re.sub(r'([KMGT]?B)', r' \1', size)
-    number, unit = [string.strip() for string in size.split()]
-    return int(float(number)*units[unit])
+    if duration.isdigit():
+        return(int(duration))
+    if not DURATION_FORMAT_PATTERN.match(duration):
+        raise ValueError("could not parse duration: {0!r}".format(duration))
+    return(int(round(sum([ float(number) * duration_units[unit] for number, unit in DURATION_PATTERN.findall(duration) ]))))
 
+def parse_percent(percent):
+    """
+    Convert a percentage such as '85.3%' into a number
+
+    Examples
+    --------
+
+    >>> parse_percent('85.3%')
+    85.3
+    """
+    return(float(percent.strip().rstrip('%')))
+
+@profiling.profiled(rows = len)
+def parse_timestamps(timestamps):
+    """
+    Convert a sequence of trace file timestamps into epoch microseconds
+
+    Human readable timestamps in the format '%Y-%m-%d %H:%M:%S.%f' are parsed with a fixed-width parser
+    over the character codes of all values at once, instead of calling strptime on every value.
+    Values that are all digits are treated as the epoch millisecond times from 'trace.raw = true'
+
+    Parameters
+    ----------
+    timestamps: list
+        a list of timestamp strings
+
+    Output
+    ------
+    numpy.ndarray
+        an int64 array of epoch microseconds, with MISSING_TIMESTAMP for values that could not be parsed
+
+    Examples
+    --------
+
+    >>> parse_timestamps(['1970-01-02 00:00:01.5', '-', '1000']).tolist() == [86401500000, MISSING_TIMESTAMP, 1000000]
+    True
+    """
+    values = np.asarray(timestamps, dtype = np.str_)
+    parsed = np.full(values.shape, MISSING_TIMESTAMP, dtype = np.int64)
+    if values.size == 0:
+        return(parsed)
+
+    # raw traces; epoch milliseconds
+    is_raw = np.char.isdigit(values)
+    if is_raw.any():
+        parsed[is_raw] = values[is_raw].astype(np.int64) * 1000
+
+    # human readable traces; 'YYYY-MM-DD HH:MM:SS.ffffff' with 1-6 fraction digits
+    width = values.dtype.itemsize // 4
+    if width < 21:
+        return(parsed)
+    chars = values.view(np.uint32).reshape(len(values), width).astype(np.int64)
+    digits = chars - ord('0')
+    is_digit = (digits >= 0) & (digits <= 9)
+
+    def number(start, stop):
+        result = np.zeros(len(values), dtype = np.int64)
+        for i in range(start, stop):
+            result = result * 10 + digits[:, i]
+        return(result)
+
+    valid = ~is_raw
+    for i in (0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18, 20):
+        valid &= is_digit[:, i]
+    for i, separator in ((4, '-'), (7, '-'), (10, ' '), (13, ':'), (16, ':'), (19, '.')):
+        valid &= chars[:, i] == ord(separator)
+
+    # fraction of a second; the run of digits after the '.' followed by the end of the string
+    fraction = digits[:, 20].copy()
+    scale = np.full(len(values), 100000, dtype = np.int64)
+    in_fraction = np.ones(len(values), dtype = bool)
+    for i in range(21, min(width, 26)):
+        in_fraction &= is_digit[:, i]
+        fraction = np.where(in_fraction, fraction * 10 + digits[:, i], fraction)
+        scale = np.where(in_fraction, scale // 10, scale)
+    end = np.char.str_len(values)
+    valid &= end == 21 + np.count_nonzero(is_digit[:, 21:min(width, 26)].cumprod(axis = 1), axis = 1)
+
+    year = number(0, 4)
+    month = number(5, 7)
+    day = number(8, 10)
+    hour = number(11, 13)
+    minute = number(14, 16)
+    second = number(17, 19)
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31) & (hour < 24) & (minute < 60) & (second < 60)
+
+    # days since the epoch from the civil date; http://howardhinnant.github.io/date_algorithms.html#days_from_civil
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+
+    microseconds = (((days * 24 + hour) * 60 + minute) * 60 + second) * 1000000 + fraction * scale
+    parsed[valid] = microseconds[valid]
+    return(parsed)
+
+# the function to parse a single value and the type of array for each type of value
+PARSERS = {
+    'size': (parse_size, np.int64),
+    'duration': (parse_duration, np.int64),
+    'percent': (parse_percent, np.float64)
+}
+
+def parse_size_values(values):
+    """
+    Convert a list of human readable byte sizes into numbers of bytes, the same as parse_size() for each value
+
+    Plain sizes such as '4 GB' or '10.5 KB' are split into number and unit with array operations over all the values at once;
+    the rest, such as '-' or '1e3 MB', are parsed one at a time with parse_size()
+
+    Output
+    ------
+    (parsed, missing)
+
+    parsed: numpy.ndarray
+        an int64 array of the sizes in bytes
+    missing: numpy.ndarray
+        a bool array with whether each value could not be parsed
+    """
+    if len(values) == 0:
+        return(np.zeros(0, dtype = np.int64), np.zeros(0, dtype = bool))
+    sizes = np.char.upper(np.char.strip(np.asarray(values, dtype = np.str_)))
+    # the unit is what is left after the leading digits, dots and spaces; the number is the part before it
+    unit = np.char.lstrip(sizes, '0123456789. ')
+    width = sizes.dtype.itemsize // 4
+    chars = sizes.view(np.uint32).reshape(len(sizes), width)
+    number_length = np.char.str_len(sizes) - np.char.str_len(unit)
+    number = np.where(np.arange(width) < number_length[:, None], chars, 0).astype(np.uint32).view('U{0}'.format(width)).reshape(len(sizes))
+    number = np.char.strip(number)
+    plain = np.isin(unit, list(units.keys()) + [ '' ]) & np.char.isdigit(np.char.replace(number, '.', '', 1)) & ~np.char.endswith(number, '.')
+
+    parsed = np.zeros(len(sizes), dtype = np.int64)
+    missing = np.zeros(len(sizes), dtype = bool)
+    scales = np.array([ units[key] if key != '' else 1 for key in unit[plain].tolist() ], dtype = np.float64)
+    parsed[plain] = (number[plain].astype(np.float64) * scales).astype(np.int64)
+    others = np.flatnonzero(~plain)
+    parsed[others], missing[others] = parse_values_one_by_one([ values[i] for i in others.tolist() ], parse_size, np.int64)
+    return(parsed, missing)
+
+def parse_values_one_by_one(values, parse, dtype):
+    """
+    Convert a list of values with a function that parses a single value
+
+    Output
+    ------
+    (parsed, missing); see parse_size_values()
+    """
+    parsed = np.zeros(len(values), dtype = dtype)
+    missing = np.ones(len(values), dtype = bool)
+    for i, value in enumerate(values):
+        try:
+            parsed[i] = parse(value)
+            missing[i] = False
+        except (ValueError, KeyError):
+            pass
+    return(parsed, missing)
+
+def parse_values(values, value_type):
+    """
+    Convert a list of values of one of the PARSERS types, without looking for repeated values
+
+    Output
+    ------
+    (parsed, missing); see parse_size_values()
+    """
+    if value_type == 'size':
+        return(parse_size_values(values))
+    parse, dtype = PARSERS[value_type]
+    return(parse_values_one_by_one(values, parse, dtype))
+
+@profiling.profiled(rows = len)
+def parse_column(values, value_type):
+    """
+    Convert a whole column of values from the trace file at once
+    Each unique value is only parsed once, so this is fast for columns with many repeated values
+
+    Parameters
+    ----------
+    values: list
+        a list of strings
+    value_type: str
+        one of 'size' (bytes), 'duration' (milliseconds), 'percent', or 'timestamp' (epoch microseconds);
+        see COLUMN_TYPES for the type of each trace file column
+
+    Output
+    ------
+    numpy.ma.MaskedArray
+        a typed array of the values, with the values that could not be parsed such as '-' masked
+
+    Examples
+    --------
+
+    >>> parse_column(['4 GB', '-', '1MB'], 'size').tolist()
+    [4000000000, None, 1000000]
+    """
+    if value_type == 'timestamp':
+        parsed = parse_timestamps(values)
+        return(np.ma.masked_array(parsed, mask = parsed == MISSING_TIMESTAMP))
+    lookup = {}
+    codes = np.fromiter(( lookup.setdefault(value, len(lookup)) for value in values ), dtype = np.int64, count = len(values))
+    unique_values, unique_missing = parse_values(list(lookup.keys()), value_type)
+    return(np.ma.masked_array(unique_values[codes], mask = unique_missing[codes]))
+
+def parse_sizes(sizes):
+    """
+    Convert a sequence of human readable byte sizes into numbers of bytes; see parse_column()
+
+    Examples
+    --------
+
+    >>> parse_sizes(['4 GB', '-', '1MB', '4 GB', '512']).tolist()
+    [4000000000, None, 1000000, 4000000000, 512]
+    """
+    return(parse_column(sizes, 'size'))
+
+@profiling.profiled()
+def parse_trace_columns(trace):
+    """
+    Convert all the columns of known type from a trace file loaded with calc_time.load_trace()
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { column: numpy.ma.MaskedArray, ... }
+    """
+    parsed = {}
+    for column, values in trace.items():
+        if column not in COLUMN_TYPES:
+            continue
+        if values.dtype == np.int64:
+            # timestamps that were already parsed
+            parsed[column] = np.ma.masked_array(values, mask = values == MISSING_TIMESTAMP)
+        else:
+            parsed[column] = parse_column(values, COLUMN_TYPES[column])
+    return(parsed)
+
+def format_value(value):
+    """
+    Format a parsed value for printing, with '-' for missing values
+    """
+    if value is None or value is np.ma.masked:
+        return('-')
+    return(str(value))
+
+def convert_stream(fin, fout, value_type):
+    """
+    Convert one value per line from an input stream to an output stream, a chunk of lines at a time
+    The output for each unique value is remembered so that repeated values are not parsed again
+
+    Parameters
+    ----------
+    fin: file
+        the input stream
+    fout: file
+        the output stream
+    value_type: str
+        the type of the values, see parse_column()
+    """
+    cache = {}
+    while True:
+        lines = list(itertools.islice(fin, STREAM_CHUNK_SIZE))
+        if len(lines) == 0:
+            break
+        values = list(map(str.strip, lines))
+        if value_type == 'timestamp':
+            output = [ format_value(value) for value in parse_column(values, value_type).tolist() ]
+        else:
+            # parse all the new values of the chunk in one call, then look every value up in the cache
+            new_values = [ value for value in dict.fromkeys(values) if value not in cache ]
+            if len(cache) + len(new_values) > STREAM_CACHE_SIZE:
+                cache.clear()
+                new_values = list(dict.fromkeys(values))
+            parsed, missing = parse_values(new_values, value_type)
+            cache.update(zip(new_values, [ '-' if is_missing else str(value) for value, is_missing in zip(parsed.tolist(), missing.tolist()) ]))
+            output = [ cache[value] for value in values ]
+        fout.write('\n'.join(output) + '\n')
 
 def main():
     """
+    Main control function for the script when run from CLI
     """
-    args = sys.argv[1:]
-    input_values = []
-    if len(args) < 1:
+    parser = argparse.ArgumentParser(description = 'Convert values from a Nextflow trace file; read from the command line, or one per line from stdin')
+    parser.add_argument('values', nargs = '*', help = 'Values to convert')
+    parser.add_argument('--type', dest = 'value_type', default = 'size', choices = [ 'size', 'duration', 'percent', 'timestamp' ], help = 'The type of the values')
+    parser.add_argument('--profile', action = 'store_true', help = 'Save the time and memory of each phase to LOG_DIR')
+    parser.add_argument('--cprofile', action = 'store_true', help = 'Save cProfile stats to LOG_DIR along with the --profile output')
+    args = parser.parse_args()
+
+    if args.profile or args.cprofile:
+        profiling.enable('mem_convert', 'cprofile' if args.cprofile else '1')
+    else:
+        profiling.enable_from_env('mem_convert')
+
+    if len(args.values) < 1:
         # read list of values from stdin
-        input_values = [ item.strip() for item in sys.stdin.readlines() ]
+        convert_stream(sys.stdin, sys.stdout, args.value_type)
     else:
         # get input values from CLI args
-        input_values = args
-
-    for value in input_values:
-        print(parse_size(value))
+        for value in parse_column(args.values, args.value_type).tolist():
+            print(format_value(value))
 
 
 if __name__ == '__main__':
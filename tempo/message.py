@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
 Create success and failure messages for the pipeline
@@ -8,13 +8,28 @@ Meant to be run from inside the Makefile
 import os
 import sys
 import json
+import functools
 import calc_time
+import forecast
+import profiling
+
+# start profiling before the config and log files are loaded below; see profiling.py
+# with '--profile' or '--cprofile' anywhere in the args, the same as calc_time.py
+PROFILE_ARGS = [ '--profile', '--cprofile' ]
+if __name__ == '__main__':
+    if '--profile' in sys.argv or '--cprofile' in sys.argv:
+        profiling.enable('message', 'cprofile' if '--cprofile' in sys.argv else '1')
+    else:
+        profiling.enable_from_env('message')
 
 # load the JSON and get some values
 CONFIG_JSON = os.environ['CONFIG_JSON'] # required; get from Makefile enviornment
 ERROR_MESSAGE = os.environ.get('ERROR_MESSAGE') # text file that can hold more custom post-pipeline error checking messages
+TRACE_TIME_FILE = os.environ.get('TRACE_TIME_FILE') # durations already written by 'make calc_time', if present
+SAMPLES_TIME_FILE = os.environ.get('SAMPLES_TIME_FILE')
 # CURDIR = os.environ.get('CURDIR', os.path.realpath('.'))
-config = json.load(open(CONFIG_JSON))
+with profiling.phase('load_config'):
+    config = json.load(open(CONFIG_JSON))
 nextflow_log = config.get('nextflow_log')
 log_dir = config.get('log_dir')
 pipeline_dir = config.get('pipeline_dir')
@@ -61,27 +76,78 @@ error_message = ""
 if ERROR_MESSAGE and os.path.exists(ERROR_MESSAGE):
     error_message = open(ERROR_MESSAGE).read()
 
-# if the nextflow_trace file exists, then calculate the total execution time for it
-duration_message = ""
-samples_duration_messages = ""
-if os.path.exists(nextflow_trace):
-    total_durations, duration_message = calc_time.calculate_trace_duration(nextflow_trace)
-    duration_message = """
+# the duration messages are only calculated for the messages that include them, the first time they are needed
+def read_duration_file(duration_file):
+    """
+    Get the saved output of calc_time.py if the file exists and was written after the trace file was last updated,
+    otherwise return None
+    """
+    if not duration_file or not os.path.exists(duration_file):
+        return(None)
+    if os.path.getmtime(duration_file) < os.path.getmtime(nextflow_trace):
+        return(None)
+    text = open(duration_file).read()
+    # remove the newline added when the message was printed to file
+    if text.endswith('\n'):
+        text = text[:-1]
+    return(text)
+
+@functools.lru_cache(maxsize = None)
+@profiling.profiled()
+def duration_message():
+    """
+    Message with the total execution time from the Nextflow trace file, if it exists
+    """
+    if not nextflow_trace or not os.path.exists(nextflow_trace):
+        return("")
+    message = read_duration_file(TRACE_TIME_FILE)
+    if message == None:
+        total_durations, message = calc_time.calculate_trace_duration(nextflow_trace)
+    message = """
 Total Accumulated Pipeline Execution Time:
 {duration_message}
-""".format(duration_message = duration_message)
-    project_pipeline_version_message += duration_message
+""".format(duration_message = message)
+    return(message)
 
-    # if the mapping tsv exists, then get the samples message as well
-    if os.path.exists(mapping_tsv):
-        total_sample_durations, samples_duration_messages = calc_time.calc_time_samples_durations(
+@functools.lru_cache(maxsize = None)
+@profiling.profiled()
+def samples_duration_messages():
+    """
+    Message with the execution time per sample from the Nextflow trace file, if it and the mapping file exist
+    """
+    if not nextflow_trace or not os.path.exists(nextflow_trace) or not os.path.exists(mapping_tsv):
+        return("")
+    message = read_duration_file(SAMPLES_TIME_FILE)
+    if message == None:
+        total_sample_durations, message = calc_time.calc_time_samples_durations(
             trace_file = nextflow_trace, mapping_file = mapping_tsv)
-        samples_duration_messages = """
+    message = """
 Sample Execution Time Breakdown:
 {samples_duration_messages}
-""".format(samples_duration_messages = samples_duration_messages)
-
+""".format(samples_duration_messages = message)
+    return(message)
 
+@functools.lru_cache(maxsize = None)
+@profiling.profiled()
+def forecast_message():
+    """
+    Message with the estimated time left for the pipeline, from the trace file so far and the trace files of the earlier runs,
+    if the mapping file exists and there are earlier runs in the logs dir
+    """
+    if not log_dir or not os.path.exists(mapping_tsv):
+        return("")
+    trace_file = nextflow_trace or os.path.join(log_dir, 'trace.txt')
+    try:
+        result = forecast.forecast_run(trace_file, mapping_tsv, log_dir = os.path.dirname(os.path.realpath(log_dir)))
+    except (OSError, IOError, ValueError, KeyError) as e:
+        # the estimate is nice to have and should never stop the message from being sent
+        sys.stderr.write("could not estimate the time left: {error}\n".format(error = e))
+        return("")
+    if result['history_runs'] == 0:
+        return("")
+    message = """
+{forecast_message}""".format(forecast_message = forecast.format_forecast(result, top = 5))
+    return(message)
 
 # functions to return message body text
 def started():
@@ -96,13 +162,30 @@ def started():
 {lsf_log_message}
 
 {nextflow_log_message}
+
+{forecast_message}
 """.format(
     pipeline_dir = pipeline_dir,
     project_pipeline_version_message = project_pipeline_version_message,
     lsf_jobid_message = lsf_jobid_message,
     log_dir_message = log_dir_message,
     lsf_log_message = lsf_log_message,
-    nextflow_log_message = nextflow_log_message
+    nextflow_log_message = nextflow_log_message,
+    forecast_message = forecast_message()
+    )
+    return(message)
+
+def progress():
+    message = """Pipeline running in directory:
+{pipeline_dir}
+
+{log_dir_message}
+
+{forecast_message}
+""".format(
+    pipeline_dir = pipeline_dir,
+    log_dir_message = log_dir_message,
+    forecast_message = forecast_message()
     )
     return(message)
 
@@ -127,8 +210,8 @@ def success():
     lsf_log_message = lsf_log_message,
     nextflow_log_message = nextflow_log_message,
     error_message = error_message,
-    duration_message = duration_message,
-    samples_duration_messages = samples_duration_messages
+    duration_message = duration_message(),
+    samples_duration_messages = samples_duration_messages()
     )
     return(message)
 
@@ -151,8 +234,7 @@ def failed():
     lsf_log_message = lsf_log_message,
     nextflow_log_message = nextflow_log_message,
     error_message = error_message,
-    duration_message = duration_message,
-    samples_duration_messages = samples_duration_messages
+    duration_message = duration_message()
     )
     return(message)
 
@@ -175,18 +257,18 @@ def killed():
     lsf_log_message = lsf_log_message,
     nextflow_log_message = nextflow_log_message,
     error_message = error_message,
-    duration_message = duration_message,
-    samples_duration_messages = samples_duration_messages
+    duration_message = duration_message()
     )
     return(message)
 
+@profiling.profiled()
 def make_body(func):
     data = {}
     data['body'] = func()
     return(data)
 
 if __name__ == '__main__':
-    args = sys.argv[1:]
+    args = [ arg for arg in sys.argv[1:] if arg not in PROFILE_ARGS ]
     message_type = args[0]
     if message_type == "success":
         message_func = success
@@ -196,6 +278,8 @@ if __name__ == '__main__':
         message_func = started
     if message_type == "killed":
         message_func = killed
+    if message_type == "progress":
+        message_func = progress
 
     data = make_body(message_func)
     print(json.dumps(data, indent = 4))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Record the wall time, row counts and peak memory of the phases of the pipeline helper scripts
+
+Turned on by the '--profile' option of the scripts, or by setting the TEMPO_PROFILE environment variable to '1';
+with '--cprofile' or TEMPO_PROFILE=cprofile a cProfile stats file is saved as well. When the script exits,
+the metrics are written in JSON format to LOG_DIR (or TEMPO_PROFILE_DIR, or the current dir if neither is set),
+e.g. logs/2020-04-21_12-43-46/profile.calc_time.12345.json
+
+When profiling is off, phase() returns a shared object that does nothing, so the phases cost close to nothing
+
+Usage in a script:
+
+    import profiling
+
+    @profiling.profiled(rows = len)
+    def load_rows(path):
+        ...
+
+    with profiling.phase('format_message'):
+        message = ...
+
+$ TEMPO_PROFILE=1 make calc_time
+$ python -m pstats logs/2020-04-21_12-43-46/profile.calc_time.12345.pstats
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import resource
+
+PROFILE_VAR = 'TEMPO_PROFILE'
+
+# the phases recorded so far, in the format of { name: { 'calls': int, 'seconds': float, 'rows': int, 'peak_memory_mb': float }, ... }
+# where 'rows' is only there for the phases that count their rows
+phases = {}
+
+# whether or not the phases are being recorded, and the cProfile.Profile when cProfile is on
+enabled = False
+profiler = None
+script_name = None
+start_time = None
+
+def peak_memory_mb():
+    """
+    Get the peak resident memory of the current process in megabytes
+    """
+    # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1000000.0)
+
+class NullPhase(object):
+    """
+    A phase that records nothing, used when profiling is off
+    """
+    rows = None
+    def __enter__(self):
+        return(self)
+    def __exit__(self, *args):
+        return(False)
+
+NULL_PHASE = NullPhase()
+
+class Phase(object):
+    """
+    Record the time and peak memory of a block of code, along with the number of rows it handled if 'rows' is set
+    Repeated phases with the same name are added up
+    """
+    def __init__(self, name, rows = None):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.start = time.time()
+        return(self)
+
+    def __exit__(self, *args):
+        seconds = time.time() - self.start
+        if self.name not in phases:
+            phases[self.name] = { 'calls': 0, 'seconds': 0.0, 'peak_memory_mb': 0.0 }
+        record = phases[self.name]
+        record['calls'] += 1
+        record['seconds'] += seconds
+        if self.rows != None:
+            record['rows'] = record.get('rows', 0) + self.rows
+        record['peak_memory_mb'] = peak_memory_mb()
+        return(False)
+
+def phase(name, rows = None):
+    """
+    Get a context manager that records a phase of the script, see Phase
+    """
+    if not enabled:
+        return(NULL_PHASE)
+    return(Phase(name, rows))
+
+def profiled(name = None, rows = None):
+    """
+    Decorator that records every call of a function as a phase, named after the function by default
+
+    Parameters
+    ----------
+    name: str|None
+        the name of the phase
+    rows: function|None
+        a function that gets the number of rows handled from the return value of the decorated function
+    """
+    def decorator(func):
+        phase_name = name if name != None else func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return(func(*args, **kwargs))
+            with Phase(phase_name) as p:
+                result = func(*args, **kwargs)
+                if rows != None:
+                    p.rows = rows(result)
+            return(result)
+        return(wrapper)
+    return(decorator)
+
+def enable(name, mode = '1'):
+    """
+    Start recording the phases of a script, and write the metrics when the script exits
+
+    Parameters
+    ----------
+    name: str
+        the name of the script, used in the names of the output files
+    mode: str
+        '1' to record the phases, or 'cprofile' to also run cProfile
+    """
+    global enabled, profiler, script_name, start_time
+    if enabled:
+        return
+    enabled = True
+    script_name = name
+    start_time = time.time()
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    atexit.register(write_metrics)
+
+def enable_from_env(name):
+    """
+    Start recording the phases of a script if the TEMPO_PROFILE environment variable is set
+    """
+    mode = os.environ.get(PROFILE_VAR, '')
+    if mode not in [ '', '0' ]:
+        enable(name, mode)
+
+def output_prefix():
+    """
+    Get the path prefix for the output files, in the format of '<dir>/profile.<script>.<pid>'
+    """
+    output_dir = os.environ.get('TEMPO_PROFILE_DIR') or os.environ.get('LOG_DIR') or '.'
+    return(os.path.join(output_dir, 'profile.{name}.{pid}'.format(name = script_name, pid = os.getpid())))
+
+def write_metrics():
+    """
+    Write the recorded phases to a JSON file, and the cProfile stats if cProfile is on
+    """
+    prefix = output_prefix()
+    metrics = {
+    'script': script_name,
+    'argv': sys.argv,
+    'pid': os.getpid(),
+    'seconds': time.time() - start_time,
+    'peak_memory_mb': peak_memory_mb(),
+    'phases': phases
+    }
+    try:
+        with open(prefix + '.json', 'w') as fout:
+            json.dump(metrics, fout, indent = 4)
+        if profiler != None:
+            profiler.disable()
+            profiler.dump_stats(prefix + '.pstats')
+    except (OSError, IOError) as e:
+        sys.stderr.write("could not write the profile to {prefix}: {error}\n".format(prefix = prefix, error = e))
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run Nextflow as the leader job of the pipeline, pass on the signals sent to the job, and run the exit hooks when it ends
+
+Replaces the bash traps of the LSF submission script, which checked whether Nextflow was still running every 3 seconds and
+started 'make' again from inside the traps. Here the supervisor blocks in waitpid() until Nextflow exits, so that it wakes up
+as soon as Nextflow ends or a signal arrives. Signals sent to the job (e.g. by 'bkill') are passed on to Nextflow right away
+as SIGTERM so that it can shut down its child jobs cleanly
+
+When Nextflow exits, its exit code is written to the exit code file (1 if the job was killed), the submission lock file is
+removed, and the exit hooks are run in the same process; 'check-errors' and 'calc_time' do not depend on each other and run
+at the same time, then 'jira' posts the exit message, which includes their output. The signals that arrive after Nextflow
+exited, e.g. the SIGTERM that 'bkill' sends some time after the SIGINT, are logged and ignored until the hooks are done
+
+The process ID of the supervisor is written to the --supervisor-pid-file as soon as it starts; the submission script only
+runs the exit recipes itself when that file is missing, i.e. when the job failed before the supervisor was started
+
+The paths used by the hooks are read from the environment variables exported by the Makefile, e.g. NXF_TRACE, ERROR_MESSAGE
+
+$ ./supervisor.py --pid-file .nextflow.pid --exitcode-file .exitcode -- nextflow run tempo/pipeline.nf ...
+$ ./supervisor.py --hooks --pid-file /tmp/test.pid --exitcode-file /tmp/test.exitcode -- sleep 60
+"""
+import os
+import sys
+import json
+import signal
+import argparse
+import subprocess
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# the signals that LSF sends when the job is killed or runs out of time
+FORWARD_SIGNALS = [ signal.SIGHUP, signal.SIGINT, signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2 ]
+
+# the exit code recorded when the job was killed, the same as 'exit_1' in the old submission script
+KILLED_EXITCODE = 1
+
+def log(message):
+    """
+    Print a message to the job log right away
+    """
+    sys.stdout.write(">>> {message}\n".format(message = message))
+    sys.stdout.flush()
+
+def hook_check_errors(options):
+    """
+    Check the pipeline output and logs for errors, the same as 'make check-errors'
+    """
+    import check_errors
+    with open(options['config_json']) as fin:
+        config = json.load(fin)
+    results = check_errors.check_errors(config, os.environ.get('NXF_WORK'))
+    if os.environ.get('ERROR_JSON'):
+        with open(os.environ['ERROR_JSON'], 'w') as fout:
+            json.dump(results, fout, indent = 4)
+    message = check_errors.format_errors(results)
+    if os.environ.get('ERROR_MESSAGE'):
+        with open(os.environ['ERROR_MESSAGE'], 'w') as fout:
+            fout.write(message)
+    else:
+        sys.stdout.write(message)
+
+def hook_calc_time(options):
+    """
+    Calculate the pipeline durations, the same as 'make calc_time'
+    """
+    import calc_time
+    calc_time.calc_time_report(
+        trace_file = os.environ['NXF_TRACE'],
+        mapping_file = os.environ.get('MAPPING_TSV'),
+        trace_output = os.environ.get('TRACE_TIME_FILE'),
+        trace_raw_output = os.environ.get('TRACE_TIME_RAW_FILE'),
+        samples_output = os.environ.get('SAMPLES_TIME_FILE'),
+        samples_raw_output = os.environ.get('SAMPLES_TIME_RAW_FILE'),
+        json_output = os.environ.get('DURATION_JSON_FILE'),
+        tsv_output = None)
+
+def hook_jira(options):
+    """
+    Post the success or failed message and upload the Nextflow report, the same as 'make jira-notify-exit'
+    """
+    import jira_client
+    message_type = jira_client.exit_state_message_type(options['exitcode_file'])
+    # message.py reads the error and duration files when it is imported, so it must only be imported after the other hooks ran
+    import message
+    data = message.make_body(getattr(message, message_type))
+    if os.environ.get('LOG_DIR'):
+        with open(os.path.join(os.environ['LOG_DIR'], 'jira.{message_type}.json'.format(message_type = message_type)), 'w') as fout:
+            fout.write(json.dumps(data, indent = 4) + '\n')
+    issue = jira_client.load_issue(options['jira_config'])
+    username, password = jira_client.load_credentials(options['jira_credentials_file'])
+    with jira_client.JiraClient(options['jira_url'], username, password) as client:
+        errors = jira_client.send_messages(client, issue, data, [ os.environ.get('NXF_REPORT', '') ])
+    for description, error in errors:
+        log("ERROR: jira: {description}: {error}".format(description = description, error = error))
+
+# the exit hooks, in the format of { name: function }, and the order to run them in; the hooks in the same stage run at the same time
+HOOKS = {
+'check-errors': hook_check_errors,
+'calc_time': hook_calc_time,
+'jira': hook_jira
+}
+HOOK_STAGES = [ [ 'check-errors', 'calc_time' ], [ 'jira' ] ]
+
+def run_hooks(names, options):
+    """
+    Run the exit hooks one stage after the other, with the hooks of each stage at the same time
+    A hook that fails is logged and does not stop the other hooks
+
+    Parameters
+    ----------
+    names: list
+        the names of the hooks to run, see HOOKS
+    options: dict
+        the paths and settings used by the hooks
+
+    Output
+    ------
+    list:
+        the names of the hooks that failed
+    """
+    failed = []
+    def run(name):
+        log("running exit hook: {name}".format(name = name))
+        try:
+            HOOKS[name](options)
+            return(None)
+        except Exception:
+            log("ERROR: exit hook failed: {name}\n{error}".format(name = name, error = traceback.format_exc()))
+            return(name)
+
+    for stage in HOOK_STAGES:
+        stage_names = [ name for name in stage if name in names ]
+        if len(stage_names) == 0:
+            continue
+        with ThreadPoolExecutor(max_workers = len(stage_names)) as executor:
+            failed.extend([ name for name in executor.map(run, stage_names) if name != None ])
+    return(failed)
+
+def supervise(command, pid_file = None, exitcode_file = None, restore_handlers = True):
+    """
+    Start the command and wait for it to exit, passing on the signals sent to this process as SIGTERM
+
+    Parameters
+    ----------
+    command: list
+        the command to run, e.g. [ 'nextflow', 'run', ... ]
+    pid_file: str|None
+        file to write the process ID of the command to, e.g. for 'make kill'
+    exitcode_file: str|None
+        file to write the exit code to
+    restore_handlers: bool
+        whether or not to put back the previous signal handlers when the command exits; when False the signals that arrive
+        after the command exited are logged and ignored, so that e.g. the second signal of 'bkill' does not stop the exit hooks
+
+    Output
+    ------
+    (exitcode, killed)
+
+    exitcode: int
+        the exit code of the command, 128 + the signal number if it was ended by a signal the same as bash,
+        or KILLED_EXITCODE if this process got a signal
+    killed: bool
+        whether or not this process got a signal while the command was running
+    """
+    state = { 'process': None, 'signals': [] }
+
+    def forward(signum, frame):
+        if state['process'] != None and state['process'].returncode != None:
+            log("trap: {name}; ignored, the command already exited".format(name = signal.Signals(signum).name))
+            return
+        state['signals'].append(signum)
+        log("trap: {name}".format(name = signal.Signals(signum).name))
+        if state['process'] != None and state['process'].returncode == None:
+            log("sending SIGTERM to process {pid}".format(pid = state['process'].pid))
+            try:
+                state['process'].send_signal(signal.SIGTERM)
+            except OSError:
+                pass
+
+    previous_handlers = dict( (signum, signal.signal(signum, forward)) for signum in FORWARD_SIGNALS )
+    try:
+        process = subprocess.Popen(command)
+        state['process'] = process
+        log("process ID: {pid}".format(pid = process.pid))
+        if pid_file != None:
+            with open(pid_file, 'w') as fout:
+                fout.write('{pid}\n'.format(pid = process.pid))
+        # a signal that arrived while the command was starting
+        if len(state['signals']) > 0:
+            process.send_signal(signal.SIGTERM)
+        # blocks in waitpid(); the signal handlers run as soon as a signal arrives and the wait carries on afterwards
+        returncode = process.wait()
+    except BaseException:
+        restore_handlers = True
+        raise
+    finally:
+        if restore_handlers:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    exitcode = returncode if returncode >= 0 else 128 - returncode
+    killed = len(state['signals']) > 0
+    if killed:
+        exitcode = KILLED_EXITCODE
+    log("exit code: {exitcode}".format(exitcode = exitcode))
+    if exitcode_file != None:
+        with open(exitcode_file, 'w') as fout:
+            fout.write('{exitcode}\n'.format(exitcode = exitcode))
+    return(exitcode, killed)
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = 'Run Nextflow, pass on the signals sent to the job, and run the exit hooks when it ends')
+    parser.add_argument('command', nargs = argparse.REMAINDER, help = "The command to run, after '--'")
+    parser.add_argument('--pid-file', dest = 'pid_file', default = os.environ.get('NXF_PID_FILE'), help = 'File to write the process ID of the command to')
+    parser.add_argument('--exitcode-file', dest = 'exitcode_file', default = os.environ.get('PIPELINE_EXITCODE_FILE'), help = 'File to write the exit code to')
+    parser.add_argument('--supervisor-pid-file', dest = 'supervisor_pid_file', default = os.environ.get('SUPERVISOR_PID_FILE'), help = 'File to write the process ID of this process to, so that the submission script knows it started')
+    parser.add_argument('--lockfile', default = None, help = 'Submission lock file to remove when the command exits')
+    parser.add_argument('--hooks', nargs = '*', default = [ name for stage in HOOK_STAGES for name in stage ], choices = list(HOOKS.keys()), help = 'The exit hooks to run (default: all); give no names to run none')
+    parser.add_argument('--config-json', dest = 'config_json', default = os.environ.get('CONFIG_JSON', 'config.json'), help = 'The pipeline config.json')
+    parser.add_argument('--jira-config', dest = 'jira_config', default = 'jira.json', help = 'The jira.json file with the key of the issue')
+    parser.add_argument('--jira-url', dest = 'jira_url', default = None, help = 'The Jira server URL')
+    parser.add_argument('--jira-credentials-file', dest = 'jira_credentials_file', default = None, help = 'File with the Jira username and password')
+    args = parser.parse_args()
+
+    command = args.command[1:] if len(args.command) > 0 and args.command[0] == '--' else args.command
+    if len(command) == 0:
+        parser.error('no command to run')
+
+    if args.supervisor_pid_file != None:
+        with open(args.supervisor_pid_file, 'w') as fout:
+            fout.write('{pid}\n'.format(pid = os.getpid()))
+    # the signal handlers stay in place until the exit hooks are done, since LSF sends more signals after the first one
+    previous_handlers = dict( (signum, signal.getsignal(signum)) for signum in FORWARD_SIGNALS )
+    exitcode, killed = supervise(command, args.pid_file, args.exitcode_file, restore_handlers = False)
+    if args.lockfile != None and os.path.exists(args.lockfile):
+        os.remove(args.lockfile)
+
+    if len(args.hooks) > 0:
+        import jira_client
+        # the hooks write the exit code to the same file as the old submission script, so they need one
+        exitcode_file = args.exitcode_file
+        if exitcode_file == None:
+            exitcode_file = os.path.join(os.environ.get('LOG_DIR', '.'), '.exitcode')
+            with open(exitcode_file, 'w') as fout:
+                fout.write('{exitcode}\n'.format(exitcode = exitcode))
+        options = {
+        'config_json': args.config_json,
+        'exitcode_file': exitcode_file,
+        'jira_config': args.jira_config,
+        'jira_url': args.jira_url or os.environ.get('JIRA_URL', jira_client.JIRA_URL),
+        'jira_credentials_file': args.jira_credentials_file or os.environ.get('JIRA_CREDENTIALS_FILE', jira_client.JIRA_CREDENTIALS_FILE)
+        }
+        run_hooks(args.hooks, options)
+    for signum, handler in previous_handlers.items():
+        signal.signal(signum, handler)
+    sys.exit(exitcode)
+
+if __name__ == '__main__':
+    main()
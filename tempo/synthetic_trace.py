@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generate a synthetic Nextflow trace.txt file, with matching mapping.tsv and pairing.tsv files, for benchmarking
+
+The trace file has the same columns as the Tempo trace file. Each tumor normal pair gets per-sample tasks tagged with
+the sample ID, e.g. 'AlignReads (Sample1@RG1)', and per-pair tasks tagged with both sample ID's, e.g. 'DoFacets (Sample1__Sample2)'.
+Resume cycles are simulated by moving some of the tasks into earlier runs, which show up as 'CACHED' in the trace file
+
+$ ./synthetic_trace.py bench/ --rows 1000000 --samples 500 --resumes 3
+"""
+import os
+import argparse
+import numpy as np
+
+TRACE_COLUMNS = [ 'task_id', 'hash', 'native_id', 'process', 'tag', 'name', 'status', 'exit', 'module', 'container', 'cpus', 'time',
+'disk', 'memory', 'attempt', 'submit', 'start', 'complete', 'duration', 'realtime', 'queue', '%cpu', '%mem', 'rss', 'vmem',
+'peak_rss', 'peak_vmem', 'rchar', 'wchar', 'syscr', 'syscw', 'read_bytes', 'write_bytes', 'workdir', 'scratch' ]
+
+# processes run once per sample, tagged with the sample ID and a read group
+SAMPLE_PROCESSES = [ 'AlignReads', 'MergeBams', 'MarkDuplicates', 'RunBQSR', 'QcPileup', 'QcQualimap' ]
+
+# processes run once per tumor normal pair, tagged with both sample ID's
+PAIR_PROCESSES = [ 'DoFacets', 'RunMutect2', 'SomaticRunStrelka2', 'RunMsiSensor', 'SomaticCombineChannel', 'RunLOHHLA' ]
+
+# the share of the tasks of the last run with each status; tasks from earlier runs are 'CACHED'
+STATUS_WEIGHTS = { 'COMPLETED': 0.9, 'FAILED': 0.06, 'ABORTED': 0.04 }
+
+MEMORY_REQUESTS = [ '2 GB', '4 GB', '8 GB', '16 GB', '30 GB', '60 GB' ]
+
+START_TIME = np.datetime64('2020-04-21T12:00:00.000')
+
+def format_timestamps(timestamps):
+    """
+    Format an array of numpy.datetime64 values as Nextflow trace timestamps, e.g. '2020-04-21 12:43:46.123'
+    """
+    return(np.char.replace(np.datetime_as_string(timestamps, unit = 'ms'), 'T', ' '))
+
+def format_durations(milliseconds):
+    """
+    Format an array of durations in milliseconds as Nextflow trace durations, e.g. '1h 2m 3s'
+    """
+    seconds = milliseconds // 1000
+    hours, minutes, secs = seconds // 3600, (seconds // 60) % 60, seconds % 60
+    return([ '{h}h {m}m {s}s'.format(h = h, m = m, s = s) if h > 0 else '{m}m {s}s'.format(m = m, s = s) for h, m, s in zip(hours.tolist(), minutes.tolist(), secs.tolist()) ])
+
+def make_trace(num_rows, num_samples, resumes = 0, missing = 0.01, seed = 1, status_weights = None):
+    """
+    Make the rows of a synthetic trace file
+
+    Parameters
+    ----------
+    num_rows: int
+        the number of rows in the trace file
+    num_samples: int
+        the number of samples, paired up into num_samples / 2 tumor normal pairs
+    resumes: int
+        the number of times the pipeline was resumed; the tasks of earlier runs are 'CACHED'
+    missing: float
+        the share of the timestamp, duration and memory values that are '-'
+    seed: int
+        the seed for the random numbers
+    status_weights: dict|None
+        the share of the tasks of the last run with each status, in the format of { status: float, ... }; defaults to STATUS_WEIGHTS
+
+    Output
+    ------
+    (trace, sample_ids, pairs)
+
+    trace: dict
+        a dictionary in the format of { column: list, ... } with a string value for each row
+    sample_ids: list
+        the sample ID's
+    pairs: list
+        a list of tuples in the format of [ (tumor_id, normal_id), ... ]
+    """
+    if status_weights == None:
+        status_weights = STATUS_WEIGHTS
+    random = np.random.RandomState(seed)
+    num_pairs = max(num_samples // 2, 1)
+    sample_ids = [ 'Sample{i}'.format(i = i + 1) for i in range(max(num_samples, 2)) ]
+    pairs = [ (sample_ids[2 * i], sample_ids[2 * i + 1]) for i in range(num_pairs) ]
+
+    # half of the tasks are per-sample and half are per-pair
+    is_pair_task = random.random_sample(num_rows) < 0.5
+    processes = np.where(is_pair_task, np.array(PAIR_PROCESSES, dtype = object)[random.randint(0, len(PAIR_PROCESSES), num_rows)],
+        np.array(SAMPLE_PROCESSES, dtype = object)[random.randint(0, len(SAMPLE_PROCESSES), num_rows)])
+    pair_tags = np.array([ tumor_id + '__' + normal_id for tumor_id, normal_id in pairs ], dtype = object)
+    sample_tags = np.array([ sample_id + '@RG{i}'.format(i = i) for sample_id in sample_ids for i in range(1, 4) ], dtype = object)
+    tags = np.where(is_pair_task, pair_tags[random.randint(0, len(pair_tags), num_rows)], sample_tags[random.randint(0, len(sample_tags), num_rows)])
+
+    # each run lasts a day, with a wave of tasks submitted at the start of every hour so that there are idle gaps
+    # between the waves; the tasks of all the earlier runs are cached in the last one
+    runs = random.randint(0, resumes + 1, num_rows)
+    waves = random.randint(0, 24, num_rows)
+    status_names = list(status_weights.keys())
+    weights = np.array(list(status_weights.values()), dtype = np.float64)
+    statuses = np.array(status_names, dtype = object)[random.choice(len(status_names), num_rows, p = weights / weights.sum())]
+    statuses[runs < resumes] = 'CACHED'
+    queue_ms = random.randint(0, 600000, num_rows)
+    realtime_ms = np.minimum(random.lognormal(13, 0.8, num_rows).astype(np.int64) + 1000, 2400000)
+    submit = START_TIME + (runs * 86400000 + waves * 3600000 + random.randint(0, 600000, num_rows)).astype('timedelta64[ms]')
+    start = submit + queue_ms.astype('timedelta64[ms]')
+    complete = start + realtime_ms.astype('timedelta64[ms]')
+
+    task_ids = np.arange(1, num_rows + 1)
+    hashes = [ '{a:02x}/{b:06x}'.format(a = a, b = b) for a, b in zip(random.randint(0, 256, num_rows).tolist(), random.randint(0, 16 ** 6, num_rows).tolist()) ]
+    trace = dict( (column, [ '-' ] * num_rows) for column in TRACE_COLUMNS )
+    trace.update({
+    'task_id': [ str(i) for i in task_ids.tolist() ],
+    'hash': hashes,
+    'native_id': [ str(i) for i in (task_ids + 1000000).tolist() ],
+    'process': processes.tolist(),
+    'tag': tags.tolist(),
+    'name': [ '{process} ({tag})'.format(process = process, tag = tag) for process, tag in zip(processes.tolist(), tags.tolist()) ],
+    'status': statuses.tolist(),
+    'exit': np.where(np.isin(statuses, [ 'COMPLETED', 'CACHED' ]), '0', np.array([ '1', '130', '137', '140' ])[random.randint(0, 4, num_rows)]).tolist(),
+    'cpus': [ str(cpus) for cpus in np.array([ 1, 2, 4, 8 ])[random.randint(0, 4, num_rows)].tolist() ],
+    'memory': np.array(MEMORY_REQUESTS)[random.randint(0, len(MEMORY_REQUESTS), num_rows)].tolist(),
+    'attempt': [ str(attempt) for attempt in (1 + (random.random_sample(num_rows) < 0.1)).tolist() ],
+    'submit': format_timestamps(submit).tolist(),
+    'start': format_timestamps(start).tolist(),
+    'complete': format_timestamps(complete).tolist(),
+    'duration': format_durations(queue_ms + realtime_ms),
+    'realtime': format_durations(realtime_ms),
+    '%cpu': [ '{value:.1f}%'.format(value = value) for value in random.uniform(10, 800, num_rows).tolist() ],
+    'peak_rss': [ '{value:.1f} GB'.format(value = value) for value in random.uniform(0.1, 30, num_rows).tolist() ],
+    'peak_vmem': [ '{value:.1f} GB'.format(value = value) for value in random.uniform(0.1, 60, num_rows).tolist() ],
+    'rss': [ '{value:.1f} MB'.format(value = value) for value in random.uniform(1, 900, num_rows).tolist() ],
+    'workdir': [ '/work/' + task_hash + 'abcdef0123456789abcdef' for task_hash in hashes ]
+    })
+    # aborted tasks never complete
+    for i in np.flatnonzero(statuses == 'ABORTED').tolist():
+        trace['complete'][i] = '-'
+    for column in [ 'submit', 'complete', 'duration', 'realtime', 'memory', 'peak_rss' ]:
+        for i in np.flatnonzero(random.random_sample(num_rows) < missing).tolist():
+            trace[column][i] = '-'
+    return(trace, sample_ids, pairs)
+
+def write_files(output_dir, trace, sample_ids, pairs):
+    """
+    Write the trace.txt, mapping.tsv and pairing.tsv files to the output dir
+
+    Output
+    ------
+    dict:
+        a dictionary with the path of each file in the format of { 'trace': str, 'mapping': str, 'pairing': str }
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    paths = {
+    'trace': os.path.join(output_dir, 'trace.txt'),
+    'mapping': os.path.join(output_dir, 'mapping.tsv'),
+    'pairing': os.path.join(output_dir, 'pairing.tsv')
+    }
+    with open(paths['trace'], 'w') as fout:
+        fout.write('\t'.join(TRACE_COLUMNS) + '\n')
+        for row in zip(*[ trace[column] for column in TRACE_COLUMNS ]):
+            fout.write('\t'.join(row) + '\n')
+    with open(paths['mapping'], 'w') as fout:
+        fout.write('\t'.join([ 'SAMPLE', 'TARGET', 'FASTQ_PE1', 'FASTQ_PE2' ]) + '\n')
+        for sample_id in sample_ids:
+            fout.write('\t'.join([ sample_id, 'agilent', '/fastq/{sample_id}_R1.fastq.gz'.format(sample_id = sample_id), '/fastq/{sample_id}_R2.fastq.gz'.format(sample_id = sample_id) ]) + '\n')
+    with open(paths['pairing'], 'w') as fout:
+        fout.write('\t'.join([ 'NORMAL_ID', 'TUMOR_ID' ]) + '\n')
+        for tumor_id, normal_id in pairs:
+            fout.write('\t'.join([ normal_id, tumor_id ]) + '\n')
+    # a trace cache left over from an earlier trace file in the same dir would be rebuilt anyway, but remove it to be sure
+    if os.path.exists(paths['trace'] + '.cache.npz'):
+        os.remove(paths['trace'] + '.cache.npz')
+    return(paths)
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = 'Generate a synthetic Nextflow trace file with matching mapping and pairing files')
+    parser.add_argument('output_dir', help = 'The dir to write trace.txt, mapping.tsv and pairing.tsv to')
+    parser.add_argument('--rows', type = int, default = 100000, help = 'Number of rows in the trace file')
+    parser.add_argument('--samples', type = int, default = 100, help = 'Number of samples')
+    parser.add_argument('--resumes', type = int, default = 1, help = 'Number of times the pipeline was resumed')
+    parser.add_argument('--missing', type = float, default = 0.01, help = "Share of the timestamp, duration and memory values that are '-'")
+    parser.add_argument('--seed', type = int, default = 1, help = 'Seed for the random numbers')
+    parser.add_argument('--statuses', default = None, help = "Share of the tasks of the last run with each status, e.g. 'COMPLETED=0.9,FAILED=0.1'")
+    args = parser.parse_args()
+
+    status_weights = None
+    if args.statuses != None:
+        status_weights = dict( (status.strip(), float(weight)) for status, weight in [ item.split('=') for item in args.statuses.split(',') ] )
+    trace, sample_ids, pairs = make_trace(args.rows, args.samples, args.resumes, args.missing, args.seed, status_weights)
+    paths = write_files(args.output_dir, trace, sample_ids, pairs)
+    print(paths['trace'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for calc_time.py, on small hand-made traces and on traces from synthetic_trace.py
+
+$ python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import json
+import math
+import shutil
+import tempfile
+import subprocess
+import unittest
+import numpy as np
+TEMPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TEMPO_DIR)
+import calc_time
+import mem_convert
+import synthetic_trace
+
+def make_trace(rows):
+    """
+    Make the trace columns used by calculate_pair_durations() from rows of (tag, status, submit, complete),
+    with the times in seconds and None for a missing time
+    """
+    def timestamps(values):
+        return(np.array([ calc_time.MISSING_TIMESTAMP if value == None else int(value * 1000000) for value in values ], dtype = np.int64))
+    tags, statuses, submit, complete = zip(*rows)
+    return({
+    'tag': np.array(tags, dtype = object),
+    'status': np.array(statuses, dtype = object),
+    'submit': timestamps(submit),
+    'complete': timestamps(complete)
+    })
+
+def total_seconds(status_durations):
+    return(sum([ duration for duration, num_intervals in status_durations.values() ]) / 1000000.0)
+
+class TestPairDurations(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_split_pair_and_sample_work(self):
+        # Normal1 is shared by both tumors; the last contiguous interval of each group is left out of its duration,
+        # the same as calculate_interval_durations(), so each group has a late task that does not count
+        trace = make_trace([
+            ('Tumor1@RG1', 'COMPLETED', 0, 100),
+            ('Normal1@RG1', 'COMPLETED', 50, 150),
+            ('Tumor1@RG2', 'COMPLETED', 1000, 1100),
+            ('Tumor1__Normal1', 'COMPLETED', 200, 300),
+            ('Tumor1__Normal1', 'COMPLETED', 2000, 2050),
+            ('Tumor2@RG1', 'COMPLETED', 500, 540),
+            ('Tumor2__Normal1', 'COMPLETED', 200, 260),
+            ('Tumor2__Normal1', 'COMPLETED', 3000, 3010),
+            # not for any pair, or never completed
+            ('-', 'COMPLETED', 0, 5000),
+            ('Tumor1@RG1', 'ABORTED', 0, None)
+            ])
+        pair_durations = calc_time.calculate_pair_durations(trace, [ ('Tumor1', 'Normal1'), ('Tumor2', 'Normal1') ])
+        self.assertEqual(sorted(pair_durations.keys()), [ 'Tumor1__Normal1', 'Tumor2__Normal1' ])
+        first = pair_durations['Tumor1__Normal1']
+        self.assertEqual(first['sample']['COMPLETED'], (150000000, 3))
+        self.assertEqual(first['pair']['COMPLETED'], (100000000, 2))
+        self.assertEqual(first['all']['COMPLETED'], (350000000, 5))
+        self.assertEqual(first['all']['ABORTED'], (0, 0))
+        # the pair-level tasks of the other pair of the shared normal are not per-sample work of this pair
+        second = pair_durations['Tumor2__Normal1']
+        self.assertEqual(second['sample']['COMPLETED'], (100000000, 2))
+        self.assertEqual(second['pair']['COMPLETED'], (60000000, 2))
+        self.assertEqual(second['all']['COMPLETED'], (200000000, 4))
+
+    def test_no_pairs(self):
+        trace = make_trace([ ('Tumor1@RG1', 'COMPLETED', 0, 100) ])
+        self.assertEqual(calc_time.calculate_pair_durations(trace, []), {})
+
+    def test_matches_interval_durations(self):
+        trace_rows, sample_ids, pairs = synthetic_trace.make_trace(3000, 8, resumes = 1)
+        paths = synthetic_trace.write_files(self.tmpdir, trace_rows, sample_ids, pairs)
+        trace = calc_time.load_trace(paths['trace'], calc_time.INTERVAL_COLUMNS + [ 'tag' ])
+        pair_durations = calc_time.calculate_pair_durations(trace, pairs)
+
+        valid = (trace['submit'] != calc_time.MISSING_TIMESTAMP) & (trace['complete'] != calc_time.MISSING_TIMESTAMP)
+        tag_samples = np.array([ tag.split('@')[0] for tag in trace['tag'] ], dtype = object)
+        for tumor_id, normal_id in pairs:
+            works = {
+            'pair': trace['tag'] == tumor_id + '__' + normal_id,
+            'sample': np.isin(tag_samples, [ tumor_id, normal_id ])
+            }
+            works['all'] = works['pair'] | works['sample']
+            for work, selected in works.items():
+                for status in np.unique(trace['status']).tolist():
+                    rows = np.flatnonzero(selected & valid & (trace['status'] == status))
+                    intervals = set(zip(trace['submit'][rows].tolist(), trace['complete'][rows].tolist()))
+                    expected = (int(calc_time.calculate_interval_durations(sorted(intervals)).sum()), len(intervals))
+                    self.assertEqual(pair_durations[tumor_id + '__' + normal_id][work][status], expected, (tumor_id, normal_id, work, status))
+
+    def test_formats(self):
+        trace = make_trace([
+            ('Tumor1@RG1', 'COMPLETED', 0, 100),
+            ('Tumor1__Normal1', 'COMPLETED', 200, 300),
+            ('Tumor1__Normal1', 'FAILED', 400, 500),
+            ('Tumor2@RG1', 'COMPLETED', 0, 10),
+            ('Tumor2__Normal2', 'COMPLETED', 20, 30),
+            ('Tumor2__Normal2', 'COMPLETED', 900, 1000)
+            ])
+        pair_durations = calc_time.calculate_pair_durations(trace, [ ('Tumor2', 'Normal2'), ('Tumor1', 'Normal1') ])
+        self.assertEqual(total_seconds(pair_durations['Tumor1__Normal1']['all']), 100.0)
+        self.assertEqual(total_seconds(pair_durations['Tumor2__Normal2']['all']), 20.0)
+
+        # the pair with the longest total first
+        text = calc_time.format_pair_durations(pair_durations, 'text', seconds = True)
+        self.assertEqual(text.splitlines(), [ 'Tumor1__Normal1: 100.0 (pair: 0.0, per-sample: 0.0)', 'Tumor2__Normal2: 20.0 (pair: 10.0, per-sample: 0.0)' ])
+        lines = [ line.split('\t') for line in calc_time.format_pair_durations(pair_durations, 'tsv').splitlines() ]
+        self.assertEqual(lines[0], [ 'pair', 'work', 'status', 'duration', 'intervals' ])
+        self.assertEqual(len(lines), 1 + 2 * len(calc_time.PAIR_WORK) * 2)
+        self.assertIn([ 'Tumor1__Normal1', 'all', 'COMPLETED', '100.0', '2' ], lines)
+        records = json.loads(calc_time.format_pair_durations(pair_durations, 'json'))
+        self.assertEqual(records['Tumor1__Normal1']['pair']['FAILED'], { 'duration': 0.0, 'intervals': 1 })
+
+    def test_command(self):
+        trace_rows, sample_ids, pairs = synthetic_trace.make_trace(500, 4)
+        paths = synthetic_trace.write_files(self.tmpdir, trace_rows, sample_ids, pairs)
+        output = subprocess.check_output([ sys.executable, os.path.join(TEMPO_DIR, 'calc_time.py'), 'pairs', paths['trace'], paths['pairing'], '--format', 'json' ])
+        records = json.loads(output.decode('utf-8'))
+        self.assertEqual(sorted(records.keys()), sorted([ tumor_id + '__' + normal_id for tumor_id, normal_id in pairs ]))
+        # the pairing file defaults to pairing.tsv in the current dir
+        output = subprocess.check_output([ sys.executable, os.path.join(TEMPO_DIR, 'calc_time.py'), 'pairs', paths['trace'] ], cwd = self.tmpdir)
+        self.assertEqual(len(output.decode('utf-8').splitlines()), len(pairs))
+
+def write_diff_run(output_dir, trace_rows, sample_ids, pairs, process = None, factor = 1.0):
+    """
+    Write a run of a synthetic trace, with the realtime of the tasks of one process multiplied by a factor and the same queue wait
+    """
+    trace_rows = dict( (column, list(values)) for column, values in trace_rows.items() )
+    if process != None:
+        rows = [ i for i, name in enumerate(trace_rows['process']) if name == process ]
+        realtime = mem_convert.parse_column([ trace_rows['realtime'][i] for i in rows ], 'duration').astype(np.int64)
+        duration = mem_convert.parse_column([ trace_rows['duration'][i] for i in rows ], 'duration').astype(np.int64)
+        new_realtime = (realtime * factor).astype(np.int64)
+        for i, new_realtime_value, new_duration_value in zip(rows, synthetic_trace.format_durations(new_realtime), synthetic_trace.format_durations(duration + new_realtime - realtime)):
+            trace_rows['realtime'][i] = new_realtime_value
+            trace_rows['duration'][i] = new_duration_value
+    return(synthetic_trace.write_files(output_dir, trace_rows, sample_ids, pairs)['trace'])
+
+class TestTraceDiff(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # one run where every task completed, with about a hundred tasks per process, each with its own tag
+        self.trace_rows, self.sample_ids, self.pairs = synthetic_trace.make_trace(1500, 400, missing = 0, status_weights = { 'COMPLETED': 1.0 })
+        self.baseline = write_diff_run(os.path.join(self.tmpdir, 'baseline'), self.trace_rows, self.sample_ids, self.pairs)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_mann_whitney(self):
+        group_codes = np.array([ 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 2, 2 ], dtype = np.int64)
+        values = np.array([ 1, 2, 3, 4, 5, 6, 1, 2, 2, 2, 3, 1, 2 ], dtype = np.float64)
+        second = np.array([ 0, 0, 0, 1, 1, 1, 0, 0, 1, 0, 1, 0, 0 ], dtype = bool)
+        n1, n2, u, z, p_values = calc_time.grouped_mann_whitney(group_codes, values, second, 3)
+        self.assertEqual(n1.tolist(), [ 3, 3, 2 ])
+        self.assertEqual(n2.tolist(), [ 3, 2, 0 ])
+        # no ties: U = 9, variance = 3 * 3 / 12 * 7, z = (9 - 4.5 - 0.5) / sqrt(5.25)
+        self.assertEqual(u[0], 9.0)
+        self.assertAlmostEqual(z[0], 4.0 / math.sqrt(5.25))
+        self.assertAlmostEqual(p_values[0], 0.080856, places = 5)
+        # the three tied 2's share the rank 3: U = 3 + 5 - 3, variance = 3 * 2 / 12 * (6 - 24 / 20)
+        self.assertEqual(u[1], 5.0)
+        self.assertAlmostEqual(z[1], 1.5 / math.sqrt(2.4))
+        # no values in the second sample
+        self.assertEqual((z[2], p_values[2]), (0.0, 1.0))
+        # the same test the other way around has the opposite z score
+        n1, n2, u, z, p_values = calc_time.grouped_mann_whitney(group_codes, values, ~second, 3)
+        self.assertAlmostEqual(z[0], -4.0 / math.sqrt(5.25))
+        self.assertAlmostEqual(p_values[0], 0.080856, places = 5)
+
+    def test_medians(self):
+        group_codes = np.array([ 1, 1, 1, 1, 0, 0, 0 ], dtype = np.int64)
+        values = np.array([ 4, 1, 3, 2, 9, 5, 7 ], dtype = np.float64)
+        medians = calc_time.grouped_medians(group_codes, values, 3)
+        self.assertEqual(medians[:2].tolist(), [ 7.0, 2.5 ])
+        self.assertTrue(np.isnan(medians[2]))
+
+    def test_select_rows(self):
+        # the last completed row of each task, leaving out the cached and failed ones
+        status = np.array([ 'COMPLETED', 'FAILED', 'COMPLETED', 'CACHED', 'COMPLETED', 'COMPLETED' ], dtype = object)
+        keys = np.array([ 1, 2, 2, 3, 1, 4 ], dtype = np.int64)
+        self.assertEqual(calc_time.select_diff_rows(status, keys).tolist(), [ 2, 4, 5 ])
+
+    def test_identical_runs(self):
+        comparison = calc_time.calculate_trace_diff([ self.baseline, self.baseline ])[0]
+        self.assertEqual([ record for record in comparison['records'] if record['regression'] ], [])
+        self.assertEqual(len(comparison['records']), len(calc_time.DIFF_METRICS) * (len(synthetic_trace.SAMPLE_PROCESSES) + len(synthetic_trace.PAIR_PROCESSES)))
+        for record in comparison['records']:
+            self.assertEqual((record['change'], record['p_value']), (0.0, 1.0))
+
+    def test_slowdown(self):
+        slower = write_diff_run(os.path.join(self.tmpdir, 'slower'), self.trace_rows, self.sample_ids, self.pairs, 'RunMutect2', 2.0)
+        records = calc_time.calculate_trace_diff([ self.baseline, slower ])[0]['records']
+        regressions = [ record for record in records if record['regression'] ]
+        self.assertEqual([ (record['process'], record['metric']) for record in regressions ], [ ('RunMutect2', 'realtime') ])
+        self.assertAlmostEqual(regressions[0]['change'], 1.0, places = 2)
+        # the p-values are adjusted for the number of comparisons with the Bonferroni correction
+        for record in records:
+            self.assertAlmostEqual(record['p_value'], min(1.0, math.erfc(abs(record['z']) / math.sqrt(2)) * len(records)))
+        # the faster run has no regressions
+        records = calc_time.calculate_trace_diff([ slower, self.baseline ])[0]['records']
+        self.assertEqual([ record for record in records if record['regression'] ], [])
+
+    def test_min_change(self):
+        slower = write_diff_run(os.path.join(self.tmpdir, 'slower'), self.trace_rows, self.sample_ids, self.pairs, 'RunMutect2', 2.0)
+        records = calc_time.calculate_trace_diff([ self.baseline, slower ], min_change = 1.5)[0]['records']
+        self.assertEqual([ record for record in records if record['regression'] ], [])
+        record = [ record for record in records if (record['process'], record['metric']) == ('RunMutect2', 'realtime') ][0]
+        self.assertLess(record['p_value'], 0.05)
+
+    def test_align(self):
+        # the same run with extra slow tasks for new pairs; they are not in the baseline, so they are only compared without aligning
+        trace_rows = dict( (column, list(values)) for column, values in self.trace_rows.items() )
+        first = trace_rows['process'].index('RunMutect2')
+        for i in range(50):
+            for column, values in trace_rows.items():
+                values.append(values[first])
+            trace_rows['tag'][-1] = 'NewTumor{i}__NewNormal{i}'.format(i = i)
+            trace_rows['realtime'][-1] = '10h 0m 0s'
+            trace_rows['duration'][-1] = '10h 0m 0s'
+        more = write_diff_run(os.path.join(self.tmpdir, 'more'), trace_rows, self.sample_ids, self.pairs)
+        comparison = calc_time.calculate_trace_diff([ self.baseline, more ])[0]
+        self.assertEqual([ record for record in comparison['records'] if record['regression'] ], [])
+        # one task for each process and tag of the baseline
+        self.assertEqual(comparison['tasks'], len(set(zip(self.trace_rows['process'], self.trace_rows['tag']))))
+        records = calc_time.calculate_trace_diff([ self.baseline, more ], align = False)[0]['records']
+        self.assertEqual([ (record['process'], record['metric']) for record in records if record['regression'] ], [ ('RunMutect2', 'realtime') ])
+
+    def test_command(self):
+        slower = write_diff_run(os.path.join(self.tmpdir, 'slower'), self.trace_rows, self.sample_ids, self.pairs, 'RunMutect2', 2.0)
+        output = subprocess.check_output([ sys.executable, os.path.join(TEMPO_DIR, 'calc_time.py'), 'diff', self.baseline, slower, '--format', 'json' ])
+        result = json.loads(output.decode('utf-8'))
+        self.assertEqual(result['baseline'], self.baseline)
+        self.assertEqual([ record['process'] for record in result['comparisons'][0]['records'] if record['regression'] ], [ 'RunMutect2' ])
+        output = subprocess.check_output([ sys.executable, os.path.join(TEMPO_DIR, 'calc_time.py'), 'diff', self.baseline, slower ])
+        lines = output.decode('utf-8').splitlines()
+        self.assertTrue(lines[0].startswith('{slower} vs {baseline}: 1 regressions'.format(slower = slower, baseline = self.baseline)))
+        self.assertTrue(lines[1].startswith('RunMutect2\trealtime\t'))
+
+if __name__ == '__main__':
+    unittest.main()
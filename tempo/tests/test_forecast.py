@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for forecast.py
+
+$ python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import forecast
+
+TRACE_COLUMNS = [ 'task_id', 'process', 'tag', 'name', 'status', 'submit', 'start', 'complete', 'realtime' ]
+
+HISTORY = {
+'runs': 1,
+'parallelism': 1.0,
+'processes': {
+'AlignReads': { 'median_seconds': 100.0, 'tasks_per_sample': 2.0, 'run_tasks': 0.0 },
+'RunMutect2': { 'median_seconds': 300.0, 'tasks_per_sample': 1.0, 'run_tasks': 0.0 }
+}
+}
+
+class TestForecast(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.trace_file = os.path.join(self.tmpdir, 'trace.txt')
+        old_tz = os.environ.get('TZ')
+        self.addCleanup(self.restore_tz, old_tz)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def restore_tz(self, old_tz):
+        if old_tz == None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = old_tz
+        time.tzset()
+
+    def write_trace(self, rows):
+        """
+        Write a trace file with rows of (process, tag, status, submit, complete), the times as epoch seconds
+        written as local times the same way Nextflow does
+        """
+        def local_time(seconds):
+            return(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(seconds)) + '.000')
+        with open(self.trace_file, 'w') as fout:
+            fout.write('\t'.join(TRACE_COLUMNS) + '\n')
+            for task_id, (process, tag, status, submit, complete) in enumerate(rows):
+                fout.write('\t'.join([ str(task_id + 1), process, tag, '{process} ({tag})'.format(process = process, tag = tag), status,
+                    local_time(submit), local_time(submit), local_time(complete), '{seconds}s'.format(seconds = complete - submit) ]) + '\n')
+
+    def test_elapsed_seconds_local_time(self):
+        # the trace timestamps are New York times, which are 4 or 5 hours off from UTC
+        os.environ['TZ'] = 'America/New_York'
+        time.tzset()
+        now = float(int(time.time()))
+        self.write_trace([ ('AlignReads', 'Sample1@RG1', 'COMPLETED', now - 600, now - 500) ])
+        result = forecast.forecast(self.trace_file, [ 'Sample1' ], HISTORY, now)
+        self.assertAlmostEqual(result['elapsed_seconds'], 600.0, delta = 1.0)
+        self.assertEqual(result['eta'], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now + result['remaining_seconds'])))
+
+    def test_remaining_seconds(self):
+        now = float(int(time.time()))
+        self.write_trace([
+            ('AlignReads', 'Sample1@RG1', 'COMPLETED', now - 600, now - 500),
+            ('AlignReads', 'Sample2@RG1', 'FAILED', now - 600, now - 500)
+            ])
+        result = forecast.forecast(self.trace_file, [ 'Sample1', 'Sample2' ], HISTORY, now)
+        self.assertEqual((result['done_tasks'], result['failed_tasks']), (1, 1))
+        # Sample1 has one AlignReads and the RunMutect2 left, Sample2 all three tasks
+        self.assertEqual([ (sample['sample'], sample['remaining_seconds']) for sample in result['samples'] ], [ ('Sample2', 500.0), ('Sample1', 400.0) ])
+        self.assertEqual(result['remaining_seconds'], 500.0)
+
+    def test_not_started(self):
+        result = forecast.forecast(None, [ 'Sample1' ], HISTORY, 0.0)
+        self.assertEqual(result['elapsed_seconds'], None)
+        self.assertEqual(result['remaining_seconds'], 500.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for jira_client.py, against a stand-in Jira server started with http.server on localhost
+
+$ python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import jira_client
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Records each request, and answers with the next response queued for its path, or 201 with an empty JSON object
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests.append({ 'path': self.path, 'headers': dict(self.headers), 'body': body, 'client': self.client_address })
+            responses = server.responses.get(self.path, [])
+            status, headers, delay, close = responses.pop(0) if len(responses) > 0 else (201, {}, 0, False)
+        if self.path.endswith('/attachments') and server.upload_barrier != None:
+            # only passes once all the uploads are being handled at the same time
+            try:
+                server.upload_barrier.wait()
+            except threading.BrokenBarrierError:
+                status = 500
+        if delay > 0:
+            time.sleep(delay)
+        data = b'{}'
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        try:
+            self.end_headers()
+            self.wfile.write(data)
+        except OSError:
+            # the client gave up waiting
+            return
+        # closing without a 'Connection: close' header, the same as a server dropping an idle kept-alive connection
+        self.close_connection = close
+
+class TestJiraClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.responses = {}
+        self.server.upload_barrier = None
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{port}'.format(port = self.server.server_address[1])
+        self.client = jira_client.JiraClient(self.url, 'user', 'secret', timeout = 5, retries = 3, backoff = 0.01)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def queue(self, path, *responses):
+        self.server.responses[path] = list(responses)
+
+    def test_comment(self):
+        data = { 'body': 'Pipeline started' }
+        self.client.comment('CT-1', data)
+        self.assertEqual(len(self.server.requests), 1)
+        request = self.server.requests[0]
+        self.assertEqual(request['path'], '/rest/api/2/issue/CT-1/comment')
+        self.assertEqual(json.loads(request['body'].decode('utf-8')), data)
+        self.assertEqual(request['headers']['Content-Type'], 'application/json')
+        self.assertEqual(request['headers']['Authorization'], 'Basic dXNlcjpzZWNyZXQ=')
+
+    def test_concurrent_uploads(self):
+        self.server.upload_barrier = threading.Barrier(3, timeout = 5)
+        upload_files = []
+        for name in [ 'mapping.tsv', 'pairing.tsv', 'nextflow.html' ]:
+            path = os.path.join(self.tmpdir, name)
+            with open(path, 'w') as fout:
+                fout.write(name + ' contents\n')
+            upload_files.append(path)
+        missing_file = os.path.join(self.tmpdir, 'missing.txt')
+        errors = jira_client.send_messages(self.client, 'CT-1', { 'body': 'done' }, upload_files + [ missing_file ], threads = 4)
+        self.assertEqual(errors, [])
+        uploads = [ request for request in self.server.requests if request['path'] == '/rest/api/2/issue/CT-1/attachments' ]
+        comments = [ request for request in self.server.requests if request['path'] == '/rest/api/2/issue/CT-1/comment' ]
+        self.assertEqual(len(uploads), 3)
+        self.assertEqual(len(comments), 1)
+        for upload in uploads:
+            self.assertEqual(upload['headers']['X-Atlassian-Token'], 'nocheck')
+            self.assertTrue(upload['headers']['Content-Type'].startswith('multipart/form-data; boundary='))
+        bodies = b''.join([ upload['body'] for upload in uploads ])
+        for name in [ 'mapping.tsv', 'pairing.tsv', 'nextflow.html' ]:
+            self.assertIn('filename="{name}"'.format(name = name).encode('utf-8'), bodies)
+            self.assertIn((name + ' contents\n').encode('utf-8'), bodies)
+
+    def test_retry_busy_server(self):
+        path = '/rest/api/2/issue/CT-1/comment'
+        self.queue(path, (429, { 'Retry-After': '0' }, 0, False), (503, {}, 0, False))
+        self.client.comment('CT-1', { 'body': 'retried' })
+        self.assertEqual([ request['path'] for request in self.server.requests ], [ path ] * 3)
+
+    def test_retry_gives_up(self):
+        path = '/rest/api/2/issue/CT-1/comment'
+        self.queue(path, *[ (503, {}, 0, False) ] * 4)
+        with self.assertRaises(jira_client.JiraError) as context:
+            self.client.comment('CT-1', { 'body': 'busy' })
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_backoff(self):
+        self.assertEqual(self.client.retry_wait(0, '7'), 7.0)
+        for attempt in range(4):
+            wait = self.client.retry_wait(attempt)
+            self.assertGreaterEqual(wait, 0.01 * 2 ** attempt / 2)
+            self.assertLessEqual(wait, 0.01 * 2 ** attempt)
+
+    def test_no_retry_after_server_error(self):
+        # the server may have posted the comment before it failed, so it must not be sent again
+        self.queue('/rest/api/2/issue/CT-1/comment', (500, {}, 0, False))
+        with self.assertRaises(jira_client.JiraError) as context:
+            self.client.comment('CT-1', { 'body': 'once' })
+        self.assertEqual(context.exception.status, 500)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_no_retry_after_timeout(self):
+        client = jira_client.JiraClient(self.url, 'user', 'secret', timeout = 0.5, retries = 3, backoff = 0.01)
+        self.queue('/rest/api/2/issue/CT-1/comment', (201, {}, 1.5, False))
+        try:
+            with self.assertRaises(jira_client.JiraError):
+                client.comment('CT-1', { 'body': 'once' })
+        finally:
+            client.close()
+        time.sleep(1.2)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retry_connect_error(self):
+        # a port that nothing listens on
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        client = jira_client.JiraClient('http://127.0.0.1:{port}'.format(port = port), 'user', 'secret', retries = 2, backoff = 0.01)
+        waits = []
+        client.retry_wait = lambda attempt, retry_after = None: waits.append(attempt) or 0
+        with self.assertRaises(jira_client.JiraError):
+            client.comment('CT-1', { 'body': 'never sent' })
+        self.assertEqual(waits, [ 0, 1 ])
+
+    def test_keep_alive(self):
+        for i in range(3):
+            self.client.comment('CT-1', { 'body': str(i) })
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(set([ request['client'] for request in self.server.requests ])), 1)
+        self.assertEqual(len(self.client.connections), 1)
+
+    def test_stale_keep_alive(self):
+        # the server drops the connection after the first request; the second request goes out again on a new connection
+        self.queue('/rest/api/2/issue/CT-1/comment', (201, {}, 0, True))
+        waits = []
+        self.client.retry_wait = lambda attempt, retry_after = None: waits.append(attempt) or 0
+        self.client.comment('CT-1', { 'body': 'first' })
+        time.sleep(0.2)
+        self.client.comment('CT-1', { 'body': 'second' })
+        bodies = [ json.loads(request['body'].decode('utf-8'))['body'] for request in self.server.requests ]
+        self.assertEqual(bodies, [ 'first', 'second' ])
+        self.assertEqual(waits, [ 0 ])
+        self.assertEqual(len(set([ request['client'] for request in self.server.requests ])), 2)
+
+if __name__ == '__main__':
+    unittest.main()
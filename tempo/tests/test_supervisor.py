@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for supervisor.py, with a dummy child process in place of Nextflow
+
+$ python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import time
+import signal
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+from unittest import mock
+TEMPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TEMPO_DIR)
+import supervisor
+
+# a stand-in for Nextflow that records the signal it gets, then exits; usage: child.py ready_file signal_file
+DUMMY_CHILD = """
+import sys, time, signal
+def on_signal(signum, frame):
+    with open(sys.argv[2], 'w') as fout:
+        fout.write(signal.Signals(signum).name)
+    sys.exit(0)
+signal.signal(signal.SIGTERM, on_signal)
+open(sys.argv[1], 'w').close()
+time.sleep(60)
+sys.exit(5)
+"""
+
+# runs supervisor.py with a slow stand-in for the exit hooks; usage: runner.py tempo_dir hook_started_file hook_done_file args...
+HOOK_RUNNER = """
+import os, sys, time
+sys.path.insert(0, sys.argv[1])
+import supervisor
+started_file, done_file = sys.argv[2:4]
+def slow_hook(options):
+    open(started_file, 'w').close()
+    time.sleep(1)
+    open(done_file, 'w').close()
+supervisor.HOOKS['calc_time'] = slow_hook
+sys.argv = [ 'supervisor.py' ] + sys.argv[4:]
+supervisor.main()
+"""
+
+def wait_for_file(path, timeout = 10):
+    stop = time.time() + timeout
+    while not os.path.exists(path):
+        if time.time() > stop:
+            raise AssertionError("{path} was not written".format(path = path))
+        time.sleep(0.05)
+
+def read_file(path):
+    with open(path) as fin:
+        return(fin.read())
+
+class TestSupervise(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.child_file = os.path.join(self.tmpdir, 'child.py')
+        with open(self.child_file, 'w') as fout:
+            fout.write(DUMMY_CHILD)
+        self.ready_file = os.path.join(self.tmpdir, 'ready')
+        self.signal_file = os.path.join(self.tmpdir, 'signal')
+        self.pid_file = os.path.join(self.tmpdir, '.nextflow.pid')
+        self.exitcode_file = os.path.join(self.tmpdir, '.exitcode')
+        log_patch = mock.patch.object(supervisor, 'log')
+        log_patch.start()
+        self.addCleanup(log_patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_exit_code(self):
+        exitcode, killed = supervisor.supervise([ sys.executable, '-c', 'import sys; sys.exit(3)' ], self.pid_file, self.exitcode_file)
+        self.assertEqual((exitcode, killed), (3, False))
+        self.assertEqual(read_file(self.exitcode_file), '3\n')
+        self.assertTrue(read_file(self.pid_file).strip().isdigit())
+
+    def test_child_killed_by_signal(self):
+        exitcode, killed = supervisor.supervise([ sys.executable, '-c', 'import os, signal; os.kill(os.getpid(), signal.SIGKILL)' ], None, self.exitcode_file)
+        self.assertEqual((exitcode, killed), (128 + signal.SIGKILL, False))
+        self.assertEqual(read_file(self.exitcode_file), '{code}\n'.format(code = 128 + signal.SIGKILL))
+
+    def run_supervisor(self, signum):
+        """
+        Start supervisor.py with the dummy child and no hooks, send it a signal once the child is ready, and wait for it to exit
+        """
+        lockfile = os.path.join(self.tmpdir, '.submitted')
+        supervisor_pid_file = os.path.join(self.tmpdir, 'supervisor.pid')
+        open(lockfile, 'w').close()
+        process = subprocess.Popen([ sys.executable, os.path.join(TEMPO_DIR, 'supervisor.py'),
+            '--pid-file', self.pid_file, '--exitcode-file', self.exitcode_file, '--lockfile', lockfile,
+            '--supervisor-pid-file', supervisor_pid_file, '--hooks',
+            '--', sys.executable, self.child_file, self.ready_file, self.signal_file ], stdout = subprocess.DEVNULL)
+        try:
+            wait_for_file(self.ready_file)
+            self.assertEqual(read_file(supervisor_pid_file).strip(), str(process.pid))
+            process.send_signal(signum)
+            returncode = process.wait(timeout = 30)
+        finally:
+            if process.poll() == None:
+                process.kill()
+        self.assertFalse(os.path.exists(lockfile))
+        return(returncode)
+
+    def test_forward_term(self):
+        returncode = self.run_supervisor(signal.SIGTERM)
+        self.assertEqual(read_file(self.signal_file), 'SIGTERM')
+        self.assertEqual(returncode, supervisor.KILLED_EXITCODE)
+        self.assertEqual(read_file(self.exitcode_file), '{code}\n'.format(code = supervisor.KILLED_EXITCODE))
+
+    def test_forward_usr2(self):
+        # LSF sends SIGUSR2 before a job reaches its run limit; it is passed on as SIGTERM
+        returncode = self.run_supervisor(signal.SIGUSR2)
+        self.assertEqual(read_file(self.signal_file), 'SIGTERM')
+        self.assertEqual(returncode, supervisor.KILLED_EXITCODE)
+
+    def test_signal_during_hooks(self):
+        # bkill sends SIGINT, then SIGTERM a while later; the second one must not stop the exit hooks
+        runner_file = os.path.join(self.tmpdir, 'runner.py')
+        with open(runner_file, 'w') as fout:
+            fout.write(HOOK_RUNNER)
+        started_file = os.path.join(self.tmpdir, 'hook_started')
+        done_file = os.path.join(self.tmpdir, 'hook_done')
+        process = subprocess.Popen([ sys.executable, runner_file, TEMPO_DIR, started_file, done_file,
+            '--exitcode-file', self.exitcode_file, '--hooks', 'calc_time',
+            '--', sys.executable, '-c', 'import sys; sys.exit(3)' ], stdout = subprocess.PIPE)
+        try:
+            wait_for_file(started_file)
+            process.send_signal(signal.SIGTERM)
+            output, errors = process.communicate(timeout = 30)
+        finally:
+            if process.poll() == None:
+                process.kill()
+        self.assertEqual(process.returncode, 3)
+        self.assertTrue(os.path.exists(done_file))
+        self.assertIn(b'trap: SIGTERM; ignored, the command already exited', output)
+
+class TestHooks(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def record(self, name, fail = False):
+        def hook(options):
+            with self.lock:
+                self.events.append(('start', name))
+            time.sleep(0.2)
+            with self.lock:
+                self.events.append(('end', name))
+            if fail:
+                raise RuntimeError("{name} failed".format(name = name))
+        return(hook)
+
+    def run_hooks(self, names, failing = None):
+        hooks = dict( (name, self.record(name, name == failing)) for name in supervisor.HOOKS )
+        with mock.patch.dict(supervisor.HOOKS, hooks), mock.patch.object(supervisor, 'log'):
+            return(supervisor.run_hooks(names, {}))
+
+    def test_order(self):
+        failed = self.run_hooks([ 'check-errors', 'calc_time', 'jira' ])
+        self.assertEqual(failed, [])
+        # check-errors and calc_time run at the same time, and jira only after both of them
+        starts = [ name for event, name in self.events[:2] ]
+        self.assertEqual(sorted(starts), [ 'calc_time', 'check-errors' ])
+        self.assertEqual(self.events[-2:], [ ('start', 'jira'), ('end', 'jira') ])
+
+    def test_failed_hook(self):
+        failed = self.run_hooks([ 'check-errors', 'calc_time', 'jira' ], failing = 'calc_time')
+        self.assertEqual(failed, [ 'calc_time' ])
+        self.assertIn(('end', 'jira'), self.events)
+
+    def test_selected_hooks(self):
+        self.run_hooks([ 'jira' ])
+        self.assertEqual(self.events, [ ('start', 'jira'), ('end', 'jira') ])
+
+if __name__ == '__main__':
+    unittest.main()
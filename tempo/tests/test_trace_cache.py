@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for trace_cache.py
+
+$ python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import calc_time
+import trace_cache
+import synthetic_trace
+
+class TestTraceCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        trace_rows, sample_ids, pairs = synthetic_trace.make_trace(2000, 10)
+        self.trace_file = synthetic_trace.write_files(self.tmpdir, trace_rows, sample_ids, pairs)['trace']
+        self.expected = calc_time.load_trace(self.trace_file, calc_time.CACHE_COLUMNS, cache = False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assert_trace(self, trace):
+        for column in calc_time.CACHE_COLUMNS:
+            self.assertTrue(np.array_equal(trace[column], self.expected[column]), column)
+
+    def test_saved(self):
+        self.assert_trace(calc_time.load_trace(self.trace_file, calc_time.CACHE_COLUMNS))
+        metadata, trace = trace_cache.load_cache(self.trace_file)
+        self.assertEqual(trace_cache.check_cache(self.trace_file, metadata), 'current')
+        self.assert_trace(trace)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), [ 'mapping.tsv', 'pairing.tsv', 'trace.txt', 'trace.txt.cache.npz' ])
+
+    def test_corrupt_cache(self):
+        calc_time.load_trace(self.trace_file, calc_time.CACHE_COLUMNS)
+        path = trace_cache.cache_path(self.trace_file)
+        with open(path, 'rb') as fin:
+            data = fin.read()
+        # a cache that was cut short, and one that is not a zip file at all
+        for corrupt in [ data[:len(data) // 2], b'not a cache' ]:
+            with open(path, 'wb') as fout:
+                fout.write(corrupt)
+            self.assertEqual(trace_cache.load_cache(self.trace_file), (None, {}))
+            self.assert_trace(calc_time.load_trace(self.trace_file, calc_time.CACHE_COLUMNS))
+            self.assertEqual(trace_cache.check_cache(self.trace_file, trace_cache.load_cache(self.trace_file)[0]), 'current')
+
+    def test_threads(self):
+        # the exit hooks run in threads of the same process, and can save the cache of the same trace file at the same time
+        errors = []
+        def load():
+            try:
+                self.assert_trace(calc_time.load_trace(self.trace_file, calc_time.CACHE_COLUMNS))
+            except Exception as e:
+                errors.append(e)
+        threads = [ threading.Thread(target = load) for i in range(4) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertFalse([ name for name in os.listdir(self.tmpdir) if name.endswith('.tmp') ])
+        self.assert_trace(trace_cache.load_cache(self.trace_file)[1])
+
+if __name__ == '__main__':
+    unittest.main()
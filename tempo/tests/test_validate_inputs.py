@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for validate_inputs.py
+
+$ python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+import unittest
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import validate_inputs
+
+# a gzip member of this many bytes ends with a size trailer of 1f 8b 08 00, the same bytes as the start of a gzip header
+MAGIC_SIZE = 0x088b1f
+
+class TestCheckFastq(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_file(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as fout:
+            fout.write(data)
+        return(path)
+
+    def test_complete(self):
+        path = self.write_file('sample_R1.fastq.gz', gzip.compress(b'@read1\nACGT\n+\nIIII\n' * 1000))
+        result = validate_inputs.check_fastq(path)
+        self.assertEqual((result['error'], result['warning']), (None, None))
+
+    def test_cut_short(self):
+        data = gzip.compress(b'@read1\nACGT\n+\nIIII\n' * 1000)
+        path = self.write_file('sample_R1.fastq.gz', data[:len(data) // 2])
+        self.assertEqual(validate_inputs.check_fastq(path)['error'], 'gzip stream ends before its trailer; the file was cut short')
+
+    def test_magic_in_trailer(self):
+        data = gzip.compress(b'A' * MAGIC_SIZE)
+        self.assertEqual(data[-4:], b'\x1f\x8b\x08\x00')
+        result = validate_inputs.check_fastq(self.write_file('small_R1.fastq.gz', data))
+        self.assertEqual((result['error'], result['warning']), (None, None))
+        # the start of the member is not in the tail, so the file is not checked unless with 'full'
+        random_data = np.random.RandomState(1).bytes(MAGIC_SIZE)
+        data = gzip.compress(random_data)
+        self.assertGreater(len(data), validate_inputs.TAIL_SIZE)
+        self.assertEqual(data[-4:], b'\x1f\x8b\x08\x00')
+        path = self.write_file('large_R1.fastq.gz', data)
+        result = validate_inputs.check_fastq(path)
+        self.assertEqual((result['error'], result['warning']), (None, validate_inputs.UNCHECKED_TRAILER))
+        result = validate_inputs.check_fastq(path, full = True)
+        self.assertEqual((result['error'], result['warning']), (None, None))
+
+    def test_header_length(self):
+        header = gzip.compress(b'', mtime = 0)[:10]
+        self.assertEqual(validate_inputs.gzip_header_length(header), 10)
+        self.assertEqual(validate_inputs.gzip_header_length(header[:9]), None)
+        # a file name that does not end in the data
+        named = header[:3] + bytes([ validate_inputs.FNAME ]) + header[4:] + b'reads.fastq'
+        self.assertEqual(validate_inputs.gzip_header_length(named), None)
+        self.assertEqual(validate_inputs.gzip_header_length(named + b'\x00'), len(named) + 1)
+        # reserved flags
+        self.assertEqual(validate_inputs.gzip_header_length(header[:3] + b'\x80' + header[4:]), None)
+
+if __name__ == '__main__':
+    unittest.main()
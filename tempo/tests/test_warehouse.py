@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for warehouse.py
+
+$ python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import warehouse
+
+class TestQueries(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.connection = warehouse.connect(os.path.join(self.tmpdir, 'runs.db'))
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.tmpdir)
+
+    def query_plan(self, name, **options):
+        sql, parameters = warehouse.build_query(name, options)
+        return(' | '.join([ row[-1] for row in self.connection.execute('EXPLAIN QUERY PLAN ' + sql, parameters) ]))
+
+    def test_filters(self):
+        sql, parameters = warehouse.build_query('process', { 'process': 'RunMutect2', 'version': None, 'project': None })
+        self.assertIn("WHERE tasks.status = 'COMPLETED' AND tasks.process = :process", sql)
+        self.assertEqual(parameters, { 'process': 'RunMutect2' })
+        # options that a query does not filter on are left out
+        sql, parameters = warehouse.build_query('runs', { 'process': 'RunMutect2', 'version': None, 'project': None })
+        self.assertNotIn('WHERE', sql)
+        self.assertEqual(parameters, {})
+
+    def test_indexes(self):
+        self.assertIn('tasks_process_status', self.query_plan('process', process = 'RunMutect2'))
+        self.assertIn('tasks_process_status', self.query_plan('version', process = 'RunMutect2'))
+        self.assertIn('runs_project', self.query_plan('runs', project = 'ProjA'))
+        self.assertIn('runs_version', self.query_plan('samples', version = '1.3.1'))
+
+    def test_query(self):
+        for name in warehouse.QUERIES.keys():
+            columns, rows = warehouse.query(os.path.join(self.tmpdir, 'runs.db'), name, process = 'RunMutect2', version = '1.3.1', project = 'ProjA')
+            self.assertGreater(len(columns), 0)
+            self.assertEqual(rows, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for work_usage.py
+
+$ python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import work_usage
+
+class TestScanWorkDir(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.work_dir = os.path.join(self.tmpdir, 'work')
+        self.cache_file = os.path.join(self.tmpdir, work_usage.CACHE_FILE)
+        self.finished_dir = self.make_task('4f/3a2c1e0123', { '.command.log': 1000, 'reads.bam': 100000, '.exitcode': 1 })
+        self.running_dir = self.make_task('a1/b2c3d40123', { '.command.log': 1000 })
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_task(self, task_dir, files):
+        path = os.path.join(self.work_dir, task_dir)
+        os.makedirs(path)
+        for name, size in files.items():
+            self.write_file(os.path.join(path, name), size)
+        return(task_dir)
+
+    def write_file(self, path, size, mode = 'w'):
+        with open(path, mode) as fout:
+            fout.write('x' * size)
+            fout.flush()
+            os.fsync(fout.fileno())
+
+    def test_cache(self):
+        usage = work_usage.scan_work_dir(self.work_dir, self.cache_file)
+        self.assertEqual(sorted(usage.keys()), sorted([ self.finished_dir, self.running_dir ]))
+        self.assertEqual((usage[self.finished_dir]['files'], usage[self.finished_dir]['finished']), (3, True))
+        self.assertEqual((usage[self.running_dir]['files'], usage[self.running_dir]['finished']), (1, False))
+        # only the finished task is cached
+        with open(self.cache_file) as fin:
+            self.assertEqual(list(json.load(fin).keys()), [ self.finished_dir ])
+
+        # a running task's log grows in place, which does not change the mtime of its dir
+        log_file = os.path.join(self.work_dir, self.running_dir, '.command.log')
+        before = usage[self.running_dir]['bytes']
+        self.write_file(log_file, 1000000, mode = 'a')
+        usage = work_usage.scan_work_dir(self.work_dir, self.cache_file)
+        self.assertGreater(usage[self.running_dir]['bytes'], before + 900000)
+
+    def test_cached_usage_is_used(self):
+        work_usage.scan_work_dir(self.work_dir, self.cache_file)
+        with open(self.cache_file) as fin:
+            cache = json.load(fin)
+        cache[self.finished_dir]['bytes'] = 1
+        with open(self.cache_file, 'w') as fout:
+            json.dump(cache, fout)
+        usage = work_usage.scan_work_dir(self.work_dir, self.cache_file)
+        self.assertEqual(usage[self.finished_dir]['bytes'], 1)
+        # entries saved before the 'finished' flag was added are walked again
+        del cache[self.finished_dir]['finished']
+        with open(self.cache_file, 'w') as fout:
+            json.dump(cache, fout)
+        usage = work_usage.scan_work_dir(self.work_dir, self.cache_file)
+        self.assertGreater(usage[self.finished_dir]['bytes'], 100000)
+
+if __name__ == '__main__':
+    unittest.main()
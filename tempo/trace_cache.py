@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sidecar cache of the parsed columns of a Nextflow trace.txt file
+Saved next to the trace file as a .npz file so that repeated calc_time.py and message.py runs
+can skip reading and parsing the trace file
+
+The cache records the identity of the trace file it was made from (path, size, mtime, inode) along with
+the byte offset of the last row read, so that it can be extended with just the new rows when the trace file grows
+
+$ ./trace_cache.py logs/2020-04-21_12-43-46/trace.txt
+"""
+import os
+import sys
+import json
+import zlib
+import zipfile
+import tempfile
+import numpy as np
+
+# bump this when the layout of the cache file changes
+CACHE_VERSION = 1
+
+# number of bytes before the cached offset used to check that the cached part of the trace file has not changed
+FINGERPRINT_SIZE = 65536
+
+def cache_path(trace_file):
+    """
+    Get the path to the cache file for a trace file
+    """
+    return(trace_file + '.cache.npz')
+
+def file_identity(trace_file):
+    """
+    Get the values that identify the current state of a file
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { 'path': str, 'size': int, 'mtime': int, 'inode': int }
+    """
+    stat = os.stat(trace_file)
+    identity = {
+    'path': os.path.realpath(trace_file),
+    'size': stat.st_size,
+    'mtime': stat.st_mtime_ns,
+    'inode': stat.st_ino
+    }
+    return(identity)
+
+def fingerprint(trace_file, offset):
+    """
+    Get a checksum of the bytes just before 'offset' in a file
+    """
+    start = max(0, offset - FINGERPRINT_SIZE)
+    with open(trace_file, 'rb') as fin:
+        fin.seek(start)
+        data = fin.read(offset - start)
+    return(zlib.crc32(data) & 0xffffffff)
+
+def load_cache(trace_file):
+    """
+    Load the cached columns for a trace file
+
+    Parameters
+    ----------
+    trace_file: str
+        path to the Nextflow trace.txt file
+
+    Output
+    ------
+    (metadata, trace)
+
+    metadata: dict|None
+        the metadata saved with the cache, including the identity of the trace file and the 'offset' of the next unread row;
+        None if there is no usable cache for the trace file
+    trace: dict
+        a dictionary in the format of { column: numpy.ndarray, ... }, with strings in object arrays
+    """
+    path = cache_path(trace_file)
+    if not os.path.exists(path):
+        return(None, {})
+    try:
+        with np.load(path, allow_pickle = False) as data:
+            metadata = json.loads(str(data['metadata']))
+            if metadata.get('version') != CACHE_VERSION:
+                return(None, {})
+            trace = {}
+            for column in metadata['columns']:
+                if column in metadata['categorical']:
+                    categories = np.empty(len(data[column + '.categories']), dtype = object)
+                    categories[:] = [ sys.intern(str(value)) for value in data[column + '.categories'] ]
+                    trace[column] = categories[data[column + '.codes']]
+                else:
+                    trace[column] = data[column]
+    except (OSError, IOError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        # a corrupt or partially written cache is ignored and replaced
+        return(None, {})
+    return(metadata, trace)
+
+def check_cache(trace_file, metadata):
+    """
+    Check whether the cache still matches the trace file
+
+    Output
+    ------
+    str:
+        'current' if the trace file has not changed, 'grown' if rows were only appended to the trace file since the
+        cache was saved, or 'stale' if the cache has to be rebuilt
+    """
+    if metadata == None:
+        return('stale')
+    identity = file_identity(trace_file)
+    cached = metadata['identity']
+    if identity['path'] != cached['path'] or identity['inode'] != cached['inode']:
+        return('stale')
+    if identity['size'] == cached['size'] and identity['mtime'] == cached['mtime']:
+        return('current')
+    if identity['size'] >= metadata['offset'] and fingerprint(trace_file, metadata['offset']) == metadata['fingerprint']:
+        return('grown')
+    return('stale')
+
+def save_cache(trace_file, trace, header, offset, identity):
+    """
+    Save the columns of a trace file to its cache file
+    Fails silently if the cache file cannot be written, e.g. in a read-only log dir
+
+    Parameters
+    ----------
+    trace_file: str
+        path to the Nextflow trace.txt file
+    trace: dict
+        a dictionary in the format of { column: numpy.ndarray, ... } of the rows in the trace file up to 'offset'
+    header: list
+        the column names from the header of the trace file
+    offset: int
+        the byte offset of the next unread row in the trace file
+    identity: dict
+        the file_identity() of the trace file from before it was read
+    """
+    metadata = {
+    'version': CACHE_VERSION,
+    'identity': identity,
+    'header': header,
+    'offset': offset,
+    'fingerprint': fingerprint(trace_file, offset),
+    'columns': list(trace.keys()),
+    'categorical': []
+    }
+    arrays = {}
+    for column, values in trace.items():
+        if values.dtype == object:
+            # store strings as codes into the unique values; most columns have very few unique values
+            lookup = {}
+            codes = np.fromiter(( lookup.setdefault(value, len(lookup)) for value in values ), dtype = np.int32, count = len(values))
+            categories = sorted(lookup, key = lookup.get)
+            arrays[column + '.codes'] = codes
+            arrays[column + '.categories'] = np.array(categories, dtype = np.str_) if len(categories) > 0 else np.zeros(0, dtype = np.str_)
+            metadata['categorical'].append(column)
+        else:
+            arrays[column] = values
+    arrays['metadata'] = np.array(json.dumps(metadata))
+
+    path = cache_path(trace_file)
+    # each save gets its own temp file, since several threads of the same process can save the cache of the same trace file
+    temp_path = None
+    try:
+        fd, temp_path = tempfile.mkstemp(prefix = os.path.basename(path) + '.', suffix = '.tmp', dir = os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'wb') as fout:
+            np.savez(fout, **arrays)
+        # mkstemp() only lets the owner read the file; the cache can be read by the same users as the trace file
+        os.chmod(temp_path, os.stat(trace_file).st_mode & 0o666)
+        os.rename(temp_path, path)
+    except (OSError, IOError):
+        if temp_path != None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def main():
+    """
+    Main control function for the script when run from CLI; build or update the cache for the given trace files
+    """
+    import calc_time
+    for trace_file in sys.argv[1:]:
+        trace = calc_time.load_trace(trace_file, calc_time.CACHE_COLUMNS)
+        print("{path}: {num_rows} rows".format(path = cache_path(trace_file), num_rows = len(trace['status'])))
+
+if __name__ == '__main__':
+    main()
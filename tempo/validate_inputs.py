@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Check the Tempo mapping and pairing files, and the FASTQ files they list, before the pipeline is submitted
+
+Checks for:
+- FASTQ files that are missing, empty, or not gzip files
+- gzip FASTQ files that were cut short, from the end of the file only (see check_gzip_tail()), or from the whole file with '--full'
+  for the single member gzip files where the end of the file does not show where the gzip member starts
+- FASTQ files listed more than once in the mapping file
+- pairing file sample ID's that are not in the mapping file
+- mapping file samples that are not in any pair
+
+The FASTQ files are checked in parallel with a pool of threads, since most of the time goes to waiting on the network file system.
+The results are saved to a cache file by the inode, size and mtime of each file, so files that did not change are not read again
+
+$ ./validate_inputs.py mapping.tsv pairing.tsv
+"""
+import os
+import sys
+import json
+import zlib
+import argparse
+from stat import S_ISREG
+from concurrent.futures import ThreadPoolExecutor
+import calc_time
+import bam_check
+
+CACHE_FILE = '.validate_inputs.cache.json'
+
+FASTQ_COLUMNS = [ 'FASTQ_PE1', 'FASTQ_PE2' ]
+MAPPING_COLUMNS = [ 'SAMPLE', 'TARGET' ] + FASTQ_COLUMNS
+PAIRING_COLUMNS = [ 'NORMAL_ID', 'TUMOR_ID' ]
+
+GZIP_MAGIC = b'\x1f\x8b\x08'
+
+# number of bytes to read from the end of each gzip file
+TAIL_SIZE = 256 * 1024
+
+# number of bytes to decompress at a time when checking a whole gzip file
+FULL_CHECK_CHUNK_SIZE = 4 * 1024 * 1024
+
+# the gzip trailer could not be found in the tail of the file; the file is most likely fine but was not fully checked
+UNCHECKED_TRAILER = 'gzip trailer not found in the last {size} KB; not checked'.format(size = TAIL_SIZE // 1024)
+
+# gzip header flags, see RFC 1952
+FHCRC = 0x02
+FEXTRA = 0x04
+FNAME = 0x08
+FCOMMENT = 0x10
+FRESERVED = 0xe0
+
+def gzip_header_length(data):
+    """
+    Get the length of the gzip member header at the start of the data
+
+    Output
+    ------
+    int|None
+        the length of the header, or None if the header is not valid or does not fit in the data
+    """
+    if len(data) < 10 or data[:3] != GZIP_MAGIC:
+        return(None)
+    flags, extra_flags, os_code = data[3], data[8], data[9]
+    if flags & FRESERVED or extra_flags not in (0, 2, 4) or not (os_code <= 13 or os_code == 255):
+        return(None)
+    length = 10
+    if flags & FEXTRA:
+        if len(data) < length + 2:
+            return(None)
+        length += 2 + data[length] + 256 * data[length + 1]
+    for flag in [ FNAME, FCOMMENT ]:
+        if flags & flag:
+            end = data.find(b'\x00', length)
+            if end < 0:
+                return(None)
+            length = end + 1
+    if flags & FHCRC:
+        length += 2
+    if length > len(data):
+        return(None)
+    return(length)
+
+def check_gzip_tail(tail):
+    """
+    Check that the tail of a gzip file ends with a complete gzip member
+
+    Looks for the start of the last gzip member in the tail, and decompresses it to the end of the file, which also checks
+    its CRC and size trailer. Files made of many small members, such as BGZF files, always have a member start in the tail.
+    The gzip magic bytes can also show up by chance, e.g. in the size trailer at the very end of the file, so a member that
+    runs out of data only shows that the file was cut short when it starts with a complete and valid header
+
+    Output
+    ------
+    (ok, error)
+
+    ok: bool|None
+        True if the last member is complete, False if it was cut short, None if no member start was found in the tail
+    error: str|None
+        a description of the problem
+    """
+    # BGZF files end with an empty block
+    if tail.endswith(bam_check.BGZF_EOF):
+        return(True, None)
+    position = tail.rfind(GZIP_MAGIC)
+    while position >= 0:
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        try:
+            # only the end of the stream matters, so the decompressed data is thrown away a chunk at a time
+            data = tail[position:]
+            while len(data) > 0 and not decompressor.eof:
+                decompressor.decompress(data, 1024 * 1024)
+                data = decompressor.unconsumed_tail
+            if decompressor.eof:
+                # anything after the trailer is another member that started too close to the end to be found
+                if len(decompressor.unused_data) == 0:
+                    return(True, None)
+            elif gzip_header_length(tail[position:]) != None:
+                return(False, 'gzip stream ends before its trailer; the file was cut short')
+        except zlib.error:
+            # the magic bytes were part of the compressed data, not the start of a member
+            pass
+        position = tail.rfind(GZIP_MAGIC, 0, position)
+    return(None, None)
+
+def check_gzip_stream(fin):
+    """
+    Check a whole gzip file by decompressing all of it, for the files whose tail did not show where the last member starts
+
+    Output
+    ------
+    str|None:
+        a description of the problem, or None if every member of the file is complete
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    in_member = False
+    try:
+        chunk = fin.read(FULL_CHECK_CHUNK_SIZE)
+        while len(chunk) > 0:
+            in_member = True
+            decompressor.decompress(chunk)
+            if decompressor.eof:
+                # the next member starts right after the trailer of this one
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                in_member = False
+                if len(chunk) > 0:
+                    continue
+            chunk = fin.read(FULL_CHECK_CHUNK_SIZE)
+    except zlib.error as e:
+        return('gzip data is corrupt ({error})'.format(error = e))
+    if in_member:
+        return('gzip stream ends before its trailer; the file was cut short')
+    return(None)
+
+def check_fastq(path, full = False):
+    """
+    Check a FASTQ file, reading only the start and the end of the file, or all of it with 'full' when the end of the file
+    does not show where the last gzip member starts
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { 'inode': int, 'device': int, 'size': int, 'mtime': int, 'error': str|None, 'warning': str|None }
+    """
+    result = { 'inode': None, 'device': None, 'size': None, 'mtime': None, 'error': None, 'warning': None }
+    try:
+        stat = os.stat(path)
+    except (OSError, IOError) as e:
+        result['error'] = 'does not exist' if isinstance(e, FileNotFoundError) else 'could not be read ({error})'.format(error = e.strerror)
+        return(result)
+    result.update({ 'inode': stat.st_ino, 'device': stat.st_dev, 'size': stat.st_size, 'mtime': stat.st_mtime_ns })
+    if not S_ISREG(stat.st_mode):
+        result['error'] = 'not a file'
+        return(result)
+    if stat.st_size == 0:
+        result['error'] = 'file is empty'
+        return(result)
+    if not path.endswith('.gz'):
+        return(result)
+
+    try:
+        with open(path, 'rb') as fin:
+            head = fin.read(len(GZIP_MAGIC))
+            if head != GZIP_MAGIC:
+                result['error'] = 'not a gzip file'
+                return(result)
+            fin.seek(max(stat.st_size - TAIL_SIZE, 0))
+            ok, error = check_gzip_tail(fin.read())
+            if ok == None and full:
+                fin.seek(0)
+                error = check_gzip_stream(fin)
+                ok = error == None
+    except (OSError, IOError) as e:
+        result['error'] = 'could not be read ({error})'.format(error = e.strerror)
+        return(result)
+    if ok == False:
+        result['error'] = error
+    elif ok == None:
+        result['warning'] = UNCHECKED_TRAILER
+    return(result)
+
+def check_fastqs(paths, cache_file = None, threads = 32, full = False):
+    """
+    Check all the FASTQ files at the same time, skipping the files with a cached result
+
+    Parameters
+    ----------
+    paths: list
+        the paths to the FASTQ files
+    cache_file: str|None
+        path to the cache file for the results, or None to not use a cache
+    threads: int
+        the number of files to check at the same time
+    full: bool
+        whether or not to decompress the whole file when its tail does not show where the last gzip member starts
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { path: result, ... } with the result returned by check_fastq() for each file
+    """
+    paths = sorted(set(paths))
+    cache = bam_check.load_cache(cache_file) if cache_file != None else {}
+
+    def check(path):
+        cached = cache.get(path)
+        # files that were not fully checked before are checked again with 'full'
+        if cached != None and not (full and cached.get('warning') == UNCHECKED_TRAILER):
+            # the stat is cheap next to reading the file, and tells whether the cached result still holds
+            try:
+                stat = os.stat(path)
+                if cached.get('inode') == stat.st_ino and cached.get('size') == stat.st_size and cached.get('mtime') == stat.st_mtime_ns:
+                    return(cached)
+            except (OSError, IOError):
+                pass
+        return(check_fastq(path, full))
+
+    with ThreadPoolExecutor(max_workers = max(threads, 1)) as executor:
+        results = dict(zip(paths, executor.map(check, paths)))
+
+    # only files that were checked in full are cached, so missing and unreadable files are checked again next time
+    if cache_file != None:
+        bam_check.save_cache(cache_file, dict( (path, result) for path, result in results.items() if result['inode'] != None and not (result['error'] or '').startswith('could not be read') ))
+    return(results)
+
+def read_tsv_header(path):
+    """
+    Get the column names from the first line of a TSV file
+    """
+    with open(path) as fin:
+        return(fin.readline().rstrip('\r\n').split('\t'))
+
+def validate_inputs(mapping_file, pairing_file = None, cache_file = None, threads = 32, full = False):
+    """
+    Check the mapping and pairing files, and the FASTQ files in the mapping file
+
+    Output
+    ------
+    (errors, warnings)
+
+    errors: list
+        descriptions of the problems that will make the pipeline fail
+    warnings: list
+        descriptions of the problems that might be intended
+    """
+    errors = []
+    warnings = []
+    missing_columns = [ column for column in MAPPING_COLUMNS if column not in read_tsv_header(mapping_file) ]
+    if len(missing_columns) > 0:
+        errors.append("mapping file is missing columns: {columns}".format(columns = ', '.join(missing_columns)))
+        return(errors, warnings)
+    mapping = calc_time.load_mapping(mapping_file)
+
+    # FASTQ files listed more than once, by path here and by inode below to catch links to the same file
+    fastq_rows = {}
+    for line_number, row in enumerate(mapping, 2):
+        for column in FASTQ_COLUMNS:
+            fastq_rows.setdefault(row[column], []).append('{sample} {column} (line {line_number})'.format(sample = row['SAMPLE'], column = column, line_number = line_number))
+    for path, rows in fastq_rows.items():
+        if len(rows) > 1:
+            errors.append("FASTQ listed more than once: {path}: {rows}".format(path = path, rows = ', '.join(rows)))
+
+    results = check_fastqs(list(fastq_rows.keys()), cache_file, threads, full)
+    inodes = {}
+    for path in sorted(results):
+        result = results[path]
+        if result['error'] != None:
+            errors.append("FASTQ {error}: {path} ({rows})".format(error = result['error'], path = path, rows = ', '.join(fastq_rows[path])))
+        if result['warning'] != None:
+            warnings.append("FASTQ {warning}: {path}".format(warning = result['warning'], path = path))
+        if result['inode'] != None and result.get('device') != None:
+            inodes.setdefault((result['device'], result['inode']), []).append(path)
+    for paths in inodes.values():
+        if len(paths) > 1:
+            errors.append("FASTQ paths are the same file: {paths}".format(paths = ', '.join(paths)))
+
+    if pairing_file == None:
+        return(errors, warnings)
+    missing_columns = [ column for column in PAIRING_COLUMNS if column not in read_tsv_header(pairing_file) ]
+    if len(missing_columns) > 0:
+        errors.append("pairing file is missing columns: {columns}".format(columns = ', '.join(missing_columns)))
+        return(errors, warnings)
+    samples = set([ row['SAMPLE'] for row in mapping ])
+    pairs = calc_time.load_pairs(pairing_file)
+    paired_samples = set()
+    for tumor_id, normal_id in pairs:
+        for column, sample_id in [ ('TUMOR_ID', tumor_id), ('NORMAL_ID', normal_id) ]:
+            paired_samples.add(sample_id)
+            if sample_id not in samples:
+                errors.append("pairing file {column} not in the mapping file: {sample_id}".format(column = column, sample_id = sample_id))
+        if tumor_id == normal_id:
+            errors.append("pair has the same tumor and normal: {sample_id}".format(sample_id = tumor_id))
+    for sample_id in sorted(samples - paired_samples):
+        warnings.append("sample is not in any pair: {sample_id}".format(sample_id = sample_id))
+    return(errors, warnings)
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = 'Check the Tempo mapping and pairing files, and the FASTQ files they list')
+    parser.add_argument('mapping_file', help = 'The Tempo mapping file')
+    parser.add_argument('pairing_file', nargs = '?', default = None, help = 'The Tempo pairing file')
+    parser.add_argument('--cache', default = CACHE_FILE, help = 'The file to cache the results of the FASTQ checks in')
+    parser.add_argument('--no-cache', dest = 'no_cache', action = 'store_true', help = 'Check every FASTQ file and do not save the results')
+    parser.add_argument('--threads', type = int, default = 32, help = 'Number of FASTQ files to check at the same time')
+    parser.add_argument('--full', action = 'store_true', help = 'Decompress the whole gzip file when the end of the file does not show where its last member starts')
+    parser.add_argument('--json-output', dest = 'json_output', default = None, help = 'File to write the errors and warnings to in JSON format')
+    args = parser.parse_args()
+
+    errors, warnings = validate_inputs(args.mapping_file, args.pairing_file, None if args.no_cache else args.cache, args.threads, args.full)
+    if args.json_output != None:
+        calc_time.write_output(args.json_output, json.dumps({ 'errors': errors, 'warnings': warnings }, indent = 4) + '\n')
+    for warning in warnings:
+        print("WARNING: " + warning)
+    for error in errors:
+        print("ERROR: " + error)
+    print("{num_errors} errors, {num_warnings} warnings".format(num_errors = len(errors), num_warnings = len(warnings)))
+    if len(errors) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load the trace files and config.json metadata of all the deployed Tempo projects into a SQLite database,
+so that questions across many runs can be answered with a query instead of parsing hundreds of trace files
+
+Projects are deployed to ROOT/<yyyymm>/<day>/<project>/tempo/<version> (see the 'deploy' recipe in the top level Makefile),
+and each run of a project leaves a trace file in tempo/logs/<timestamp>/trace.txt. Trace files that were already loaded
+and have not changed since are skipped, so the database can be brought up to date by running 'ingest' again
+
+$ ./warehouse.py ingest runs.db /juno/work/ci/trinity/runs
+$ ./warehouse.py query runs.db version --process DoFacets
+"""
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import sqlite3
+import argparse
+import numpy as np
+import calc_time
+import mem_convert
+
+ROOT = '/juno/work/ci/trinity/runs'
+
+# the trace file columns loaded into the 'tasks' table, if the trace file has them
+TASK_COLUMNS = [ 'task_id', 'hash', 'process', 'name', 'tag', 'status', 'exit', 'cpus', 'memory', 'attempt', 'submit', 'start',
+'complete', 'duration', 'realtime', '%cpu', 'peak_rss', 'peak_vmem' ]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    trace_file TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    mtime INTEGER,
+    pipeline_dir TEXT,
+    project TEXT,
+    pipeline TEXT,
+    version TEXT,
+    timestamp TEXT,
+    lsf_jobid TEXT,
+    num_samples INTEGER,
+    num_tasks INTEGER,
+    walltime REAL,
+    ingested REAL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    task_id INTEGER,
+    hash TEXT,
+    process TEXT,
+    tag TEXT,
+    status TEXT,
+    exit TEXT,
+    cpus INTEGER,
+    memory INTEGER,
+    attempt INTEGER,
+    submit INTEGER,
+    start INTEGER,
+    complete INTEGER,
+    duration REAL,
+    realtime REAL,
+    cpu_percent REAL,
+    peak_rss INTEGER,
+    peak_vmem INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_version ON runs(version);
+CREATE INDEX IF NOT EXISTS runs_project ON runs(project);
+CREATE INDEX IF NOT EXISTS runs_num_samples ON runs(num_samples);
+CREATE INDEX IF NOT EXISTS tasks_run_id ON tasks(run_id);
+CREATE INDEX IF NOT EXISTS tasks_process_status ON tasks(process, status);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status);
+"""
+
+# the canned queries, in the format of { name: (description, sql, conditions, filters) }; 'durations' are in seconds and memory in GB
+# 'conditions' are always applied, and 'filters' in the format of { option: column } only when the option is given, so that
+# the WHERE clause only holds the filters in use and SQLite can use the indexes on their columns
+QUERIES = {
+'process': ('Run time and memory per process across all runs', """
+    SELECT tasks.process, COUNT(*) AS tasks, ROUND(AVG(tasks.realtime), 1) AS mean_realtime, ROUND(MAX(tasks.realtime), 1) AS max_realtime,
+    ROUND(AVG(tasks.duration - tasks.realtime), 1) AS mean_queue_wait, ROUND(AVG(tasks.peak_rss) / 1e9, 2) AS mean_peak_rss,
+    ROUND(MAX(tasks.peak_rss) / 1e9, 2) AS max_peak_rss, ROUND(AVG(tasks.cpu_percent), 1) AS mean_cpu_percent
+    FROM tasks JOIN runs ON tasks.run_id = runs.run_id
+    {where}
+    GROUP BY tasks.process ORDER BY mean_realtime DESC
+    """, [ "tasks.status = 'COMPLETED'" ], { 'process': 'tasks.process', 'version': 'runs.version', 'project': 'runs.project' }),
+'version': ('Run time per process per pipeline version', """
+    SELECT runs.version, tasks.process, COUNT(DISTINCT runs.run_id) AS runs, COUNT(*) AS tasks, ROUND(AVG(tasks.realtime), 1) AS mean_realtime,
+    ROUND(AVG(tasks.peak_rss) / 1e9, 2) AS mean_peak_rss, ROUND(SUM(tasks.status = 'FAILED') * 1.0 / COUNT(*), 3) AS failed_fraction
+    FROM tasks JOIN runs ON tasks.run_id = runs.run_id
+    {where}
+    GROUP BY runs.version, tasks.process ORDER BY runs.version, tasks.process
+    """, [ "tasks.status IN ('COMPLETED', 'FAILED')" ], { 'process': 'tasks.process', 'version': 'runs.version', 'project': 'runs.project' }),
+'samples': ('Wall time and tasks of the runs by the number of samples in the mapping file', """
+    SELECT runs.num_samples, COUNT(*) AS runs, ROUND(AVG(runs.walltime) / 3600, 2) AS mean_walltime_hours,
+    ROUND(MAX(runs.walltime) / 3600, 2) AS max_walltime_hours, ROUND(AVG(runs.num_tasks), 0) AS mean_tasks
+    FROM runs
+    {where}
+    GROUP BY runs.num_samples ORDER BY runs.num_samples
+    """, [], { 'version': 'runs.version', 'project': 'runs.project' }),
+'runs': ('All the runs that were loaded', """
+    SELECT runs.project, runs.version, runs.timestamp, runs.lsf_jobid, runs.num_samples, runs.num_tasks,
+    ROUND(runs.walltime / 3600, 2) AS walltime_hours, runs.trace_file
+    FROM runs
+    {where}
+    ORDER BY runs.timestamp
+    """, [], { 'version': 'runs.version', 'project': 'runs.project' })
+}
+
+def build_query(name, options):
+    """
+    Build the SQL of a canned query with only the filters of the given options
+
+    Parameters
+    ----------
+    name: str
+        the name of the query, see QUERIES
+    options: dict
+        the filter values in the format of { option: value|None, ... }, where None is no filter
+
+    Output
+    ------
+    (sql, parameters)
+    """
+    description, sql, conditions, filters = QUERIES[name]
+    parameters = dict( (option, value) for option, value in options.items() if option in filters and value != None )
+    clauses = conditions + [ '{column} = :{option}'.format(column = filters[option], option = option) for option in sorted(parameters.keys()) ]
+    where = 'WHERE ' + ' AND '.join(clauses) if len(clauses) > 0 else ''
+    return(sql.format(where = where), parameters)
+
+def connect(db_file):
+    """
+    Open the database and create the tables and indexes if they are not there yet
+    """
+    connection = sqlite3.connect(db_file)
+    connection.executescript(SCHEMA)
+    return(connection)
+
+def find_pipeline_dirs(root):
+    """
+    Find the Tempo pipeline dirs of all the projects deployed under the root dir, i.e. ROOT/<yyyymm>/<day>/<project>/tempo/<version>/tempo
+    """
+    return(sorted(glob.glob(os.path.join(root, '*', '*', '*', 'tempo', '*', 'tempo'))))
+
+def read_first_line(path):
+    """
+    Get the first line of a file, or None if the file is missing
+    """
+    if not os.path.exists(path):
+        return(None)
+    with open(path) as fin:
+        return(fin.readline().strip())
+
+def pipeline_metadata(pipeline_dir):
+    """
+    Get the metadata of the runs in a pipeline dir from its config.json, falling back to the .project and .version files
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { 'project': str, 'pipeline': str, 'version': str, 'log_dir': str, 'lsf_jobid': str, 'mapping_tsv': str }
+    """
+    config = {}
+    config_json = os.path.join(pipeline_dir, 'config.json')
+    if os.path.exists(config_json):
+        with open(config_json) as fin:
+            config = json.load(fin)
+    mapping_tsv = config.get('mapping_tsv') or 'mapping.tsv'
+    metadata = {
+    'project': config.get('project') or read_first_line(os.path.join(pipeline_dir, '..', '.project')),
+    'pipeline': config.get('pipeline') or 'tempo',
+    'version': config.get('version') or read_first_line(os.path.join(pipeline_dir, '.version')),
+    'log_dir': config.get('log_dir'),
+    'lsf_jobid': config.get('lsf_jobid'),
+    'mapping_tsv': mapping_tsv if os.path.isabs(mapping_tsv) else os.path.join(pipeline_dir, mapping_tsv)
+    }
+    return(metadata)
+
+def load_task_rows(trace_file, run_id):
+    """
+    Load the rows of a trace file as rows for the 'tasks' table
+
+    Output
+    ------
+    (rows, walltime)
+
+    rows: list
+        a list of tuples with the values of the 'tasks' table columns
+    walltime: float|None
+        the seconds from the first submit to the last complete of the tasks that were not cached
+    """
+    header = calc_time.read_trace_header(trace_file)
+    columns = [ column for column in TASK_COLUMNS if column in header ]
+    # the trace files belong to other projects, so do not save trace caches next to them
+    trace = calc_time.load_trace(trace_file, columns, cache = False)
+    num_rows = calc_time.trace_rows(trace)
+    parsed = mem_convert.parse_trace_columns(trace)
+    if 'process' not in trace and 'name' in trace:
+        trace['process'] = calc_time.get_process_names(None, trace)
+
+    def strings(column):
+        if column not in trace:
+            return([ None ] * num_rows)
+        return([ value if value != '-' else None for value in trace[column].tolist() ])
+
+    def integers(column):
+        values = strings(column)
+        return([ int(value) if value != None and value.isdigit() else None for value in values ])
+
+    def numbers(column, scale = 1):
+        if column not in parsed:
+            return([ None ] * num_rows)
+        values = parsed[column]
+        if scale != 1:
+            values = values.astype(np.float64) / scale
+        return(values.tolist())
+
+    rows = list(zip([ run_id ] * num_rows, integers('task_id'), strings('hash'), strings('process'), strings('tag'), strings('status'),
+        strings('exit'), integers('cpus'), numbers('memory'), integers('attempt'), numbers('submit'), numbers('start'), numbers('complete'),
+        numbers('duration', 1000), numbers('realtime', 1000), numbers('%cpu'), numbers('peak_rss'), numbers('peak_vmem')))
+
+    walltime = None
+    if 'submit' in parsed and 'complete' in parsed and 'status' in trace:
+        current = trace['status'] != 'CACHED'
+        submit = parsed['submit'][current]
+        complete = parsed['complete'][current]
+        if submit.count() > 0 and complete.count() > 0:
+            walltime = (complete.max() - submit.min()) / 1000000.0
+    return(rows, walltime)
+
+def ingest_trace(connection, trace_file, metadata, num_samples):
+    """
+    Load a trace file into the database, unless it was already loaded and has not changed since
+
+    Output
+    ------
+    bool:
+        whether or not the trace file was loaded
+    """
+    trace_file = os.path.realpath(trace_file)
+    stat = os.stat(trace_file)
+    existing = connection.execute('SELECT run_id, size, mtime FROM runs WHERE trace_file = ?', (trace_file, )).fetchone()
+    if existing != None and existing[1] == stat.st_size and existing[2] == stat.st_mtime_ns:
+        return(False)
+
+    log_dir = os.path.dirname(trace_file)
+    # the config.json only has the LSF job of the latest run of the pipeline dir
+    is_latest_run = metadata['log_dir'] != None and os.path.realpath(metadata['log_dir']) == log_dir
+    with connection:
+        if existing != None:
+            connection.execute('DELETE FROM tasks WHERE run_id = ?', (existing[0], ))
+            connection.execute('DELETE FROM runs WHERE run_id = ?', (existing[0], ))
+        cursor = connection.execute('INSERT INTO runs (trace_file, size, mtime, pipeline_dir, project, pipeline, version, timestamp, lsf_jobid, num_samples, ingested) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+            trace_file, stat.st_size, stat.st_mtime_ns, os.path.dirname(os.path.dirname(log_dir)), metadata['project'], metadata['pipeline'],
+            metadata['version'], os.path.basename(log_dir), metadata['lsf_jobid'] if is_latest_run else None, num_samples, time.time()))
+        run_id = cursor.lastrowid
+        rows, walltime = load_task_rows(trace_file, run_id)
+        connection.executemany('INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        connection.execute('UPDATE runs SET num_tasks = ?, walltime = ? WHERE run_id = ?', (len(rows), walltime, run_id))
+    return(True)
+
+def ingest(db_file, roots = None, pipeline_dirs = None):
+    """
+    Load the trace files of all the runs of the pipeline dirs under the root dirs into the database
+
+    Parameters
+    ----------
+    db_file: str
+        path to the SQLite database file
+    roots: list|None
+        the root dirs the projects are deployed to
+    pipeline_dirs: list|None
+        more pipeline dirs to load, outside of the root dirs
+    """
+    connection = connect(db_file)
+    all_pipeline_dirs = []
+    for root in roots or []:
+        all_pipeline_dirs.extend(find_pipeline_dirs(root))
+    all_pipeline_dirs.extend(pipeline_dirs or [])
+
+    num_loaded = 0
+    num_skipped = 0
+    for pipeline_dir in all_pipeline_dirs:
+        # a half-written or broken config.json in one project must not stop the other projects from loading
+        try:
+            metadata = pipeline_metadata(pipeline_dir)
+        except (OSError, IOError, ValueError) as e:
+            sys.stderr.write("could not load the config of {pipeline_dir}, skipping it: {error}\n".format(pipeline_dir = pipeline_dir, error = e))
+            continue
+        num_samples = None
+        if os.path.exists(metadata['mapping_tsv']):
+            try:
+                num_samples = len(calc_time.load_samples(metadata['mapping_tsv']))
+            except (OSError, IOError, KeyError, ValueError, csv.Error) as e:
+                sys.stderr.write("could not load {mapping_tsv}, loading the runs without the number of samples: {error}\n".format(mapping_tsv = metadata['mapping_tsv'], error = e))
+        for trace_file in sorted(glob.glob(os.path.join(pipeline_dir, 'logs', '*', 'trace.txt'))):
+            try:
+                loaded = ingest_trace(connection, trace_file, metadata, num_samples)
+            except (OSError, IOError, KeyError, ValueError) as e:
+                sys.stderr.write("could not load {trace_file}: {error}\n".format(trace_file = trace_file, error = e))
+                continue
+            if loaded:
+                num_loaded += 1
+            else:
+                num_skipped += 1
+    connection.close()
+    return(num_loaded, num_skipped)
+
+def query(db_file, name, process = None, version = None, project = None):
+    """
+    Run one of the canned queries
+
+    Output
+    ------
+    (columns, rows)
+
+    columns: list
+        the names of the columns
+    rows: list
+        a list of tuples with the values of each row
+    """
+    connection = connect(db_file)
+    sql, parameters = build_query(name, { 'process': process, 'version': version, 'project': project })
+    cursor = connection.execute(sql, parameters)
+    columns = [ description[0] for description in cursor.description ]
+    rows = cursor.fetchall()
+    connection.close()
+    return(columns, rows)
+
+def warehouse_ingest(**kwargs):
+    """
+    Load the runs of all the deployed projects into the database
+
+    $ ./warehouse.py ingest runs.db /juno/work/ci/trinity/runs
+    """
+    db_file = kwargs.pop('db_file')
+    roots = kwargs.pop('roots')
+    pipeline_dirs = kwargs.pop('pipeline_dirs')
+    num_loaded, num_skipped = ingest(db_file, roots if len(roots) > 0 or pipeline_dirs else [ ROOT ], pipeline_dirs)
+    print("Loaded {num_loaded} trace files, skipped {num_skipped} unchanged trace files".format(num_loaded = num_loaded, num_skipped = num_skipped))
+
+def warehouse_query(**kwargs):
+    """
+    Print out the results of a canned query in TSV format
+
+    $ ./warehouse.py query runs.db process --version 1.3.1-0-gaea6316
+    """
+    db_file = kwargs.pop('db_file')
+    name = kwargs.pop('name')
+    columns, rows = query(db_file, name, kwargs.pop('process'), kwargs.pop('version'), kwargs.pop('project'))
+    lines = [ '\t'.join(columns) ]
+    for row in rows:
+        lines.append('\t'.join([ str(value) if value != None else '-' for value in row ]))
+    calc_time.write_output(kwargs.pop('output'), '\n'.join(lines) + '\n')
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = 'Load the runs of all the deployed Tempo projects into a SQLite database and query them')
+    subparsers = parser.add_subparsers(help ='Sub-commands available')
+
+    # subparser for loading the runs
+    warehouse_ingest_parser = subparsers.add_parser('ingest', help = 'Load the new and changed trace files into the database')
+    warehouse_ingest_parser.add_argument('db_file', help = 'The SQLite database file')
+    warehouse_ingest_parser.add_argument('roots', nargs = '*', help = 'The root dirs the projects are deployed to (default: {root})'.format(root = ROOT))
+    warehouse_ingest_parser.add_argument('--pipeline-dir', dest = 'pipeline_dirs', action = 'append', default = None, help = 'A pipeline dir to load outside of the root dirs; can be given several times')
+    warehouse_ingest_parser.set_defaults(func = warehouse_ingest)
+
+    # subparser for the canned queries
+    warehouse_query_parser = subparsers.add_parser('query', help = 'Run a canned query: ' + '; '.join([ '{name}: {description}'.format(name = name, description = description) for name, (description, sql, conditions, filters) in QUERIES.items() ]))
+    warehouse_query_parser.add_argument('db_file', help = 'The SQLite database file')
+    warehouse_query_parser.add_argument('name', choices = list(QUERIES.keys()), help = 'The query to run')
+    warehouse_query_parser.add_argument('--process', default = None, help = 'Only include this process')
+    warehouse_query_parser.add_argument('--version', default = None, help = 'Only include runs of this pipeline version')
+    warehouse_query_parser.add_argument('--project', default = None, help = 'Only include runs of this project')
+    warehouse_query_parser.add_argument('--output', default = '-', help = 'File to write the results to')
+    warehouse_query_parser.set_defaults(func = warehouse_query)
+
+    args = parser.parse_args()
+    args.func(**vars(args))
+
+if __name__ == '__main__':
+    main()
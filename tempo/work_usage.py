@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Calculate the disk usage of the Nextflow work dir per process, per sample, and per status of the tasks,
+by matching each task dir 'work/xx/hash...' to its row in the trace files by the 'hash' column
+
+The task dirs are walked in parallel with a pool of threads, without following symlinks such as the staged input files
+and published files in 'output/'. The usage of each finished task dir (with a '.exitcode' file) is saved to a cache file
+along with the mtime of every dir inside it, so that later scans only walk the task dirs that changed. The dirs of the
+tasks that are still running are always walked, since their files can grow without changing the mtime of any dir
+
+Task dirs that are not in any of the trace files are reported as '(not in trace)'; along with the dirs of FAILED and
+ABORTED tasks, these are usually safe to remove
+
+$ ./work_usage.py work/ logs/*/trace.txt --mapping-file mapping.tsv
+"""
+import os
+import sys
+import json
+import argparse
+from stat import S_ISDIR
+from concurrent.futures import ThreadPoolExecutor
+import calc_time
+
+CACHE_FILE = '.work_usage.cache.json'
+
+# the name used for the task dirs that do not match any row in the trace files
+NOT_IN_TRACE = '(not in trace)'
+
+def find_task_dirs(work_dir):
+    """
+    Find all the task dirs in the Nextflow work dir, in the format of 'work/xx/hash...'
+
+    Output
+    ------
+    list:
+        a list of the task dir paths relative to the work dir, e.g. [ '4f/3a2c1e...', ... ]
+    """
+    task_dirs = []
+    with os.scandir(work_dir) as prefix_entries:
+        for prefix_entry in prefix_entries:
+            if len(prefix_entry.name) != 2 or not prefix_entry.is_dir(follow_symlinks = False):
+                continue
+            with os.scandir(prefix_entry.path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks = False):
+                        task_dirs.append(prefix_entry.name + '/' + entry.name)
+    return(task_dirs)
+
+def dir_usage(task_dir):
+    """
+    Get the disk usage of a dir and everything in it, without following symlinks
+    Each file is only counted once, even if it is hard linked more than once in the dir
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { 'bytes': int, 'files': int, 'finished': bool, 'dirs': { path: mtime, ... } } where
+        'bytes' is the allocated size of the files and dirs, the same as 'du', 'finished' is whether the task had already
+        written its '.exitcode' file, and 'dirs' holds the mtime of every dir, relative to 'task_dir'
+    """
+    usage = { 'bytes': 0, 'files': 0, 'finished': False, 'dirs': {} }
+    seen = set()
+    stack = [ '' ]
+    while len(stack) > 0:
+        relative_path = stack.pop()
+        path = os.path.join(task_dir, relative_path) if relative_path != '' else task_dir
+        try:
+            stat = os.lstat(path)
+            usage['dirs'][relative_path] = stat.st_mtime_ns
+            usage['bytes'] += stat.st_blocks * 512
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if relative_path == '' and entry.name == '.exitcode':
+                        usage['finished'] = True
+                    stat = entry.stat(follow_symlinks = False)
+                    if S_ISDIR(stat.st_mode):
+                        stack.append(os.path.join(relative_path, entry.name))
+                        continue
+                    if stat.st_nlink > 1:
+                        if (stat.st_dev, stat.st_ino) in seen:
+                            continue
+                        seen.add((stat.st_dev, stat.st_ino))
+                    usage['bytes'] += stat.st_blocks * 512
+                    usage['files'] += 1
+        except OSError:
+            # the dir was removed or cannot be read while walking
+            continue
+    return(usage)
+
+def dir_changed(task_dir, cached):
+    """
+    Check whether any of the dirs in a task dir changed since its usage was cached
+    """
+    for relative_path, mtime in cached['dirs'].items():
+        path = os.path.join(task_dir, relative_path) if relative_path != '' else task_dir
+        try:
+            if os.lstat(path).st_mtime_ns != mtime:
+                return(True)
+        except OSError:
+            return(True)
+    return(False)
+
+def scan_work_dir(work_dir, cache_file = None, threads = 16):
+    """
+    Get the disk usage of every task dir in the Nextflow work dir
+
+    Parameters
+    ----------
+    work_dir: str
+        path to the Nextflow work dir
+    cache_file: str|None
+        path to the cache file for the usage of each task dir, or None to not use a cache
+    threads: int
+        the number of task dirs to walk at the same time
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { task_dir: { 'bytes': int, 'files': int, 'finished': bool, 'dirs': { path: mtime, ... } }, ... }
+        see dir_usage()
+    """
+    cache = {}
+    if cache_file != None and os.path.exists(cache_file):
+        try:
+            with open(cache_file) as fin:
+                cache = json.load(fin)
+        except (OSError, IOError, ValueError):
+            cache = {}
+
+    def task_usage(task_dir):
+        path = os.path.join(work_dir, task_dir)
+        cached = cache.get(task_dir)
+        # only finished tasks are cached, but caches from before the 'finished' flag was added have running tasks as well
+        if cached != None and cached.get('finished') and not dir_changed(path, cached):
+            return(cached)
+        return(dir_usage(path))
+
+    task_dirs = find_task_dirs(work_dir)
+    with ThreadPoolExecutor(max_workers = max(threads, 1)) as executor:
+        usage = dict(zip(task_dirs, executor.map(task_usage, task_dirs)))
+
+    if cache_file != None:
+        temp_file = '{path}.{pid}.tmp'.format(path = cache_file, pid = os.getpid())
+        try:
+            with open(temp_file, 'w') as fout:
+                json.dump(dict( (task_dir, task) for task_dir, task in usage.items() if task['finished'] ), fout)
+            os.rename(temp_file, cache_file)
+        except (OSError, IOError):
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+    return(usage)
+
+def load_trace_tasks(trace_files):
+    """
+    Get the process, tag and status of each task from the trace files, by the 'hash' of the task
+
+    When a task is in more than one trace file, the row from the run that actually executed it is kept over 'CACHED' rows,
+    and rows from later runs are kept over rows from earlier runs, the same as calc_time.load_runs_trace()
+
+    Parameters
+    ----------
+    trace_files: list
+        paths to the Nextflow trace.txt files, oldest run first
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { hash: (process, tag, status), ... }, where 'hash' is in the format of 'xx/yyyyyy'
+    """
+    tasks = {}
+    for trace_file in trace_files:
+        header = calc_time.read_trace_header(trace_file)
+        columns = [ 'hash', 'status', 'tag' ] + [ 'process' if 'process' in header else 'name' ]
+        trace = calc_time.load_trace(trace_file, columns)
+        processes = calc_time.get_process_names(trace_file, trace)
+        for task_hash, process, tag, status in zip(trace['hash'], processes, trace['tag'], trace['status']):
+            if task_hash == '-':
+                continue
+            if status == 'CACHED' and task_hash in tasks and tasks[task_hash][2] != 'CACHED':
+                continue
+            tasks[task_hash] = (process, tag, status)
+    return(tasks)
+
+def calculate_work_usage(usage, tasks, sample_ids = None):
+    """
+    Total the disk usage of the task dirs per process, per sample, and per status
+
+    The usage of a task with more than one sample in its tag is split evenly between the samples
+
+    Parameters
+    ----------
+    usage: dict
+        the usage of each task dir returned by scan_work_dir()
+    tasks: dict
+        the process, tag and status of each task returned by load_trace_tasks()
+    sample_ids: list|None
+        a list of sample ID's to total the usage for
+
+    Output
+    ------
+    dict:
+        a dictionary in the format of { 'process': { process: [ bytes, dirs ], ... }, 'sample': { ... }, 'status': { ... },
+        'total': [ bytes, dirs ] }
+    """
+    if sample_ids == None:
+        sample_ids = []
+    sample_index = calc_time.build_sample_index(sample_ids)
+    # the hashes in the trace file are cut short, e.g. 'xx/yyyyyy'
+    hash_length = max([ len(task_hash) for task_hash in tasks ] or [ 0 ])
+
+    totals = { 'process': {}, 'sample': {}, 'status': {}, 'total': [ 0, 0 ] }
+    def add(group, key, num_bytes, num_dirs = 1):
+        if key not in totals[group]:
+            totals[group][key] = [ 0, 0 ]
+        totals[group][key][0] += num_bytes
+        totals[group][key][1] += num_dirs
+
+    for task_dir, task_usage in usage.items():
+        num_bytes = task_usage['bytes']
+        totals['total'][0] += num_bytes
+        totals['total'][1] += 1
+        task = tasks.get(task_dir[:hash_length])
+        if task == None:
+            add('process', NOT_IN_TRACE, num_bytes)
+            add('status', NOT_IN_TRACE, num_bytes)
+            continue
+        process, tag, status = task
+        add('process', process, num_bytes)
+        add('status', status, num_bytes)
+        if len(sample_ids) > 0:
+            task_samples = calc_time.tag_sample_ids(tag, sample_index)
+            for sample_id in task_samples:
+                add('sample', sample_id, num_bytes // len(task_samples))
+    return(totals)
+
+def format_size(num_bytes):
+    """
+    Format a number of bytes as a human readable size, e.g. '1.5 TB'
+    """
+    size = float(num_bytes)
+    for unit in [ 'B', 'KB', 'MB', 'GB', 'TB' ]:
+        if abs(size) < 1000 or unit == 'TB':
+            break
+        size /= 1000
+    return("{size:.1f} {unit}".format(size = size, unit = unit) if unit != 'B' else "{size} B".format(size = int(size)))
+
+def format_work_usage(totals, top = 20):
+    """
+    Create a pretty printed message about the disk usage per process, per sample, and per status, largest first
+    """
+    message = "Total: {size} ({num_dirs} task dirs)\n".format(size = format_size(totals['total'][0]), num_dirs = totals['total'][1])
+    for group in [ 'status', 'process', 'sample' ]:
+        if len(totals[group]) == 0:
+            continue
+        message += "\nPer {group}:\n".format(group = group)
+        for key, (num_bytes, num_dirs) in sorted(totals[group].items(), key = lambda x: x[1][0], reverse = True)[:top]:
+            message += "{key}: {size} ({num_dirs} task dirs)\n".format(key = key, size = format_size(num_bytes), num_dirs = num_dirs)
+    return(message)
+
+def main():
+    """
+    Main control function for the script when run from CLI
+    """
+    parser = argparse.ArgumentParser(description = 'Calculate the disk usage of the Nextflow work dir per process, sample, and status')
+    parser.add_argument('work_dir', help = 'The Nextflow work dir')
+    parser.add_argument('trace_files', nargs = '+', help = 'The Nextflow trace files of the runs that used the work dir, oldest first')
+    parser.add_argument('--mapping-file', dest = 'mapping_file', default = None, help = 'The Tempo mapping file, to total the usage per sample')
+    parser.add_argument('--cache', default = None, help = 'The file to cache the usage of each task dir in (default: {cache_file} in the work dir)'.format(cache_file = CACHE_FILE))
+    parser.add_argument('--no-cache', dest = 'no_cache', action = 'store_true', help = 'Walk every task dir and do not save the results')
+    parser.add_argument('--threads', type = int, default = 16, help = 'Number of task dirs to walk at the same time')
+    parser.add_argument('--top', type = int, default = 20, help = 'Number of the largest groups to print')
+    parser.add_argument('--json-output', dest = 'json_output', default = None, help = 'File to write the totals to in JSON format')
+    args = parser.parse_args()
+
+    cache_file = None
+    if not args.no_cache:
+        cache_file = args.cache if args.cache != None else os.path.join(args.work_dir, CACHE_FILE)
+    usage = scan_work_dir(args.work_dir, cache_file, args.threads)
+    tasks = load_trace_tasks(args.trace_files)
+    sample_ids = calc_time.load_samples(args.mapping_file) if args.mapping_file != None else []
+    totals = calculate_work_usage(usage, tasks, sample_ids)
+
+    if args.json_output != None:
+        calc_time.write_output(args.json_output, json.dumps(totals, indent = 4) + '\n')
+    sys.stdout.write(format_work_usage(totals, args.top))
+
+if __name__ == '__main__':
+    main()